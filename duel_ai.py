@@ -0,0 +1,90 @@
+# NPC aim solving.
+# Instead of drifting at random, the NPC can aim like a marksman: for the
+# current terrain and player position every aim angle it could pick is flown
+# with the batch engine (so gravity, hills and hitboxes are exactly as in the
+# game) and the one in the middle of the widest run of head shots is kept,
+# falling back to body shots and then to the shot landing closest to the
+# player. The answer only changes with the terrain, the duelists' positions,
+# the weapon and the physics (wind included), so it is cached and a round
+# costs one lookup.
+#
+# Difficulty levels add a controlled aim error on top of the solution.
+import random
+from collections import OrderedDict
+
+import numpy as np
+
+from duel_batch import AIM_ANGLES, sweep_aim_angles
+from duel_core import ZONE_BODY, ZONE_HEAD
+
+# Standard deviation of the NPC's aim error per difficulty, in degrees
+DIFFICULTY_AIM_ERROR = {
+    "easy": 4.0,
+    "normal": 1.5,
+    "hard": 0.5,
+    "deadly": 0.0,
+}
+DIFFICULTY_LEVELS = tuple(DIFFICULTY_AIM_ERROR)
+
+def widest_run_center(indices):
+    # Middle of the longest run of consecutive values in a sorted index array
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    runs = np.split(indices, breaks)
+    longest = max(runs, key=len)
+    return int(longest[len(longest) // 2])
+
+class AimSolver:
+    def __init__(self, max_cached=32):
+        self.max_cached = max_cached
+        self.solutions = OrderedDict()  # LRU of (shooter, target, terrain, physics) -> angle
+
+    def best_angle(self, shooter, target, terrain, ballistics=None, wind=0.0, max_frames=10000):
+        # max_frames cuts flights short (see sweep_aim_angles), for callers
+        # that know no shot can reach target any later
+        key = (shooter.is_player, shooter.x, shooter.y, target.x, target.y, terrain.width, tuple(terrain.hills),
+               shooter.weapon, ballistics, wind, max_frames)
+        angle = self.solutions.get(key)
+        if angle is None:
+            angle = self.solve(shooter, target, terrain, ballistics, wind, max_frames)
+            self.solutions[key] = angle
+            if len(self.solutions) > self.max_cached:
+                self.solutions.popitem(last=False)
+        else:
+            self.solutions.move_to_end(key)
+        return angle
+
+    def solve(self, shooter, target, terrain, ballistics=None, wind=0.0, max_frames=10000):
+        results = sweep_aim_angles(shooter, target, terrain, ballistics=ballistics, wind=wind, max_frames=max_frames)
+        return best_aim_angle(results, target)
+
+def best_aim_angle(results, target):
+    # Pick from the shot results of every aim angle (see sweep_aim_angles)
+    for zone in (ZONE_HEAD, ZONE_BODY):
+        hits = np.flatnonzero(results.zone == zone)
+        if hits.size:
+            return float(AIM_ANGLES[widest_run_center(hits)])
+    # Nothing gets through: land as close to the target as possible
+    miss_distance = np.abs(results.impact_x - (target.x + target.width / 2))
+    return float(AIM_ANGLES[int(np.argmin(miss_distance))])
+
+# Chooses the NPC's aim for every round of a DuelSimulation (see its npc_brain)
+class NpcBrain:
+    def __init__(self, difficulty="normal", solver=None):
+        if difficulty not in DIFFICULTY_AIM_ERROR:
+            raise ValueError(f"unknown difficulty {difficulty!r}")
+        self.difficulty = difficulty
+        self.aim_error = DIFFICULTY_AIM_ERROR[difficulty]
+        self.solver = solver or AimSolver()
+
+    def choose_aim(self, sim, rng=None):
+        # Aim angle for the round about to start, error included. The error is
+        # drawn from the simulation's random source so replays stay exact.
+        rng = rng or sim.rng or random
+        angle = self.solver.best_angle(sim.npc, sim.player, sim.terrain, sim.ballistics, sim.wind)
+        return add_aim_error(angle, self.aim_error, rng)
+
+def add_aim_error(angle, aim_error, rng):
+    # Solved angle with a normally distributed error, as a selectable aim angle
+    if aim_error:
+        angle += rng.gauss(0, aim_error)
+    return round(max(0.0, min(angle, 60.0)), 1)
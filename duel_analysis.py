@@ -0,0 +1,204 @@
+# Hit-probability maps per terrain.
+# For a terrain, every player aim angle is paired with every NPC aim angle to
+# find who hits whom and where. Bullets don't interact, so each side's shots
+# are flown once per angle with the batch engine (which follows the
+# Bullet.update/Bullet.check_hit rules exactly; --check re-flies every shot
+# through Player.shoot and Bullet to confirm it) and then combined.
+#
+# A Monte Carlo pass models the NPC's random aim drift during the aiming phase
+# (the random.choice([-1, 0, 1]) walk in DuelSimulation.step) to give, for
+# every player angle, the chance of being hit and the expected damage.
+#
+# Terrains are spread over all CPU cores and the maps are written to one
+# compressed .npz file. With --catalog the hit zones come from the terrain
+# catalog (see duel_catalog), which keeps them between runs:
+#
+#   python duel_analysis.py --terrains 500 --output hitmap.npz
+#   python duel_analysis.py --terrains 500 --catalog terrain_catalog
+#   python duel_analysis.py --terrains 200 --min-hill-height 60 --max-hill-height 200
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import duel_core
+from duel_batch import AIM_ANGLES, ZONE_DAMAGE, sweep_aim_angles
+from duel_catalog import TerrainCatalog
+from duel_core import FPS, NPC_AIM_INTERVAL_MS, ZONE_MISS, DuelSimulation
+
+# Aim angles in tenths of a degree, as indices into AIM_ANGLES
+ANGLE_COUNT = len(AIM_ANGLES)
+
+# The NPC changes its aim once the clock has moved more than
+# NPC_AIM_INTERVAL_MS past its last change, i.e. every this many frames
+NPC_AIM_FRAMES = NPC_AIM_INTERVAL_MS * FPS // 1000 + 1
+
+# Most hills a generated terrain can have (left, right and an optional middle)
+MAX_HILLS = 3
+
+def terrain_duel(seed):
+    # Terrain and duelists of the first game a DuelSimulation seeded with seed plays
+    sim = DuelSimulation(random.Random(seed))
+    return sim.terrain, sim.player, sim.npc
+
+def shot_zones(terrain, shooter, target):
+    # Hit zone on target for every aim angle of shooter
+    results = sweep_aim_angles(shooter, target, terrain)
+    return results.zone.astype(np.int8)
+
+def scalar_shot_zones(terrain, shooter, target):
+    # Same as shot_zones, one real Bullet at a time through Player.shoot and
+    # Bullet.check_hit, as a cross-check of the batch engine
+    zones = np.zeros(ANGLE_COUNT, dtype=np.int8)
+    health = target.health
+    for index, angle in enumerate(AIM_ANGLES.tolist()):
+        shooter.aim_angle = shooter.current_arm_angle = angle
+        shooter.has_shot = False
+        shooter.shoot()
+        bullet = shooter.bullet
+        while bullet.active:
+            bullet.update(terrain)
+            if bullet.check_hit(target):
+                zones[index] = bullet.hit_zone
+        target.health = health
+    shooter.bullet = None
+    shooter.has_shot = False
+    return zones
+
+def npc_angle_distribution(rng, samples, start_range, aim_seconds):
+    # Probability of the NPC ending the aiming phase at each aim angle.
+    # The NPC starts at a random whole angle and drifts 0.1 degrees per aim
+    # change, re-rolling its drift direction with probability 0.3 each time.
+    start = rng.integers(start_range[0], start_range[1] + 1, samples) * 10
+    frames = (rng.uniform(aim_seconds[0], aim_seconds[1], samples) * FPS).astype(np.int64)
+    changes = frames // NPC_AIM_FRAMES
+
+    angle = start
+    drift = rng.integers(-1, 2, samples)
+    for change in range(int(changes.max(initial=0))):
+        active = changes > change
+        reroll = active & (rng.random(samples) < 0.3)
+        drift = np.where(reroll, rng.integers(-1, 2, samples), drift)
+        angle = np.where(active, np.clip(angle + drift, 0, ANGLE_COUNT - 1), angle)
+    return np.bincount(angle, minlength=ANGLE_COUNT) / samples
+
+def analyze_terrain(seed, samples=20000, npc_start=(5, 30), aim_seconds=(1.0, 10.0), check=False, catalog=None):
+    terrain, player, npc = terrain_duel(seed)
+    if catalog:
+        # Built and stored first if the catalog doesn't have the terrain yet
+        entry = TerrainCatalog(catalog).get(seed)
+        player_zone = np.array(entry.zone[0])
+        npc_zone = np.array(entry.zone[1])
+    else:
+        player_zone = shot_zones(terrain, player, npc)  # Zone on the NPC per player angle
+        npc_zone = shot_zones(terrain, npc, player)  # Zone on the player per NPC angle
+    if check:
+        if not np.array_equal(player_zone, scalar_shot_zones(terrain, player, npc)) or \
+                not np.array_equal(npc_zone, scalar_shot_zones(terrain, npc, player)):
+            raise RuntimeError(f"batch and scalar shots disagree on terrain {seed}")
+
+    # Outcome of every (player angle, NPC angle) pair as player_zone * 3 + npc_zone
+    pair_outcome = (player_zone[:, None] * 3 + npc_zone[None, :]).astype(np.uint8)
+
+    # Chances against the NPC's random aim, per player angle
+    rng = np.random.default_rng(seed)
+    npc_angle_probability = npc_angle_distribution(rng, samples, npc_start, aim_seconds)
+    npc_hit_probability = npc_angle_probability[npc_zone != ZONE_MISS].sum()
+    expected_damage_taken = (npc_angle_probability * ZONE_DAMAGE[npc_zone]).sum()
+
+    hills = np.zeros((MAX_HILLS, 4), dtype=np.int16)
+    hills[:len(terrain.hills)] = terrain.hills
+    return {
+        "seed": seed,
+        "hills": hills,
+        "hill_count": len(terrain.hills),
+        "player_zone": player_zone,
+        "npc_zone": npc_zone,
+        "pair_outcome": pair_outcome,
+        "npc_angle_probability": npc_angle_probability.astype(np.float32),
+        "expected_damage_dealt": ZONE_DAMAGE[player_zone].astype(np.float32),
+        "expected_damage_taken": np.float32(expected_damage_taken),
+        "npc_hit_probability": np.float32(npc_hit_probability),
+    }
+
+def set_hill_heights(min_height, max_height):
+    # Runs in every worker so terrain generation uses the heights being tuned
+    if min_height is not None:
+        duel_core.MIN_HILL_HEIGHT = min_height
+    if max_height is not None:
+        duel_core.MAX_HILL_HEIGHT = max_height
+
+def analyze_terrains(seeds, workers=None, samples=20000, npc_start=(5, 30), aim_seconds=(1.0, 10.0),
+                     check=False, min_hill_height=None, max_hill_height=None, catalog=None):
+    # Analyze every terrain on a process pool and stack the results into arrays
+    workers = workers or os.cpu_count() or 1
+    seeds = list(seeds)
+    jobs = [(seed, samples, npc_start, aim_seconds, check, catalog) for seed in seeds]
+    with ProcessPoolExecutor(workers, initializer=set_hill_heights,
+                             initargs=(min_hill_height, max_hill_height)) as pool:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        terrains = list(pool.map(analyze_job, jobs, chunksize=chunksize))
+
+    maps = {key: np.stack([terrain[key] for terrain in terrains]) for key in terrains[0]}
+    maps["aim_angles"] = AIM_ANGLES
+    maps["zone_damage"] = ZONE_DAMAGE
+    return maps
+
+def analyze_job(job):
+    return analyze_terrain(*job)
+
+def fairness(maps):
+    # Share of aim angles that hit the opponent, per terrain and side. A
+    # terrain is lopsided when one side has many more hitting angles.
+    player_hit_share = (maps["player_zone"] != ZONE_MISS).mean(axis=1)
+    npc_hit_share = (maps["npc_zone"] != ZONE_MISS).mean(axis=1)
+    return player_hit_share, npc_hit_share
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute hit-probability maps for generated terrains")
+    parser.add_argument("--terrains", type=int, default=100, help="number of terrains to analyze (default 100)")
+    parser.add_argument("--first-seed", type=int, default=0, help="seed of the first terrain (default 0)")
+    parser.add_argument("--output", metavar="PATH", default="hitmap.npz", help="output file (default hitmap.npz)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU core)")
+    parser.add_argument("--samples", type=int, default=20000,
+                        help="Monte Carlo samples of NPC aim drift per terrain (default 20000)")
+    parser.add_argument("--npc-start", type=int, nargs=2, default=(5, 30), metavar=("MIN", "MAX"),
+                        help="range of the NPC's starting aim angle (default 5 30, as in later rounds)")
+    parser.add_argument("--aim-seconds", type=float, nargs=2, default=(1.0, 10.0), metavar=("MIN", "MAX"),
+                        help="range of how long the aiming phase lasts (default 1 10)")
+    parser.add_argument("--min-hill-height", type=int, help="override MIN_HILL_HEIGHT for terrain generation")
+    parser.add_argument("--max-hill-height", type=int, help="override MAX_HILL_HEIGHT for terrain generation")
+    parser.add_argument("--max-imbalance", type=float, default=0.25,
+                        help="flag terrains whose hitting-angle shares differ by more than this (default 0.25)")
+    parser.add_argument("--check", action="store_true",
+                        help="also fly every shot through Bullet/Player.check_hit and compare")
+    parser.add_argument("--catalog", metavar="DIR",
+                        help="take the hit zones from this terrain catalog, adding missing terrains to it")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    seeds = range(args.first_seed, args.first_seed + args.terrains)
+    maps = analyze_terrains(seeds, args.workers, args.samples, tuple(args.npc_start), tuple(args.aim_seconds),
+                            args.check, args.min_hill_height, args.max_hill_height, args.catalog)
+    np.savez_compressed(args.output, **maps)
+    elapsed = time.perf_counter() - start
+
+    player_hit_share, npc_hit_share = fairness(maps)
+    imbalance = player_hit_share - npc_hit_share
+    unfair = np.flatnonzero(np.abs(imbalance) > args.max_imbalance)
+    print(f"Analyzed {args.terrains} terrains in {elapsed:.1f}s, wrote {args.output}")
+    print(f"Hitting angles: player {player_hit_share.mean():.1%}, NPC {npc_hit_share.mean():.1%}")
+    print(f"Chance the drifting NPC hits: {maps['npc_hit_probability'].mean():.1%}, "
+          f"expected damage taken per round: {maps['expected_damage_taken'].mean():.1f}")
+    print(f"{len(unfair)} lopsided terrains (imbalance > {args.max_imbalance:.0%})")
+    for index in unfair[:20]:
+        print(f"  seed {maps['seed'][index]}: player {player_hit_share[index]:.1%}, "
+              f"NPC {npc_hit_share[index]:.1%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
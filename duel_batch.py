@@ -0,0 +1,364 @@
+# Batched trajectory engine.
+# Advances whole arrays of shots together with NumPy using exactly the same
+# per-frame integration and swept terrain test as Bullet.update and the same
+# swept hit test as Bullet.check_hit, so a sweep of every aim angle costs a
+# few milliseconds. Given a duel_physics.Ballistics object it integrates
+# through that instead, again matching Bullet.
+import math
+from collections import namedtuple
+
+import numpy as np
+
+import duel_core
+from duel_core import (
+    BASE_GROUND_LEVEL, GRAVITY, HEAD_RADIUS, HEAD_OFFSET, ZONE_MISS, ZONE_BODY, ZONE_HEAD,
+)
+
+# Damage dealt per hit zone (indexed by zone)
+ZONE_DAMAGE = np.array(duel_core.ZONE_DAMAGE)
+
+# Every aim angle the player can select (0-60 degrees in 0.10 degree steps)
+AIM_ANGLES = np.round(np.arange(601) * 0.10, 2)
+
+# Per-shot results, one array entry per shot
+ShotResults = namedtuple("ShotResults", ["impact_x", "impact_y", "impact_frame", "zone"])
+
+# Recorded flight paths, one row per shot and one column per frame (column 0 is
+# the launch point). Rows are NaN-padded past each shot's impact_frame.
+ShotPaths = namedtuple("ShotPaths", ["x", "y"])
+
+def launch_velocities(angles, speeds, is_player):
+    # Velocity components are computed with math.cos/math.sin one shot at a time
+    # so they are bit-identical to the ones Bullet.__init__ computes
+    direction = 1 if is_player else -1
+    vx = np.empty(len(angles))
+    vy = np.empty(len(angles))
+    for i, (angle, speed) in enumerate(zip(angles.tolist(), speeds.tolist())):
+        angle_rad = math.radians(angle)
+        vx[i] = math.cos(angle_rad) * speed * direction
+        vy[i] = -math.sin(angle_rad) * speed
+    return vx, vy
+
+def piece_contacts(x0, y0, vx, vy, x_start, t_start, t_end, ground, pending):
+    # Vectorized duel_core.ground_piece_contact for the rows in pending.
+    # Returns the rows that touched the ground and their contact (t, x, y).
+    y_start = y0 + vy * t_start
+    wall = pending & (y_start > ground)
+    floor = pending & ~wall & (y0 + vy * t_end > ground)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_floor = (ground - y0) / vy
+    t = np.where(wall, t_start, t_floor)
+    x = np.where(wall, x_start, x0 + vx * t_floor)
+    y = np.where(wall, y_start, ground)
+    return wall | floor, t, x, y
+
+def ground_contacts(terrain, x0, y0, vx, vy):
+    # Vectorized Terrain.first_ground_contact. Returns (landed, t, x, y) with
+    # t = inf for movements that stay above the ground.
+    edges = terrain.height_edges
+    x1 = x0 + vx
+    count = x0.size
+    landed = np.zeros(count, dtype=bool)
+    contact_t = np.full(count, np.inf)
+    contact_x = x1.copy()
+    contact_y = y0 + vy
+
+    t_start = np.zeros(count)
+    x_start = x0.copy()
+    ground = terrain.ground_levels_at(x0)
+    right = vx > 0
+    left = vx < 0
+    first_edge = np.searchsorted(edges, x0, side="right")
+
+    # Walk the hill walls crossed in travel order, one wall per pass
+    crossing_number = 0
+    while True:
+        edge_index = np.where(right, first_edge + crossing_number, first_edge - 1 - crossing_number)
+        in_range = (edge_index >= 0) & (edge_index < len(edges))
+        edge = edges[np.clip(edge_index, 0, max(len(edges) - 1, 0))] if len(edges) else x0
+        crossing = ~landed & in_range & ((right & (edge <= x1)) | (left & (edge > x1)))
+        if not crossing.any():
+            break
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_edge = (edge - x0) / vx
+        hit, t, x, y = piece_contacts(x0, y0, vx, vy, x_start, t_start, t_edge, ground, crossing)
+        contact_t = np.where(hit, t, contact_t)
+        contact_x = np.where(hit, x, contact_x)
+        contact_y = np.where(hit, y, contact_y)
+        landed |= hit
+
+        # Continue past the wall on the next flat piece
+        moved_on = crossing & ~hit
+        t_start = np.where(moved_on, t_edge, t_start)
+        x_start = np.where(moved_on, edge, x_start)
+        ground = np.where(moved_on, terrain.ground_levels_at(np.where(right, edge, edge - 1)), ground)
+        crossing_number += 1
+
+    # Last flat piece up to the end of the movement
+    hit, t, x, y = piece_contacts(x0, y0, vx, vy, x_start, t_start, 1.0, ground, ~landed)
+    contact_t = np.where(hit, t, contact_t)
+    contact_x = np.where(hit, x, contact_x)
+    contact_y = np.where(hit, y, contact_y)
+    landed |= hit
+    return landed, contact_t, contact_x, contact_y
+
+# Ground of many terrains at once, one row per terrain: the hill walls of
+# Terrain.height_edges (padded with inf) and the ground level of every flat
+# piece between them, piece k lying between walls k - 1 and k
+class TerrainRows:
+    def __init__(self, count, edge_capacity=8):
+        self.edges = np.full((count, edge_capacity), np.inf)
+        self.levels = np.full((count, edge_capacity + 1), float(BASE_GROUND_LEVEL))
+        self.edge_count = np.zeros(count, dtype=np.intp)
+        self.ground_top = np.full(count, float(BASE_GROUND_LEVEL))
+        self.width = np.zeros(count)
+
+    def set(self, row, terrain):
+        edges = terrain.height_edges
+        if len(edges) > self.edges.shape[1]:
+            extra = len(edges) - self.edges.shape[1]
+            self.edges = np.pad(self.edges, ((0, 0), (0, extra)), constant_values=np.inf)
+            self.levels = np.pad(self.levels, ((0, 0), (0, extra)), constant_values=BASE_GROUND_LEVEL)
+        self.edges[row] = np.inf
+        self.edges[row, :len(edges)] = edges
+        self.levels[row] = BASE_GROUND_LEVEL
+        self.levels[row, 1:len(edges) + 1] = terrain.ground_levels_at(edges)
+        self.edge_count[row] = len(edges)
+        self.ground_top[row] = terrain.ground_top
+        self.width[row] = terrain.width
+
+    def ground_contacts(self, rows, x0, y0, vx, vy):
+        # ground_contacts for movement i on the terrain in row rows[i]
+        edges = self.edges[rows]
+        levels = self.levels[rows]
+        edge_count = self.edge_count[rows]
+        last_edge = edges.shape[1] - 1
+        count = x0.size
+        shots = np.arange(count)
+        x1 = x0 + vx
+        landed = np.zeros(count, dtype=bool)
+        contact_t = np.full(count, np.inf)
+        contact_x = x1.copy()
+        contact_y = y0 + vy
+
+        t_start = np.zeros(count)
+        x_start = x0.copy()
+        first_edge = np.count_nonzero(edges <= x0[:, None], axis=1)
+        ground = levels[shots, first_edge]
+        right = vx > 0
+        left = vx < 0
+
+        # Walk the hill walls crossed in travel order, one wall per pass
+        crossing_number = 0
+        while True:
+            edge_index = np.where(right, first_edge + crossing_number, first_edge - 1 - crossing_number)
+            in_range = (edge_index >= 0) & (edge_index < edge_count)
+            edge = edges[shots, np.clip(edge_index, 0, last_edge)]
+            crossing = ~landed & in_range & ((right & (edge <= x1)) | (left & (edge > x1)))
+            if not crossing.any():
+                break
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t_edge = (edge - x0) / vx
+            hit, t, x, y = piece_contacts(x0, y0, vx, vy, x_start, t_start, t_edge, ground, crossing)
+            contact_t = np.where(hit, t, contact_t)
+            contact_x = np.where(hit, x, contact_x)
+            contact_y = np.where(hit, y, contact_y)
+            landed |= hit
+
+            # Continue past the wall on the next flat piece
+            moved_on = crossing & ~hit
+            t_start = np.where(moved_on, t_edge, t_start)
+            x_start = np.where(moved_on, edge, x_start)
+            next_piece = np.clip(np.where(right, edge_index + 1, edge_index), 0, last_edge + 1)
+            ground = np.where(moved_on, levels[shots, next_piece], ground)
+            crossing_number += 1
+
+        # Last flat piece up to the end of the movement
+        hit, t, x, y = piece_contacts(x0, y0, vx, vy, x_start, t_start, 1.0, ground, ~landed)
+        contact_t = np.where(hit, t, contact_t)
+        contact_x = np.where(hit, x, contact_x)
+        contact_y = np.where(hit, y, contact_y)
+        landed |= hit
+        return landed, contact_t, contact_x, contact_y
+
+def circle_contacts(x0, y0, vx, vy, center_x, center_y, radius):
+    # Vectorized duel_core.segment_circle_contact, inf where there is no contact
+    fx = x0 - center_x
+    fy = y0 - center_y
+    c = fx * fx + fy * fy - radius * radius
+    a = vx * vx + vy * vy
+    b = 2 * (fx * vx + fy * vy)
+    discriminant = b * b - 4 * a * c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (-b - np.sqrt(np.maximum(discriminant, 0))) / (2 * a)
+    crossing = (a != 0) & (discriminant >= 0) & (t >= 0) & (t <= 1)
+    return np.where(c <= 0, 0.0, np.where(crossing, t, np.inf))
+
+def rect_contacts(x0, y0, vx, vy, left, top, right, bottom):
+    # Vectorized duel_core.segment_rect_contact, inf where there is no contact
+    t_enter = np.zeros(x0.shape)
+    t_exit = np.ones(x0.shape)
+    miss = np.zeros(x0.shape, dtype=bool)
+    for start, velocity, low, high in ((x0, vx, left, right), (y0, vy, top, bottom)):
+        # Not moving along this axis: either always inside the slab or never
+        still = velocity == 0
+        miss |= still & ((start < low) | (start > high))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t1 = (low - start) / velocity
+            t2 = (high - start) / velocity
+        t1 = np.where(still, -np.inf, t1)
+        t2 = np.where(still, np.inf, t2)
+        t_enter = np.maximum(t_enter, np.minimum(t1, t2))
+        t_exit = np.minimum(t_exit, np.maximum(t1, t2))
+    return np.where(~miss & (t_enter <= t_exit), t_enter, np.inf)
+
+def player_contacts(target, x0, y0, vx, vy):
+    # Vectorized Player.sweep_contact. Returns (t, zone) with t = inf on a miss.
+    head_t = circle_contacts(x0, y0, vx, vy, target.x + target.width // 2,
+                             target.y - HEAD_OFFSET, HEAD_RADIUS)
+    body_t = rect_contacts(x0, y0, vx, vy, target.x, target.y,
+                           target.x + target.width, target.y + target.height)
+    head = head_t <= body_t
+    t = np.where(head, head_t, body_t)
+    zone = np.where(np.isinf(t), ZONE_MISS, np.where(head, ZONE_HEAD, ZONE_BODY))
+    return t, zone
+
+def simulate_shots(terrain, x, y, angles, speeds, is_player, target=None, max_frames=10000, trace=False,
+                   ballistics=None, drag=0.0, wind=0.0):
+    # Fly every shot until it lands, leaves the screen or hits target (a Player).
+    # x, y, angles and speeds broadcast against each other; is_player picks the
+    # firing direction. ballistics, drag and wind are as for Bullet.
+    # With trace=True the flight paths are returned too, as (results, paths).
+    x, y, angles, speeds = np.broadcast_arrays(
+        np.asarray(x, dtype=float), np.asarray(y, dtype=float),
+        np.asarray(angles, dtype=float), np.asarray(speeds, dtype=float))
+    shape = x.shape
+    x = x.ravel()
+    y = y.ravel()
+    vx, vy = launch_velocities(angles.ravel(), speeds.ravel(), is_player)
+
+    count = x.size
+    impact_x = x.copy()
+    impact_y = y.copy()
+    impact_frame = np.full(count, max_frames, dtype=np.int32)
+    zone = np.full(count, ZONE_MISS, dtype=np.int8)
+
+    # Working set of shots still in flight
+    ids = np.arange(count)
+    x = x.copy()
+    y = y.copy()
+    trace_frames = [(ids, x, y)]
+
+    # Bounds used to skip exact tests for movements that can't touch anything
+    ground_top = terrain.ground_top
+    if target is not None:
+        target_left = min(target.x, target.x + target.width // 2 - HEAD_RADIUS)
+        target_right = max(target.x + target.width, target.x + target.width // 2 + HEAD_RADIUS)
+        target_top = target.y - HEAD_OFFSET - HEAD_RADIUS
+        target_bottom = target.y + target.height
+
+    frame = 0
+    while ids.size and frame < max_frames:
+        frame += 1
+        x0 = x
+        y0 = y
+
+        if ballistics:
+            dx, dy, next_vx, next_vy = ballistics.advance(vx, vy, drag, wind)
+        else:
+            # Apply gravity to vertical velocity after moving, plus drag and
+            # wind when there are any, as Bullet.update does
+            dx, dy = vx, vy
+            if drag or wind:
+                speed = np.sqrt(vx * vx + vy * vy)
+                next_vx = vx + (wind - drag * speed * vx)
+                next_vy = vy + (GRAVITY - drag * speed * vy)
+            else:
+                next_vx, next_vy = vx, vy + GRAVITY
+        x1 = x0 + dx
+        y1 = y0 + dy
+
+        # Sweep this frame's movement against the ground and hill walls. Only
+        # movements that dip below the highest ground anywhere can touch it.
+        x = x1
+        y = y1
+        landed = np.zeros(ids.size, dtype=bool)
+        t_end = np.ones(ids.size)
+        near = np.flatnonzero(np.maximum(y0, y1) > ground_top)
+        if near.size:
+            near_landed, near_t, near_x, near_y = ground_contacts(
+                terrain, x0[near], y0[near], dx[near], dy[near])
+            landed[near] = near_landed
+            t_end[near] = np.where(near_landed, near_t, 1.0)
+            x[near] = near_x
+            y[near] = near_y
+
+        # Check if bullet is out of bounds
+        done = landed | (x < 0) | (x > terrain.width)
+
+        # Sweep the same movement against the target, up to where it stopped,
+        # and stop hits at the exact impact point. Only movements whose
+        # bounding box overlaps the target's can touch it.
+        if target is not None:
+            near = np.flatnonzero((np.maximum(x0, x1) >= target_left) & (np.minimum(x0, x1) <= target_right) &
+                                  (np.maximum(y0, y1) >= target_top) & (np.minimum(y0, y1) <= target_bottom))
+            if near.size:
+                t_hit, hit_zone = player_contacts(target, x0[near], y0[near], dx[near], dy[near])
+                hit = t_hit <= t_end[near]
+                near = near[hit]
+                t_hit = t_hit[hit]
+                x[near] = x0[near] + dx[near] * t_hit
+                y[near] = y0[near] + dy[near] * t_hit
+                zone[ids[near]] = hit_zone[hit]
+                done[near] = True
+
+        vx = next_vx
+        vy = next_vy
+
+        if trace:
+            trace_frames.append((ids, x, y))
+
+        # Record finished shots and drop them from the working set
+        finished = ids[done]
+        impact_x[finished] = x[done]
+        impact_y[finished] = y[done]
+        impact_frame[finished] = frame
+
+        keep = ~done
+        ids = ids[keep]
+        x = x[keep]
+        y = y[keep]
+        vx = vx[keep]
+        vy = vy[keep]
+
+    # Shots still flying after max_frames keep their last position
+    impact_x[ids] = x
+    impact_y[ids] = y
+
+    results = ShotResults(impact_x.reshape(shape), impact_y.reshape(shape),
+                          impact_frame.reshape(shape), zone.reshape(shape))
+    if not trace:
+        return results
+
+    # Scatter the per-frame working sets back into one row per shot
+    paths_x = np.full((count, len(trace_frames)), np.nan)
+    paths_y = np.full((count, len(trace_frames)), np.nan)
+    for column, (frame_ids, frame_x, frame_y) in enumerate(trace_frames):
+        paths_x[frame_ids, column] = frame_x
+        paths_y[frame_ids, column] = frame_y
+    paths = ShotPaths(paths_x.reshape(shape + (-1,)), paths_y.reshape(shape + (-1,)))
+    return results, paths
+
+def sweep_aim_angles(shooter, target, terrain, angles=AIM_ANGLES, trace=False, ballistics=None, wind=0.0,
+                     max_frames=10000):
+    # Fire one shot per aim angle from the shooter's pistol tip, as Player.shoot
+    # would once the quick-draw has finished, and resolve it against target
+    angles = np.asarray(angles, dtype=float)
+    tips = [shooter.pistol_tip(angle) for angle in angles.tolist()]
+    x = np.array([tip[0] for tip in tips])
+    y = np.array([tip[1] for tip in tips])
+    drag = shooter.weapon.drag if shooter.weapon else 0.0
+    return simulate_shots(terrain, x, y, angles, shooter.bullet_velocity,
+                          shooter.is_player, target, max_frames, trace, ballistics, drag, wind)
@@ -0,0 +1,476 @@
+# Benchmarks for the physics and rendering hot paths.
+# Runs headless (SDL dummy video driver) and prints the results as JSON, so
+# runs can be saved and compared against a baseline:
+#
+#   python duel_bench.py --output baseline.json
+#   python duel_bench.py --baseline baseline.json   # exits 1 on a regression
+#   python duel_bench.py --filter bullet --quick
+import os
+
+# Must be set before pygame creates the display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+import pygame
+
+import duel_game
+from duel_batch import simulate_shots
+from duel_core import (
+    WIDTH, BASE_GROUND_LEVEL, MIN_HILL_HEIGHT, INPUT_UP, INPUT_READY, INPUT_RESTART,
+    Terrain, Bullet, Player, DuelSimulation,
+)
+from duel_env import ACTION_COUNT, VectorDuelEnv
+from duel_ffa import FreeForAll
+from duel_preview import TrajectoryPreview
+from duel_projectiles import ProjectilePool
+
+BENCH_SCHEMA = 1
+
+# Parameter grids
+HILL_COUNTS = (3, 10, 50)
+PROJECTILE_COUNTS = (1, 16, 256)
+POOL_PROJECTILE_COUNTS = (16, 256, 1024)
+BATCH_SHOT_COUNTS = (16, 601, 4096)
+ENV_COUNTS = (256, 4096)
+FIGURE_COUNTS = (16, 256)
+DUELIST_COUNTS = (8, 32, 128)
+RENDER_RESOLUTIONS = ("960x540",)  # Internal resolutions besides the logical one
+
+# Seed for terrain and shot angles, so every run measures the same work
+BENCH_SEED = 1234
+
+def make_terrain(hills, seed=BENCH_SEED):
+    # Regular generated terrain with extra low hills scattered between the
+    # duelists until it has the requested number of hills
+    rng = random.Random(seed)
+    terrain = Terrain(rng)
+    while len(terrain.hills) < hills:
+        width = rng.randint(20, 120)
+        height = rng.randint(MIN_HILL_HEIGHT // 2, MIN_HILL_HEIGHT + 20)
+        x = rng.randint(200, WIDTH - 200 - width)
+        terrain.hills.append((x, BASE_GROUND_LEVEL - height, width, height))
+    terrain.build_height_index()
+    return terrain
+
+def make_simulation(hills):
+    sim = DuelSimulation(random.Random(BENCH_SEED))
+    if hills is not None:
+        use_terrain(sim, make_terrain(hills))
+    return sim
+
+def use_terrain(sim, terrain):
+    sim.terrain = terrain
+    Player.terrain = terrain
+
+def make_bullets(sim, count, rng):
+    # Bullets fired from the player's pistol at random aim angles
+    bullets = []
+    for _ in range(count):
+        angle = rng.uniform(0, 60)
+        x, y, _ = sim.player.pistol_tip(angle)
+        bullets.append(Bullet(x, y, angle, sim.player.bullet_velocity, True))
+    return bullets
+
+# Each benchmark takes its parameters and returns a function that does one
+# batch of work and returns how many operations it did
+
+def bench_ground_level(hills):
+    terrain = make_terrain(hills)
+    rng = random.Random(BENCH_SEED)
+    xs = [rng.uniform(0, WIDTH) for _ in range(1000)]
+    get_ground_level_at = terrain.get_ground_level_at
+
+    def run():
+        for x in xs:
+            get_ground_level_at(x)
+        return len(xs)
+    return run
+
+def bench_bullet_update(hills, projectiles):
+    # Fly a volley of bullets until every one of them has landed or left the
+    # screen, counting one operation per bullet update
+    sim = make_simulation(hills)
+    terrain = sim.terrain
+    rng = random.Random(BENCH_SEED)
+
+    def run():
+        bullets = make_bullets(sim, projectiles, rng)
+        updates = 0
+        while bullets:
+            for bullet in bullets:
+                bullet.update(terrain)
+            updates += len(bullets)
+            bullets = [bullet for bullet in bullets if bullet.active]
+        return updates
+    return run
+
+def bench_bullet_check_hit(projectiles):
+    # Replay the recorded movements of a volley against the NPC
+    sim = make_simulation(None)
+    npc = sim.npc
+    sweeps = []
+    for bullet in make_bullets(sim, projectiles, random.Random(BENCH_SEED)):
+        while bullet.active:
+            bullet.update(sim.terrain)
+            if bullet.sweep:
+                sweeps.append(bullet.sweep)
+    probe = Bullet(0, 0, 0, 0, True)
+
+    def run():
+        for sweep in sweeps:
+            probe.sweep = sweep
+            probe.check_hit(npc)
+            npc.health = npc.max_health
+        return len(sweeps)
+    return run
+
+def bench_reticle(hills):
+    sim = make_simulation(hills)
+    player = sim.player
+    terrain = sim.terrain
+    angles = [angle * 0.1 for angle in range(601)]
+
+    def run():
+        for angle in angles:
+            player.aim_angle = angle
+            player.update_reticle_position(terrain)
+        return len(angles)
+    return run
+
+def bench_batch_shots(hills, projectiles):
+    sim = make_simulation(hills)
+    player = sim.player
+    angles = np.linspace(0, 60, projectiles)
+    x, y, _ = player.pistol_tip(30)
+
+    def run():
+        simulate_shots(sim.terrain, x, y, angles, player.bullet_velocity, True, sim.npc)
+        return projectiles
+    return run
+
+def fill_pool(sim, pool, projectiles, rng):
+    # Top the pool up to the requested number of projectiles in flight
+    missing = projectiles - pool.count()
+    if missing > 0:
+        angles = [rng.uniform(0, 60) for _ in range(missing)]
+        x, y, _ = sim.player.pistol_tip(30)
+        pool.spawn(x, y, angles, sim.player.bullet_velocity, True, 0)
+
+def bench_pool_update(hills, projectiles):
+    # One frame of a pool kept at the requested number of projectiles,
+    # counting one operation per projectile update
+    sim = make_simulation(hills)
+    pool = ProjectilePool(max(projectiles, 16))
+    targets = [sim.player, sim.npc]
+    rng = random.Random(BENCH_SEED)
+
+    def run():
+        updates = 0
+        for _ in range(20):
+            fill_pool(sim, pool, projectiles, rng)
+            updates += pool.count()
+            pool.update(sim.terrain, targets)
+        return updates
+    return run
+
+def bench_draw_projectiles(projectiles):
+    sim = make_simulation(None)
+    pool = ProjectilePool(max(projectiles, 16))
+    fill_pool(sim, pool, projectiles, random.Random(BENCH_SEED))
+    for _ in range(6):
+        pool.update(sim.terrain)  # Grow the trails
+    screen = duel_game.screen
+    background = duel_game.get_background(sim.terrain)
+    screen.blit(background, (0, 0))
+    dirty = duel_game.draw_projectiles(screen, pool)
+
+    def run():
+        # Only the rect the projectiles cover is repainted, so the time is the draw's
+        for _ in range(20):
+            screen.blit(background, dirty, dirty)
+            duel_game.draw_projectiles(screen, pool)
+        return 20
+    return run
+
+def bench_player_draw(aiming):
+    sim = make_simulation(None)
+    screen = duel_game.screen
+    background = duel_game.get_background(sim.terrain)
+    screen.blit(background, (0, 0))
+    dirty = duel_game.draw_player(screen, sim.player, aiming)
+
+    def run():
+        # Only the duelist's own rect is repainted, so the time is the draw's
+        for _ in range(100):
+            screen.blit(background, dirty, dirty)
+            duel_game.draw_player(screen, sim.player, aiming)
+        return 100
+    return run
+
+def bench_crowd_draw(figures):
+    # Many duelists in assorted poses over one background, one operation per figure
+    sim = make_simulation(None)
+    screen = duel_game.screen
+    background = duel_game.get_background(sim.terrain)
+    rng = random.Random(BENCH_SEED)
+    poses = [(sim.player if i % 2 else sim.npc, rng.randrange(0, WIDTH - 100), rng.randrange(100, 900),
+              rng.uniform(-70, 60)) for i in range(figures)]
+
+    def run():
+        screen.blit(background, (0, 0))
+        for duelist, x, y, arm_angle in poses:
+            duelist.x, duelist.y, duelist.current_arm_angle = x, y, arm_angle
+            duel_game.draw_player(screen, duelist)
+        return figures
+    return run
+
+def bench_draw_scene(hills, preview):
+    sim = make_simulation(hills)
+    trajectory_preview = TrajectoryPreview() if preview else None
+
+    def run():
+        for _ in range(20):
+            points = None
+            if trajectory_preview:
+                points = trajectory_preview.points_for(sim.player, sim.npc, sim.terrain)
+            duel_game.draw_scene(sim.player, sim.npc, sim.terrain, sim.game_state,
+                                 countdown=sim.countdown_value, winner=sim.winner,
+                                 hit_message=sim.hit_message, preview=points)
+        return 20
+    return run
+
+def bench_simulate_round(hills):
+    # Whole rounds resolved from the aiming phase, one operation per round
+    sim = make_simulation(hills)
+    terrain = sim.terrain
+    rng = random.Random(BENCH_SEED)
+
+    def run():
+        for _ in range(50):
+            if sim.game_state == "game_over":
+                sim.new_game()
+                if hills is not None:
+                    use_terrain(sim, terrain)
+            sim.simulate_round(rng.uniform(0, 60), rng.uniform(0, 60))
+        return 50
+    return run
+
+def bench_free_for_all(duelists):
+    # Shooting frames of free-for-all rounds, one operation per frame.
+    # Everyone is healed after each round, so every run plays the same
+    # battlefield with everyone standing.
+    sim = FreeForAll(random.Random(BENCH_SEED), duelists, human=False)
+
+    def run():
+        frames = 0
+        for _ in range(5):
+            for duelist in sim.duelists:
+                duelist.current_arm_angle = duelist.aim_angle  # The draw is over
+            sim.fire()
+            while sim.game_state == "shooting":
+                sim.update_shooting()
+                frames += 1
+            for duelist in sim.duelists:
+                duelist.health = duelist.max_health
+            sim.alive = list(range(duelists))
+            sim.start_round()
+        return frames
+    return run
+
+def bench_step():
+    # Frame-by-frame simulation of the live game: aim, draw, shoot, restart
+    sim = make_simulation(None)
+    frame_inputs = [INPUT_UP] * 30 + [INPUT_READY] + [0] * 299 + [INPUT_RESTART]
+
+    def run():
+        for inputs in frame_inputs:
+            sim.step(inputs)
+        return len(frame_inputs)
+    return run
+
+def bench_vector_env(envs):
+    # Vectorized env steps under random actions (one in ten fires), one
+    # operation per env step
+    env = VectorDuelEnv(envs, seed=BENCH_SEED)
+    env.reset()
+    rng = np.random.default_rng(BENCH_SEED)
+    probabilities = [0.3, 0.3, 0.3, 0.1]
+    actions = [rng.choice(ACTION_COUNT, envs, p=probabilities) for _ in range(10)]
+
+    def run():
+        for step_actions in actions:
+            env.step(step_actions)
+        return envs * len(actions)
+    return run
+
+def benchmark_cases():
+    # (name, params, factory) for every benchmark, in report order
+    cases = []
+    for hills in HILL_COUNTS:
+        cases.append(("terrain.get_ground_level_at", {"hills": hills}, lambda hills=hills: bench_ground_level(hills)))
+    for hills in HILL_COUNTS:
+        for projectiles in PROJECTILE_COUNTS:
+            cases.append(("bullet.update", {"hills": hills, "projectiles": projectiles},
+                          lambda hills=hills, projectiles=projectiles: bench_bullet_update(hills, projectiles)))
+    for projectiles in PROJECTILE_COUNTS:
+        cases.append(("bullet.check_hit", {"projectiles": projectiles},
+                      lambda projectiles=projectiles: bench_bullet_check_hit(projectiles)))
+    for hills in HILL_COUNTS:
+        cases.append(("player.update_reticle_position", {"hills": hills}, lambda hills=hills: bench_reticle(hills)))
+    for hills in HILL_COUNTS:
+        for projectiles in BATCH_SHOT_COUNTS:
+            cases.append(("batch.simulate_shots", {"hills": hills, "projectiles": projectiles},
+                          lambda hills=hills, projectiles=projectiles: bench_batch_shots(hills, projectiles)))
+    for hills in HILL_COUNTS:
+        for projectiles in POOL_PROJECTILE_COUNTS:
+            cases.append(("projectile_pool.update", {"hills": hills, "projectiles": projectiles},
+                          lambda hills=hills, projectiles=projectiles: bench_pool_update(hills, projectiles)))
+    for projectiles in POOL_PROJECTILE_COUNTS:
+        cases.append(("draw_projectiles", {"projectiles": projectiles},
+                      lambda projectiles=projectiles: bench_draw_projectiles(projectiles)))
+    for aiming in (False, True):
+        cases.append(("player.draw", {"aiming": aiming}, lambda aiming=aiming: bench_player_draw(aiming)))
+    for figures in FIGURE_COUNTS:
+        cases.append(("crowd.draw", {"figures": figures}, lambda figures=figures: bench_crowd_draw(figures)))
+    for hills in HILL_COUNTS:
+        for preview in (False, True):
+            cases.append(("draw_scene", {"hills": hills, "preview": preview},
+                          lambda hills=hills, preview=preview: bench_draw_scene(hills, preview)))
+    for resolution in RENDER_RESOLUTIONS:
+        cases.append(("draw_scene", {"hills": HILL_COUNTS[0], "preview": True, "resolution": resolution},
+                      lambda: bench_draw_scene(HILL_COUNTS[0], True)))
+    for hills in HILL_COUNTS:
+        cases.append(("simulate_round", {"hills": hills}, lambda hills=hills: bench_simulate_round(hills)))
+    cases.append(("simulation.step", {}, bench_step))
+    for duelists in DUELIST_COUNTS:
+        cases.append(("free_for_all.shooting_frame", {"duelists": duelists},
+                      lambda duelists=duelists: bench_free_for_all(duelists)))
+    for envs in ENV_COUNTS:
+        cases.append(("vector_env.step", {"envs": envs}, lambda envs=envs: bench_vector_env(envs)))
+    return cases
+
+def case_id(name, params):
+    if not params:
+        return name
+    return name + "[" + ",".join(f"{key}={value}" for key, value in params.items()) + "]"
+
+def measure(run, repeats, min_time):
+    # Warm up caches, then time repeats of at least min_time seconds each.
+    # The fastest repeat is the least disturbed by the rest of the machine.
+    run()
+    per_op = []
+    for _ in range(repeats):
+        ops = 0
+        start = time.perf_counter()
+        while True:
+            ops += run()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        per_op.append(elapsed / ops)
+    best = min(per_op)
+    return {
+        "ns_per_op": best * 1e9,
+        "median_ns_per_op": statistics.median(per_op) * 1e9,
+        "ops_per_sec": 1 / best,
+        "repeats": repeats,
+    }
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "pygame": pygame.version.ver,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+def run_benchmarks(name_filter=None, repeats=5, min_time=0.1, log=None):
+    duel_game.init_display()
+    resolution = None
+    results = []
+    for name, params, factory in benchmark_cases():
+        bench_id = case_id(name, params)
+        if name_filter and name_filter not in bench_id:
+            continue
+        if params.get("resolution") != resolution:
+            resolution = params.get("resolution")
+            duel_game.init_display(duel_game.parse_resolution(resolution) if resolution else None)
+        result = {"id": bench_id, "name": name, "params": params}
+        result.update(measure(factory(), repeats, min_time))
+        results.append(result)
+        if log:
+            log(f"{bench_id:<58} {result['ns_per_op'] / 1000:>12.3f} us/op")
+    return {"schema": BENCH_SCHEMA, "environment": environment(), "results": results}
+
+def compare(report, baseline, threshold):
+    # Per-benchmark change against the baseline. A benchmark regressed when it
+    # takes more than threshold (a fraction) longer per operation.
+    baseline_results = {result["id"]: result for result in baseline["results"]}
+    rows = []
+    for result in report["results"]:
+        reference = baseline_results.get(result["id"])
+        if reference is None:
+            continue
+        change = result["ns_per_op"] / reference["ns_per_op"] - 1
+        rows.append({
+            "id": result["id"],
+            "baseline_ns_per_op": reference["ns_per_op"],
+            "ns_per_op": result["ns_per_op"],
+            "change": change,
+            "regression": change > threshold,
+        })
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Wild West Duel hot paths")
+    parser.add_argument("--output", metavar="PATH", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a saved report and exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown that counts as a regression, as a fraction (default 0.10)")
+    parser.add_argument("--filter", metavar="TEXT", help="only run benchmarks whose id contains TEXT")
+    parser.add_argument("--repeats", type=int, default=5, help="timed repeats per benchmark (default 5)")
+    parser.add_argument("--quick", action="store_true", help="shorter repeats, for a rough check")
+    args = parser.parse_args(argv)
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    min_time = 0.02 if args.quick else 0.1
+    report = run_benchmarks(args.filter, args.repeats, min_time, log)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        comparison = compare(report, baseline, args.threshold)
+        report["baseline"] = {"path": args.baseline, "threshold": args.threshold, "results": comparison}
+        regressions = [row for row in comparison if row["regression"]]
+        for row in comparison:
+            marker = "REGRESSION" if row["regression"] else ""
+            log(f"{row['id']:<58} {row['change']:>+8.1%} {marker}")
+        log(f"{len(regressions)} regression(s) in {len(comparison)} compared benchmarks")
+        if regressions:
+            exit_code = 1
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text + "\n")
+    else:
+        print(text)
+    pygame.quit()
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+# Catalog of seeded terrains and their precomputed shot tables.
+# A terrain seed names a terrain (see Terrain's seed argument), and everything
+# worth knowing about it for aiming is worked out once and kept on disk:
+#
+#   heightmap.npy     ground level of every column (Terrain.heightmap)
+#   hills.npy         the hills as (x, y, width, height) rows
+#   impact_x.npy      per side (0 player, 1 NPC) and aim angle, where the shot
+#   impact_y.npy      ended, on which frame and which zone of the opponent it
+#   impact_frame.npy  hit (the sweep_aim_angles results)
+#   zone.npy
+#   path_x.npy        per side and aim angle, the flight path's screen points
+#   path_y.npy        frame by frame (the TrajectoryPreview table)
+#
+# Hit maps pairing every player angle with every NPC angle are derived from
+# the zones (see duel_analysis) rather than stored.
+#
+# Entries live under a directory named after a digest of the entry format,
+# the terrain generator version and every constant that changes the hills or the shots
+# (gravity, hill sizes, positions, hitboxes, muzzle velocity, world width), so
+# changing any of them simply misses the cache. Arrays are plain .npy files
+# opened memory-mapped: any number of processes read the same pages without
+# copying them, and a restart costs no recomputation. Entries are written to
+# a temporary directory and renamed into place, so workers warming the same
+# seed at once never see half an entry.
+#
+#   python duel_catalog.py warm --terrains 1000
+#   python duel_catalog.py list
+#   python duel_catalog.py evict --stale
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import duel_core
+from duel_batch import AIM_ANGLES, ShotResults, sweep_aim_angles
+from duel_core import WIDTH, DuelSimulation
+from duel_physics import WEAPONS
+
+DEFAULT_CATALOG = "terrain_catalog"
+
+# Bump whenever the arrays stored per entry change
+ENTRY_FORMAT = 2
+
+# Arrays stored per entry
+SHOT_FIELDS = ShotResults._fields
+ARRAYS = ("heightmap", "hills") + SHOT_FIELDS + ("path_x", "path_y")
+
+def catalog_constants(width=WIDTH):
+    # Everything a cached entry depends on besides its seed. Read from
+    # duel_core at call time, so tuned values (like duel_analysis's hill
+    # heights) get entries of their own.
+    return {
+        "entry_format": ENTRY_FORMAT,
+        "terrain_version": duel_core.TERRAIN_VERSION,
+        "width": width,
+        "gravity": duel_core.GRAVITY,
+        "base_ground_level": duel_core.BASE_GROUND_LEVEL,
+        "hill_height": [duel_core.MIN_HILL_HEIGHT, duel_core.MAX_HILL_HEIGHT],
+        "hill_width": list(duel_core.HILL_WIDTH_RANGE),
+        "wide_world_hill_spacing": duel_core.WIDE_WORLD_HILL_SPACING,
+        "duelist_x": [duel_core.PLAYER_X, duel_core.NPC_X],
+        "head": [duel_core.HEAD_RADIUS, duel_core.HEAD_OFFSET],
+        "muzzle_velocity": WEAPONS["revolver"].muzzle_velocity,
+        "aim_angles": [len(AIM_ANGLES), float(AIM_ANGLES[1] - AIM_ANGLES[0])],
+    }
+
+def constants_digest(constants):
+    return hashlib.sha1(json.dumps(constants, sort_keys=True).encode()).hexdigest()[:12]
+
+def build_entry(seed, width=WIDTH):
+    # All arrays of one catalog entry, plus its metadata
+    sim = DuelSimulation(random.Random(seed), width, terrain_seed=seed)
+    duelists = (sim.player, sim.npc)
+    arrays = {
+        "heightmap": sim.terrain.heightmap,
+        "hills": np.array(sim.terrain.hills, dtype=np.int32).reshape(-1, 4),
+    }
+    sides = [sweep_aim_angles(duelists[side], duelists[1 - side], sim.terrain, trace=True) for side in (0, 1)]
+    for field in SHOT_FIELDS:
+        arrays[field] = np.stack([getattr(results, field) for results, paths in sides])
+    arrays["zone"] = arrays["zone"].astype(np.int8)
+    # Paths as the integer points the preview draws, padded past each
+    # shot's impact frame to the longest flight of either side
+    frames = max(paths.x.shape[1] for results, paths in sides)
+    for name in ("x", "y"):
+        points = np.zeros((2, len(AIM_ANGLES), frames))
+        for side, (results, paths) in enumerate(sides):
+            coordinates = getattr(paths, name)
+            points[side, :, :coordinates.shape[1]] = np.nan_to_num(coordinates)
+        points = points.astype(int)
+        arrays[f"path_{name}"] = points.astype(np.int16 if np.abs(points).max() < 2 ** 15 else np.int32)
+    meta = {
+        "seed": seed,
+        "width": width,
+        "duelists": [[duelist.x, duelist.y] for duelist in duelists],
+        "created": time.time(),
+    }
+    return arrays, meta
+
+# One terrain's cached data; the arrays are read-only memory maps
+class CatalogEntry:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+        self.seed = meta["seed"]
+        self.width = meta["width"]
+        self.duelists = meta["duelists"]
+        self.created = meta["created"]
+        for name in ARRAYS:
+            array_path = os.path.join(path, f"{name}.npy")
+            if os.path.exists(array_path):  # Stale entries of older formats lack some arrays
+                setattr(self, name, np.load(array_path, mmap_mode="r"))
+
+    def shots(self, side):
+        # sweep_aim_angles results of one side's shots (0 player, 1 NPC)
+        return ShotResults(*(getattr(self, field)[side] for field in SHOT_FIELDS))
+
+    def matches(self, shooter, target):
+        # Whether the shots stored for shooter's side are the ones shooter
+        # would fire at target (same positions and the default revolver)
+        side = 0 if shooter.is_player else 1
+        return shooter.weapon is None and self.duelists[side] == [shooter.x, shooter.y] and \
+            self.duelists[1 - side] == [target.x, target.y]
+
+    def size(self):
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
+
+class TerrainCatalog:
+    def __init__(self, root=DEFAULT_CATALOG):
+        self.root = root
+        self.entries = {}  # Entries opened by this process, by path
+
+    def directory(self, width=WIDTH):
+        # Where entries for the current constants live; writes the constants
+        # next to them so list can show what a directory was built for
+        constants = catalog_constants(width)
+        path = os.path.join(self.root, constants_digest(constants))
+        key_path = os.path.join(path, "constants.json")
+        if not os.path.exists(key_path):
+            os.makedirs(path, exist_ok=True)
+            temporary = f"{key_path}.{os.getpid()}"
+            with open(temporary, "w") as file:
+                json.dump(constants, file, indent=2, sort_keys=True)
+            os.replace(temporary, key_path)
+        return path
+
+    def get(self, seed, width=WIDTH):
+        # The entry for seed, built and stored first if it isn't cached yet
+        path = os.path.join(self.directory(width), str(seed))
+        entry = self.entries.get(path)
+        if entry is None:
+            self.warm(seed, width)
+            entry = self.entries[path] = CatalogEntry(path)
+        return entry
+
+    def warm(self, seed, width=WIDTH):
+        # Build and store the entry for seed unless it exists. Returns
+        # whether it had to be built.
+        directory = self.directory(width)
+        path = os.path.join(directory, str(seed))
+        if os.path.exists(path):
+            return False
+        arrays, meta = build_entry(seed, width)
+        temporary = os.path.join(directory, f".{seed}.{os.getpid()}")
+        os.makedirs(temporary, exist_ok=True)
+        for name, values in arrays.items():
+            np.save(os.path.join(temporary, f"{name}.npy"), values)
+        with open(os.path.join(temporary, "meta.json"), "w") as file:
+            json.dump(meta, file)
+        try:
+            os.rename(temporary, path)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(temporary, ignore_errors=True)
+            return False
+        return True
+
+    def listing(self):
+        # (digest, constants, current?, entry) for every stored entry
+        rows = []
+        if not os.path.isdir(self.root):
+            return rows
+        for digest in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, digest)
+            if not os.path.isdir(directory):
+                continue
+            try:
+                with open(os.path.join(directory, "constants.json")) as file:
+                    constants = json.load(file)
+            except (OSError, ValueError):
+                constants = None  # Not a catalog directory we can read; counts as stale
+            current = constants is not None and digest == constants_digest(catalog_constants(constants["width"]))
+            names = [name for name in os.listdir(directory) if name.lstrip("-").isdigit()]
+            for name in sorted(names, key=int):
+                rows.append((digest, constants, current, CatalogEntry(os.path.join(directory, name))))
+        return rows
+
+    def evict(self, seeds=None, stale=False):
+        # Remove the entries for seeds (any constants), every entry built
+        # for other constants when stale is set, or everything when neither
+        # is given. Returns the number of entries and bytes removed.
+        removed = 0
+        freed = 0
+        for digest, constants, current, entry in self.listing():
+            if (seeds is None and not stale) or (seeds is not None and entry.seed in seeds) or \
+                    (stale and not current):
+                freed += entry.size()
+                shutil.rmtree(entry.path)
+                removed += 1
+        if os.path.isdir(self.root):
+            for digest in os.listdir(self.root):
+                directory = os.path.join(self.root, digest)
+                if os.path.isdir(directory) and all(name == "constants.json" for name in os.listdir(directory)):
+                    shutil.rmtree(directory)
+        self.entries.clear()
+        return removed, freed
+
+def warm_job(job):
+    root, seed, width = job
+    return TerrainCatalog(root).warm(seed, width)
+
+def warm_catalog(root, seeds, width=WIDTH, workers=None):
+    # Build the missing entries for seeds on a process pool. Returns how many
+    # were built.
+    workers = workers or os.cpu_count() or 1
+    TerrainCatalog(root).directory(width)
+    jobs = [(root, seed, width) for seed in seeds]
+    with ProcessPoolExecutor(workers) as pool:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        return sum(pool.map(warm_job, jobs, chunksize=chunksize))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the catalog of seeded terrains and their shot tables")
+    parser.add_argument("--catalog", metavar="DIR", default=DEFAULT_CATALOG,
+                        help=f"catalog directory (default {DEFAULT_CATALOG})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    warm_parser = subparsers.add_parser("warm", help="precompute entries for a range of terrain seeds")
+    warm_parser.add_argument("--terrains", type=int, default=100, help="number of terrains (default 100)")
+    warm_parser.add_argument("--first-seed", type=int, default=0, help="seed of the first terrain (default 0)")
+    warm_parser.add_argument("--world-width", type=int, default=WIDTH, metavar="PIXELS",
+                             help=f"world width (default {WIDTH})")
+    warm_parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU core)")
+    list_parser = subparsers.add_parser("list", help="show the stored entries")
+    list_parser.add_argument("--json", action="store_true", help="print the entries as JSON")
+    evict_parser = subparsers.add_parser("evict", help="remove entries")
+    evict_parser.add_argument("seeds", type=int, nargs="*", help="terrain seeds to remove")
+    evict_parser.add_argument("--stale", action="store_true",
+                              help="remove entries built with other constants or generator versions")
+    evict_parser.add_argument("--all", action="store_true", help="remove every entry")
+    args = parser.parse_args(argv)
+
+    catalog = TerrainCatalog(args.catalog)
+    if args.command == "warm":
+        start = time.perf_counter()
+        seeds = range(args.first_seed, args.first_seed + args.terrains)
+        built = warm_catalog(args.catalog, seeds, args.world_width, args.workers)
+        print(f"{built} entries built, {args.terrains - built} already cached "
+              f"in {time.perf_counter() - start:.1f}s")
+        return 0
+
+    if args.command == "list":
+        rows = [{"seed": entry.seed, "width": entry.width, "digest": digest, "current": current,
+                 "hills": len(entry.hills), "bytes": entry.size()}
+                for digest, constants, current, entry in catalog.listing()]
+        if args.json:
+            print(json.dumps(rows, indent=2))
+            return 0
+        for row in rows:
+            print(f"{row['seed']:>12}  width {row['width']:<6} {row['hills']} hills  "
+                  f"{row['bytes'] / 1024:>7.1f} KiB  {row['digest']}{'' if row['current'] else '  (stale)'}")
+        total = sum(row["bytes"] for row in rows)
+        stale = sum(not row["current"] for row in rows)
+        print(f"{len(rows)} entries, {stale} stale, {total / 2 ** 20:.1f} MiB in {args.catalog}")
+        return 0
+
+    if not (args.seeds or args.stale or args.all):
+        parser.error("evict needs seeds, --stale or --all")
+    seeds = set(args.seeds) if args.seeds and not args.all else None
+    removed, freed = catalog.evict(seeds, args.stale and not args.all)
+    print(f"{removed} entries removed, {freed / 2 ** 20:.1f} MiB freed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,946 @@
+# Headless rules core for the Wild West Duel game.
+# Everything in this module runs without pygame or a display: terrain,
+# bullets, duelists and the full round state machine that used to live
+# inline in duel_game.main(). The interactive game renders on top of it.
+import math
+import random
+import zlib
+from bisect import bisect_right
+
+import numpy as np
+
+# Screen dimensions
+WIDTH, HEIGHT = 1920, 1080
+
+# Colors
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+GREEN = (0, 255, 0)
+BROWN = (139, 69, 19)
+SKY_BLUE = (135, 206, 235)
+YELLOW = (255, 255, 0)
+DARK_GRAY = (50, 50, 50)
+
+# Physics constants
+GRAVITY = 0.3  # Reduced gravity to account for longer distances
+BASE_GROUND_LEVEL = HEIGHT - 200  # Base ground level for higher resolution
+
+# Terrain generation parameters
+MAX_HILL_HEIGHT = 250  # Maximum height of hills
+MIN_HILL_HEIGHT = 30   # Minimum height of hills
+HILL_WIDTH_RANGE = (100, 300)  # Range of hill widths
+CENTER_GAP = 600  # Gap in the center to ensure line of sight
+
+# Bump whenever generate_terrain changes which hills a seed produces, so
+# cached data about seeded terrains (see duel_catalog) is rebuilt
+TERRAIN_VERSION = 1
+
+# Hit zones and the damage each one deals
+ZONE_MISS = 0
+ZONE_BODY = 1
+ZONE_HEAD = 2
+ZONE_DAMAGE = (0, 20, 40)  # Indexed by zone
+HEAD_RADIUS = 12
+HEAD_OFFSET = 10  # Head center sits this far above the body
+
+# Duelist starting positions (in a one-screen world; the NPC always stands
+# the same distance from the right edge of the world)
+PLAYER_X = 50
+NPC_X = WIDTH - 110
+
+# Worlds wider than the screen get an extra hill about every this many pixels
+WIDE_WORLD_HILL_SPACING = 900
+
+# Simulation timing - the core runs on a virtual clock of FPS frames per second
+# so the millisecond timings below behave exactly like they do at 60 fps
+FPS = 60
+COUNTDOWN_MS = 1000  # Time each countdown digit is shown
+RESULT_DELAY_MS = 2000  # Pause after a round before the next one starts
+KEY_REPEAT_INTERVAL_MS = 30  # ms from a press to the first repeat, and between repeats
+NPC_AIM_INTERVAL_MS = 300  # Time between NPC aim adjustments (ms)
+
+# Per-frame input bits fed to DuelSimulation.step
+INPUT_UP = 1  # UP arrow held
+INPUT_DOWN = 2  # DOWN arrow held
+INPUT_READY = 4  # SPACE pressed this frame
+INPUT_RESTART = 8  # R pressed this frame
+INPUT_UP_PRESSED = 16  # UP arrow went down this frame
+INPUT_DOWN_PRESSED = 32  # DOWN arrow went down this frame
+
+def aim_key_presses(inputs, previous_held):
+    # Aim keys (as INPUT_UP/INPUT_DOWN bits) that went down this frame: rising
+    # edges of the held bits, plus the press bits, which keep two taps on
+    # consecutive frames apart when the held bits alone look like one hold
+    pressed = inputs & (INPUT_UP | INPUT_DOWN) & ~previous_held
+    if inputs & INPUT_UP_PRESSED:
+        pressed |= INPUT_UP
+    if inputs & INPUT_DOWN_PRESSED:
+        pressed |= INPUT_DOWN
+    return pressed
+
+# Terrain class to handle the ground and hills
+class Terrain:
+    def __init__(self, rng=None, width=WIDTH, seed=None):
+        # Random source for hill generation (defaults to the global random
+        # module). A seed names the terrain instead: it is generated from its
+        # own random.Random(seed), which gives the same hills as the first game
+        # of a DuelSimulation seeded with seed.
+        self.seed = seed
+        if seed is not None:
+            rng = random.Random(seed)
+        self.rng = rng if rng is not None else random
+        self.ground_level = BASE_GROUND_LEVEL
+
+        # World width in pixels; bullets beyond either end are gone
+        self.width = width
+        self.npc_x = width - (WIDTH - NPC_X)
+        self.hills = []  # List of hills [(x, y, width, height), ...]
+        self.generate_terrain()
+
+    def generate_terrain(self):
+        rng = self.rng
+        self.hills = []
+
+        # Generate left hill (player side) - ensure player is on a hill
+        left_hill_height = rng.randint(MIN_HILL_HEIGHT, MAX_HILL_HEIGHT)
+        left_hill_width = rng.randint(*HILL_WIDTH_RANGE)
+        # Position the hill so the player is centered on it
+        player_x = PLAYER_X
+        left_hill_x = max(0, player_x - left_hill_width // 2)
+        self.hills.append((left_hill_x, BASE_GROUND_LEVEL - left_hill_height, left_hill_width, left_hill_height))
+
+        # Generate right hill (NPC side) - ensure NPC is on a hill
+        right_hill_height = rng.randint(MIN_HILL_HEIGHT, MAX_HILL_HEIGHT)
+        right_hill_width = rng.randint(*HILL_WIDTH_RANGE)
+        # Position the hill so the NPC is centered on it
+        npc_x = self.npc_x
+        right_hill_x = max(0, npc_x - right_hill_width // 2)
+        self.hills.append((right_hill_x, BASE_GROUND_LEVEL - right_hill_height, right_hill_width, right_hill_height))
+
+        # Randomly decide if we add a middle hill (with lower height to not block view)
+        if rng.random() < 0.3:  # 30% chance
+            middle_hill_height = rng.randint(MIN_HILL_HEIGHT, MIN_HILL_HEIGHT + 20)
+            middle_hill_width = rng.randint(100, 200)
+            middle_hill_x = self.width // 2 - middle_hill_width // 2
+            self.hills.append((middle_hill_x, BASE_GROUND_LEVEL - middle_hill_height, middle_hill_width, middle_hill_height))
+
+        # Scatter more hills across worlds wider than one screen, clear of both duelists
+        if self.width > WIDTH:
+            left = player_x + HILL_WIDTH_RANGE[1]
+            right = npc_x - HILL_WIDTH_RANGE[1]
+            for slot_x in range(left, right - HILL_WIDTH_RANGE[1], WIDE_WORLD_HILL_SPACING):
+                hill_height = rng.randint(MIN_HILL_HEIGHT, (MIN_HILL_HEIGHT + MAX_HILL_HEIGHT) // 2)
+                hill_width = rng.randint(*HILL_WIDTH_RANGE)
+                hill_x = slot_x + rng.randint(0, WIDE_WORLD_HILL_SPACING - hill_width)
+                hill_x = min(hill_x, right - hill_width)
+                self.hills.append((hill_x, BASE_GROUND_LEVEL - hill_height, hill_width, hill_height))
+
+        self.build_height_index()
+
+    def build_height_index(self):
+        # Precompute the ground level of every integer column from x = 0 to the
+        # right edge of the furthest hill. Call again after editing self.hills.
+        extent = max([self.width] + [hill_x + hill_width for hill_x, _, hill_width, _ in self.hills])
+        heights = np.full(extent, BASE_GROUND_LEVEL, dtype=np.int32)
+
+        # Paint hills back to front so the first hill in the list wins where they overlap
+        for hill_x, hill_y, hill_width, hill_height in reversed(self.hills):
+            heights[max(hill_x, 0):max(hill_x + hill_width, 0)] = hill_y
+
+        self.heightmap = heights  # For vectorized lookups
+        self.column_heights = heights.tolist()  # Plain ints for fast scalar lookups
+
+        # x positions where the ground level changes (hill walls), including the
+        # drops back to base ground on either side of the indexed range
+        padded = np.concatenate(([BASE_GROUND_LEVEL], heights, [BASE_GROUND_LEVEL]))
+        self.height_edges = np.flatnonzero(np.diff(padded)).astype(float)
+        self.height_edge_list = self.height_edges.tolist()
+
+        # Highest ground anywhere; movements that stay above it can't touch the ground
+        self.ground_top = min(self.column_heights + [BASE_GROUND_LEVEL])
+
+    def get_ground_level_at(self, x):
+        # Return the ground level at position x
+        # Hill edges are whole pixels, so column int(x) decides for any x >= 0
+        if 0 <= x < len(self.column_heights):
+            return self.column_heights[int(x)]
+        return BASE_GROUND_LEVEL
+
+    def first_ground_contact(self, x0, y0, vx, vy):
+        # Earliest point where the movement from (x0, y0) to (x0 + vx, y0 + vy)
+        # goes below the ground, as (t, x, y) with t in [0, 1], or None.
+        # The ground is flat between hill walls, so the movement is split at
+        # every wall it crosses and each flat piece is tested on its own.
+        if y0 <= self.ground_top and y0 + vy <= self.ground_top:
+            return None
+        edges = self.height_edge_list
+        x1 = x0 + vx
+        t_start = 0.0
+        x_start = x0
+        ground = self.get_ground_level_at(x0)
+
+        if vx > 0:
+            i = bisect_right(edges, x0)
+            while i < len(edges) and edges[i] <= x1:
+                edge = edges[i]
+                t_edge = (edge - x0) / vx
+                contact = ground_piece_contact(x0, y0, vx, vy, x_start, t_start, t_edge, ground)
+                if contact:
+                    return contact
+                t_start, x_start = t_edge, edge
+                ground = self.get_ground_level_at(edge)
+                i += 1
+        elif vx < 0:
+            i = bisect_right(edges, x0) - 1
+            while i >= 0 and edges[i] > x1:
+                edge = edges[i]
+                t_edge = (edge - x0) / vx
+                contact = ground_piece_contact(x0, y0, vx, vy, x_start, t_start, t_edge, ground)
+                if contact:
+                    return contact
+                t_start, x_start = t_edge, edge
+                ground = self.get_ground_level_at(edge - 1)  # Column just left of the wall
+                i -= 1
+
+        return ground_piece_contact(x0, y0, vx, vy, x_start, t_start, 1.0, ground)
+
+    def ground_levels_at(self, xs):
+        # Vectorized get_ground_level_at over an array of x values
+        xs = np.asarray(xs, dtype=float)
+        inside = (xs >= 0) & (xs < len(self.heightmap))
+        columns = np.clip(xs, 0, len(self.heightmap) - 1).astype(np.intp)
+        return np.where(inside, self.heightmap[columns], BASE_GROUND_LEVEL).astype(float)
+
+def ground_piece_contact(x0, y0, vx, vy, x_start, t_start, t_end, ground):
+    # Contact with one flat stretch of ground crossed between t_start and t_end
+    y_start = y0 + vy * t_start
+    if y_start > ground:
+        return t_start, x_start, y_start  # Ran into a hill wall
+    if y0 + vy * t_end > ground:
+        t = (ground - y0) / vy
+        return t, x0 + vx * t, ground
+    return None
+
+def segment_circle_contact(x0, y0, vx, vy, center_x, center_y, radius):
+    # Earliest t in [0, 1] where (x0, y0) + t * (vx, vy) touches the circle
+    fx = x0 - center_x
+    fy = y0 - center_y
+    c = fx * fx + fy * fy - radius * radius
+    if c <= 0:
+        return 0.0  # Starts inside
+    a = vx * vx + vy * vy
+    b = 2 * (fx * vx + fy * vy)
+    discriminant = b * b - 4 * a * c
+    if a == 0 or discriminant < 0:
+        return None
+    t = (-b - math.sqrt(discriminant)) / (2 * a)
+    if 0 <= t <= 1:
+        return t
+    return None
+
+def segment_rect_contact(x0, y0, vx, vy, left, top, right, bottom):
+    # Earliest t in [0, 1] where (x0, y0) + t * (vx, vy) touches the rect
+    t_enter = 0.0
+    t_exit = 1.0
+    for start, velocity, low, high in ((x0, vx, left, right), (y0, vy, top, bottom)):
+        if velocity == 0:
+            if start < low or start > high:
+                return None
+        else:
+            t1 = (low - start) / velocity
+            t2 = (high - start) / velocity
+            if t1 > t2:
+                t1, t2 = t2, t1
+            t_enter = max(t_enter, t1)
+            t_exit = min(t_exit, t2)
+            if t_enter > t_exit:
+                return None
+    return t_enter
+
+# Without ballistics a bullet flies the original way (one Euler step under
+# GRAVITY per frame); a duel_physics.Ballistics object brings its own
+# integrator plus the weapon's drag and the wind.
+class Bullet:
+    def __init__(self, x, y, angle, speed, is_player, weapon=None, ballistics=None, wind=0.0):
+        self.x = x
+        self.y = y
+        self.angle = angle  # in degrees
+        self.speed = speed
+        self.is_player = is_player
+        self.active = True
+        self.radius = 2  # Larger bullet for higher resolution
+        self.trail = []  # Store positions for bullet trail
+        self.max_trail_length = 6  # Longer trail for better visibility at distance
+
+        # Movement of the last update as (x0, y0, vx, vy, t_end) for swept hit
+        # tests, t_end < 1 when the bullet stopped part way through the frame
+        self.sweep = None
+        self.hit_zone = ZONE_MISS
+        self.damage = 0
+        self.flight_frames = 0  # Updates spent in flight, for telemetry
+
+        # Weapon profile (see duel_physics.WEAPONS) and forces
+        self.damage_table = weapon.damage if weapon else ZONE_DAMAGE
+        self.drag = weapon.drag if weapon else 0.0
+        self.ballistics = ballistics
+        self.wind = wind
+
+        # Convert angle to radians and calculate velocity components
+        angle_rad = math.radians(angle)
+        # No need for direction multiplier since we're already using the correct angle for each character
+        self.vx = math.cos(angle_rad) * speed * (1 if is_player else -1)
+        self.vy = -math.sin(angle_rad) * speed  # Negative because y increases downward
+
+    def update(self, terrain):
+        self.sweep = None
+        if not self.active:
+            return
+        self.flight_frames += 1
+
+        # Store current position for trail
+        self.trail.append((self.x, self.y))
+        if len(self.trail) > self.max_trail_length:
+            self.trail.pop(0)
+
+        # Check if this frame's movement runs into the ground or a hill wall
+        x0, y0 = self.x, self.y
+        if self.ballistics:
+            dx, dy, next_vx, next_vy = self.ballistics.advance_one(self.vx, self.vy, self.drag, self.wind)
+        else:
+            # One Euler step: apply gravity to vertical velocity after moving,
+            # plus drag and wind when there are any (exactly as Ballistics'
+            # single-step Euler does them)
+            dx, dy = self.vx, self.vy
+            if self.drag or self.wind:
+                speed = math.sqrt(self.vx * self.vx + self.vy * self.vy)
+                next_vx = self.vx + (self.wind - self.drag * speed * self.vx)
+                next_vy = self.vy + (GRAVITY - self.drag * speed * self.vy)
+            else:
+                next_vx, next_vy = self.vx, self.vy + GRAVITY
+        contact = terrain.first_ground_contact(x0, y0, dx, dy)
+        if contact:
+            t_end, self.x, self.y = contact
+            self.active = False
+        else:
+            # Update position based on velocity
+            t_end = 1.0
+            self.x += dx
+            self.y += dy
+        self.sweep = (x0, y0, dx, dy, t_end)
+        self.vx, self.vy = next_vx, next_vy
+
+        # Check if bullet is out of bounds
+        if self.x < 0 or self.x > terrain.width:
+            self.active = False
+
+    def snapshot(self):
+        # Plain copy of the bullet's state (see DuelSimulation.snapshot)
+        state = dict(self.__dict__)
+        state["trail"] = list(self.trail)
+        return state
+
+    @classmethod
+    def from_snapshot(cls, state):
+        bullet = cls.__new__(cls)
+        bullet.__dict__.update(state)
+        bullet.trail = list(state["trail"])
+        return bullet
+
+    def check_hit(self, player):
+        # Test the whole movement of the last update, up to where it stopped
+        if self.sweep is None:
+            return False
+        x0, y0, vx, vy, t_end = self.sweep
+        contact = player.sweep_contact(x0, y0, vx, vy)
+        if contact is None or contact[0] > t_end:
+            return False
+
+        # Stop the bullet at the exact impact point
+        t, zone = contact
+        self.x = x0 + vx * t
+        self.y = y0 + vy * t
+        self.active = False
+        self.sweep = None
+
+        # Calculate damage based on hit location
+        self.hit_zone = zone
+        self.damage = self.damage_table[zone]
+        player.health -= self.damage
+        player.health = max(0, player.health)  # Ensure health doesn't go below 0
+        return True
+
+class Player:
+    # Class variable to store terrain reference
+    terrain = None
+
+    def __init__(self, x, y, color, is_player=False, weapon=None):
+        self.x = x
+        self.y = y
+        self.width = 30  # Reduced from 60 (half size)
+        self.height = 60  # Reduced from 120 (half size)
+        self.color = color
+        self.has_shot = False
+        self.shot_time = 0
+        self.bullet = None
+        self.health = 100  # Starting health
+        self.max_health = 100  # Maximum health
+        self.is_player = is_player
+        self.aim_y = y + 10  # Adjusted for upper body position (reduced)
+        self.aim_direction = 1 if is_player else -1  # 1 for right, -1 for left
+        self.aim_angle = 0  # Angle in degrees (0 is horizontal)
+        self.weapon = weapon  # duel_physics.WeaponProfile, None for the original revolver
+        self.bullet_velocity = weapon.muzzle_velocity if weapon else 45  # Increased for larger screen
+
+        # Arm and pistol properties - keeping these unchanged
+        self.arm_length = 35  # Keeping arm length unchanged
+        self.arm_width = 8  # Keeping arm width unchanged
+        self.pistol_length = 10  # Keeping pistol length unchanged
+        self.current_arm_angle = -70  # Start downward (-45 degrees), no direction multiplier
+        self.target_arm_angle = self.aim_angle  # Target angle for animation
+        self.arm_animation_speed = 3  # Increased speed for quicker draw
+
+        # Reticle properties
+        self.reticle_x = 0
+        self.reticle_y = 0
+        self.update_reticle_position()  # Initialize reticle position
+
+    def update_arm_animation(self):
+        # Animate the arm to move toward the target angle
+        if self.current_arm_angle != self.aim_angle:
+            # Calculate the difference
+            angle_diff = self.aim_angle - self.current_arm_angle
+
+            # Determine the direction and amount to move
+            if abs(angle_diff) < self.arm_animation_speed:
+                # If we're close enough, just set to the target
+                self.current_arm_angle = self.aim_angle
+            else:
+                # Otherwise move in the right direction
+                direction = 1 if angle_diff > 0 else -1
+                self.current_arm_angle += direction * self.arm_animation_speed
+    def adjust_aim_angle(self, direction):
+        # Adjust aim angle (up/down) with finer control (0.10 degrees per adjustment)
+        self.aim_angle += direction * 0.10
+        # Limit angle to reasonable range (0-60 degrees)
+        self.aim_angle = max(0, min(self.aim_angle, 60))
+
+        # Update aim_y based on angle for compatibility - adjusted for upper body position
+        self.aim_y = self.y + 10 - (self.aim_angle * 0.8)
+
+        # Update target arm angle for animation
+        self.target_arm_angle = self.aim_angle
+
+        # Calculate reticle position for visual feedback
+        self.update_reticle_position()
+
+    def adjust_aim_power(self, direction):
+        # Adjust aim power (stronger/weaker)
+        self.aim_power += direction
+        # Limit power to reasonable range
+        self.aim_power = max(self.min_power, min(self.aim_power, self.max_power))
+
+        # Update reticle position for visual feedback
+        self.update_reticle_position()
+
+    def update_reticle_position(self, terrain=None):
+        # Use class terrain if none provided
+        if terrain is None:
+            terrain = Player.terrain
+
+        # Calculate reticle position based on current angle and fixed velocity
+        angle_rad = math.radians(self.aim_angle)
+        distance_multiplier = 2.5  # Reduced from 5 to make reticle twice as close
+
+        # Calculate gun position
+        gun_x = self.x + self.width if self.is_player else self.x
+        gun_y = self.aim_y
+
+        # Calculate gun end point
+        gun_length = 20
+        gun_end_x = gun_x + (gun_length * math.cos(angle_rad) * self.aim_direction)
+        gun_end_y = gun_y - (gun_length * math.sin(angle_rad))
+
+        # Calculate reticle position using fixed bullet velocity
+        self.reticle_x = gun_end_x + (math.cos(angle_rad) * self.bullet_velocity * distance_multiplier * self.aim_direction)
+        self.reticle_y = gun_end_y - (math.sin(angle_rad) * self.bullet_velocity * distance_multiplier)
+
+        # Ensure reticle stays within screen bounds
+        self.reticle_x = max(0, min(self.reticle_x, terrain.width if terrain else WIDTH))
+
+        # If terrain is provided, ensure reticle doesn't go below ground
+        if terrain:
+            ground_level_at_reticle = terrain.get_ground_level_at(self.reticle_x)
+            self.reticle_y = min(self.reticle_y, ground_level_at_reticle - 10)  # Keep slightly above ground
+        else:
+            self.reticle_y = max(0, min(self.reticle_y, BASE_GROUND_LEVEL))
+    def pistol_tip(self, arm_angle=None):
+        # Return (x, y, bullet_angle) for a shot fired with the arm at arm_angle
+        if arm_angle is None:
+            arm_angle = self.current_arm_angle
+
+        # Calculate pistol position at the end of arm - using upper body position
+        arm_start_x = self.x + self.width // 2
+        arm_start_y = self.y + 10  # Upper part of body
+
+        # Calculate arm and pistol positions with correct angles for both player and NPC
+        if self.is_player:
+            arm_angle_rad = math.radians(arm_angle)
+        else:
+            arm_angle_rad = math.radians(180 - arm_angle)  # Flip angle for NPC
+        arm_end_x = arm_start_x + (self.arm_length * math.cos(arm_angle_rad))
+        arm_end_y = arm_start_y - (self.arm_length * math.sin(arm_angle_rad))
+
+        pistol_end_x = arm_end_x + (self.pistol_length * math.cos(arm_angle_rad))
+        pistol_end_y = arm_end_y - (self.pistol_length * math.sin(arm_angle_rad))
+
+        # Use original angle for the bullet, the direction is applied by Bullet
+        return pistol_end_x, pistol_end_y, arm_angle
+
+    def shoot(self, shot_time=0, ballistics=None, wind=0.0):
+        if not self.has_shot:
+            self.has_shot = True
+            self.shot_time = shot_time
+
+            pistol_end_x, pistol_end_y, bullet_angle = self.pistol_tip()
+
+            # Create bullet - using fixed velocity and correct angle
+            self.bullet = Bullet(pistol_end_x, pistol_end_y,
+                                bullet_angle, self.bullet_velocity, self.is_player,
+                                self.weapon, ballistics, wind)
+
+    def sweep_contact(self, x0, y0, vx, vy):
+        # Earliest contact of a movement with this duelist as (t, zone), or None.
+        # The head wins when it is touched at the same moment as the body.
+        x1 = x0 + vx
+        y1 = y0 + vy
+        center_x = self.x + self.width // 2
+        if (max(x0, x1) < min(self.x, center_x - HEAD_RADIUS) or
+                min(x0, x1) > max(self.x + self.width, center_x + HEAD_RADIUS) or
+                max(y0, y1) < self.y - HEAD_OFFSET - HEAD_RADIUS or
+                min(y0, y1) > self.y + self.height):
+            return None
+        head_t = segment_circle_contact(x0, y0, vx, vy, self.x + self.width // 2,
+                                        self.y - HEAD_OFFSET, HEAD_RADIUS)
+        body_t = segment_rect_contact(x0, y0, vx, vy, self.x, self.y,
+                                      self.x + self.width, self.y + self.height)
+        if head_t is not None and (body_t is None or head_t <= body_t):
+            return head_t, ZONE_HEAD
+        if body_t is not None:
+            return body_t, ZONE_BODY
+        return None
+
+    def snapshot(self):
+        # Plain copy of the duelist's state (see DuelSimulation.snapshot)
+        state = dict(self.__dict__)
+        if self.bullet:
+            state["bullet"] = self.bullet.snapshot()
+        return state
+
+    @classmethod
+    def from_snapshot(cls, state):
+        player = cls.__new__(cls)
+        player.__dict__.update(state)
+        if player.bullet:
+            player.bullet = Bullet.from_snapshot(state["bullet"])
+        return player
+
+    def update_bullet(self, terrain):
+        if self.bullet:
+            self.bullet.update(terrain)
+
+    def check_hit(self, other):
+        if self.bullet:
+            return self.bullet.check_hit(other)
+        return False
+
+# Full duel rules without any display: aiming, countdown, simultaneous shooting,
+# hit resolution, damage, rounds and game over. Call step() once per frame with
+# the INPUT_* bits held/pressed that frame, or simulate_round() to skip straight
+# to the outcome of a round when nothing needs to be animated.
+# With two_player=True the NPC doesn't aim by itself; a second player steers it
+# with the npc_inputs passed to step() and both have to be ready to start.
+# An npc_brain (see duel_ai.NpcBrain) picks the NPC's aim each round instead
+# of the random drift; the NPC takes that aim as soon as the round starts, so
+# step() and simulate_round() fire the same shot.
+# ballistics, weapons (player's, NPC's) and max_wind switch on the extended
+# projectile physics of duel_physics; each round then blows a random wind of
+# up to max_wind px/frame^2 either way.
+class DuelSimulation:
+    def __init__(self, rng=None, world_width=WIDTH, two_player=False, npc_brain=None,
+                 ballistics=None, weapons=None, max_wind=0.0, terrain_seed=None):
+        # Random source for terrain and NPC aim (defaults to the global random module)
+        self.rng = rng if rng is not None else random
+
+        # Play every game on the terrain with this seed instead of a random one
+        self.terrain_seed = terrain_seed
+
+        # Width of the battlefield, one screen by default
+        self.world_width = world_width
+        self.two_player = two_player
+        self.npc_brain = npc_brain if not two_player else None
+        self.npc_target_angle = None
+
+        # Projectile physics
+        self.ballistics = ballistics
+        self.weapons = weapons or (None, None)
+        self.max_wind = max_wind
+        self.wind = 0.0
+
+        # Virtual clock
+        self.frame = 0
+        self.current_time = 0
+
+        # Round counter, mostly useful for analysis
+        self.round_number = 1
+
+        # Optional per-phase frame profiler (see duel_profiler), None when off
+        self.profiler = None
+
+        # Optional per-round event stream (see duel_telemetry), None when off
+        self.telemetry = None
+        self.game_number = 0
+
+        # Key state tracking for continuous adjustments
+        self.held_inputs = 0
+        self.last_key_action_time = 0
+        self.npc_held_inputs = 0
+        self.npc_last_key_action_time = 0
+
+        self.new_game(first_game=True)
+
+    def new_game(self, first_game=False):
+        rng = self.rng
+        self.game_number += 1
+
+        # Create terrain
+        self.terrain = Terrain(rng, self.world_width, self.terrain_seed)
+
+        # Set the terrain in the Player class
+        Player.terrain = self.terrain
+
+        # Get ground levels for player and NPC positions
+        player_ground_level = self.terrain.get_ground_level_at(PLAYER_X + 30)  # Center of player (half width)
+        npc_ground_level = self.terrain.get_ground_level_at(self.terrain.npc_x + 30)  # Center of NPC (half width)
+
+        # Create player and NPC with positions based on terrain
+        self.player = Player(PLAYER_X, player_ground_level - 60, BLUE, is_player=True,
+                             weapon=self.weapons[0])  # Height is 60 now
+        self.npc = Player(self.terrain.npc_x, npc_ground_level - 60, RED, weapon=self.weapons[1])
+
+        # Game states: "aiming" -> "countdown" -> "shooting" -> "result" -> back to "aiming" or "game_over"
+        self.game_state = "aiming"
+        self.countdown_start = 0
+        self.countdown_value = 3
+        self.result_start_time = 0
+        self.winner = None
+        self.hit_message = None
+        self.round_number = 1
+        self.player_ready = False
+        self.npc_ready = False
+
+        # Randomize initial NPC aim
+        if first_game:
+            self.npc.aim_angle = rng.randint(5, 15)
+        else:
+            self.npc.aim_angle = rng.randint(5, 30)
+            # Make sure arms start in downward position
+            self.player.current_arm_angle = -45  # No direction multiplier
+            self.npc.current_arm_angle = -45  # No direction multiplier
+
+        # Initialize NPC aim behavior
+        self.npc_aim_angle_change = rng.choice([-1, 0, 1])
+        self.npc_last_aim_time = self.current_time
+        if self.max_wind:
+            self.wind = round(rng.uniform(-self.max_wind, self.max_wind), 3)
+        if self.npc_brain:
+            self.npc_target_angle = self.npc.aim_angle = self.npc_brain.choose_aim(self)
+
+    def reset_for_next_round(self):
+        player = self.player
+        npc = self.npc
+
+        # Reset bullets
+        player.bullet = None
+        npc.bullet = None
+        player.has_shot = False
+        npc.has_shot = False
+
+        # Keep the same terrain between rounds
+        # Just reset player positions to their original spots
+        player_ground_level = self.terrain.get_ground_level_at(PLAYER_X + 30)
+        npc_ground_level = self.terrain.get_ground_level_at(self.terrain.npc_x + 30)
+
+        # Update player positions
+        player.x = PLAYER_X
+        player.y = player_ground_level - 60
+        npc.x = self.terrain.npc_x
+        npc.y = npc_ground_level - 60
+
+        # Reset arm positions to downward position
+        player.current_arm_angle = -45  # No direction multiplier
+        npc.current_arm_angle = -45  # No direction multiplier
+
+        # Reset game state
+        self.game_state = "aiming"
+        self.hit_message = None
+        self.countdown_value = 3
+        self.round_number += 1
+        self.player_ready = False
+        self.npc_ready = False
+
+        # Randomize NPC aim for next round
+        npc.aim_angle = self.rng.randint(5, 30)
+
+        # Reset NPC aim behavior
+        self.npc_aim_angle_change = self.rng.choice([-1, 0, 1])
+        self.npc_last_aim_time = self.current_time
+        if self.max_wind:
+            self.wind = round(self.rng.uniform(-self.max_wind, self.max_wind), 3)
+        if self.npc_brain:
+            self.npc_target_angle = self.npc.aim_angle = self.npc_brain.choose_aim(self)
+
+    def step(self, inputs=0, npc_inputs=0):
+        # Advance the virtual clock by one frame
+        self.frame += 1
+        self.current_time = current_time = self.frame * 1000 / FPS
+        player = self.player
+        npc = self.npc
+        profiler = self.profiler
+
+        # Keys that went down this frame act immediately, like a KEYDOWN event,
+        # and start repeating once they have been held for a repeat interval
+        held = inputs & (INPUT_UP | INPUT_DOWN)
+        pressed = aim_key_presses(inputs, self.held_inputs)
+        self.held_inputs = held
+        if pressed:
+            self.last_key_action_time = current_time
+
+        # Same for the second player's keys in two-player mode
+        npc_held = npc_inputs & (INPUT_UP | INPUT_DOWN)
+        npc_pressed = aim_key_presses(npc_inputs, self.npc_held_inputs)
+        self.npc_held_inputs = npc_held
+        if npc_pressed:
+            self.npc_last_key_action_time = current_time
+
+        # Player controls during aiming - immediate response
+        if self.game_state == "aiming":
+            if pressed & INPUT_UP:
+                player.adjust_aim_angle(1)  # Increase angle
+            if pressed & INPUT_DOWN:
+                player.adjust_aim_angle(-1)  # Decrease angle
+            if npc_pressed & INPUT_UP:
+                npc.adjust_aim_angle(1)
+            if npc_pressed & INPUT_DOWN:
+                npc.adjust_aim_angle(-1)
+            if inputs & INPUT_READY:
+                self.player_ready = True
+            if npc_inputs & INPUT_READY:
+                self.npc_ready = True
+            # Start countdown when player is ready (and the second player too)
+            if self.player_ready and (self.npc_ready or not self.two_player):
+                self.game_state = "countdown"
+                self.countdown_start = current_time
+
+        # Game over controls
+        if self.game_state == "game_over" and (inputs | npc_inputs) & INPUT_RESTART:
+            # Reset game completely with new terrain
+            self.new_game()
+            player = self.player
+            npc = self.npc
+
+        # Handle continuous key presses for aiming adjustments
+        if self.game_state == "aiming" and current_time - self.last_key_action_time > KEY_REPEAT_INTERVAL_MS:
+            if held & INPUT_UP:
+                player.adjust_aim_angle(1)
+                self.last_key_action_time = current_time
+            elif held & INPUT_DOWN:
+                player.adjust_aim_angle(-1)
+                self.last_key_action_time = current_time
+        if self.game_state == "aiming" and current_time - self.npc_last_key_action_time > KEY_REPEAT_INTERVAL_MS:
+            if npc_held & INPUT_UP:
+                npc.adjust_aim_angle(1)
+                self.npc_last_key_action_time = current_time
+            elif npc_held & INPUT_DOWN:
+                npc.adjust_aim_angle(-1)
+                self.npc_last_key_action_time = current_time
+        if profiler:
+            profiler.lap("input_repeat")
+
+        # Update game state based on current state
+        if self.game_state == "aiming":
+            # NPC randomly adjusts aim periodically (unless a brain or a second player aims it)
+            if not self.npc_brain and not self.two_player and \
+                    current_time - self.npc_last_aim_time > NPC_AIM_INTERVAL_MS:
+                # Randomly change aim direction occasionally
+                if self.rng.random() < 0.3:
+                    self.npc_aim_angle_change = self.rng.choice([-1, 0, 1])
+
+                # Apply the changes
+                if self.npc_aim_angle_change != 0:
+                    npc.adjust_aim_angle(self.npc_aim_angle_change)
+
+                self.npc_last_aim_time = current_time
+            if profiler:
+                profiler.lap("npc_aim")
+
+        elif self.game_state == "countdown":
+            elapsed = current_time - self.countdown_start
+
+            # Animate arms to move toward target angle during countdown
+            player.target_arm_angle = player.aim_angle
+            npc.target_arm_angle = npc.aim_angle
+
+            # Update arm animations
+            player.update_arm_animation()
+            npc.update_arm_animation()
+            if profiler:
+                profiler.lap("arm_animation")
+
+            if elapsed < COUNTDOWN_MS:
+                self.countdown_value = 3
+            elif elapsed < 2 * COUNTDOWN_MS:
+                self.countdown_value = 2
+            elif elapsed < 3 * COUNTDOWN_MS:
+                self.countdown_value = 1
+            else:
+                self.fire()
+
+        elif self.game_state == "shooting":
+            self.update_shooting()
+
+        elif self.game_state == "result":
+            self.update_result()
+
+        if profiler:
+            profiler.lap("other")
+
+    def fire(self):
+        # Both shoot simultaneously after countdown
+        self.player.shoot(self.current_time, self.ballistics, self.wind)
+        self.npc.shoot(self.current_time, self.ballistics, self.wind)
+        self.game_state = "shooting"
+        self.countdown_value = "FIRE!"
+
+    def update_shooting(self):
+        player = self.player
+        npc = self.npc
+        profiler = self.profiler
+
+        # Update both bullets
+        player.update_bullet(self.terrain)
+        npc.update_bullet(self.terrain)
+        if profiler:
+            profiler.lap("bullet_update")
+
+        # Check for player hitting NPC
+        if player.check_hit(npc):
+            damage = player.bullet.damage
+            self.hit_message = f"Player hit NPC for {damage} damage!"
+
+        # Check for NPC hitting player
+        if npc.check_hit(player):
+            damage = npc.bullet.damage
+            if self.hit_message:
+                self.hit_message += f" NPC hit Player for {damage} damage!"
+            else:
+                self.hit_message = f"NPC hit Player for {damage} damage!"
+        if profiler:
+            profiler.lap("hit_checks")
+
+        # Check if both bullets are no longer active
+        bullets_done = ((not player.bullet or not player.bullet.active) and
+                       (not npc.bullet or not npc.bullet.active))
+
+        if bullets_done:
+            if not self.hit_message:
+                self.hit_message = "Both missed!"
+            self.game_state = "result"
+            # Store the time when we entered result state
+            self.result_start_time = self.current_time
+            if self.telemetry:
+                self.telemetry.record_round(self)
+
+    def update_result(self, wait=True):
+        # Check if anyone has died
+        if self.player.health <= 0 and self.npc.health <= 0:
+            self.winner = "Draw - Both died!"
+            self.game_state = "game_over"
+        elif self.player.health <= 0:
+            self.winner = "NPC"
+            self.game_state = "game_over"
+        elif self.npc.health <= 0:
+            self.winner = "Player"
+            self.game_state = "game_over"
+        # After 2 seconds, move to next round
+        elif not wait or self.current_time - self.result_start_time > RESULT_DELAY_MS:
+            self.reset_for_next_round()
+        if self.game_state == "game_over" and self.telemetry:
+            self.telemetry.record_game(self)
+
+    def snapshot(self):
+        # Copy of the whole match state, cheap enough to take every frame for
+        # rollback. Terrains never change once generated, so they are shared.
+        state = dict(self.__dict__)
+        state["rng_state"] = self.rng.getstate()
+        state["player"] = self.player.snapshot()
+        state["npc"] = self.npc.snapshot()
+        return state
+
+    def restore(self, state):
+        # Go back to a state taken with snapshot(); the snapshot stays reusable
+        state = dict(state)
+        state.pop("profiler", None)  # Keep whatever profiler and telemetry are attached now
+        state.pop("telemetry", None)
+        self.rng.setstate(state.pop("rng_state"))
+        state["player"] = Player.from_snapshot(state["player"])
+        state["npc"] = Player.from_snapshot(state["npc"])
+        self.__dict__.update(state)
+        Player.terrain = self.terrain
+
+    def checksum(self):
+        # CRC32 of everything that decides how the match plays out, used to
+        # check that a replay or a remote peer is still in sync
+        duelists = [(duelist.x, duelist.y, duelist.health, duelist.aim_angle, duelist.current_arm_angle,
+                     duelist.bullet and (duelist.bullet.x, duelist.bullet.y, duelist.bullet.active))
+                    for duelist in (self.player, self.npc)]
+        state = (self.frame, self.round_number, self.game_state, self.winner,
+                 self.terrain.hills, duelists)
+        if self.wind:
+            state += (self.wind,)
+        return zlib.crc32(repr(state).encode())
+
+    def simulate_round(self, player_angle=None, npc_angle=None):
+        # Resolve a whole round from the aiming phase without animating it.
+        # The quick-draw always finishes before the countdown ends, so arms
+        # snap straight to their aim and only the bullet flight is stepped.
+        if self.game_state != "aiming":
+            return None
+        player = self.player
+        npc = self.npc
+        if player_angle is not None:
+            player.aim_angle = player_angle
+        if npc_angle is not None:
+            npc.aim_angle = npc_angle
+        player.current_arm_angle = player.aim_angle
+        npc.current_arm_angle = npc.aim_angle
+
+        player_health = player.health
+        npc_health = npc.health
+        self.fire()
+        while self.game_state == "shooting":
+            self.frame += 1
+            self.current_time = self.frame * 1000 / FPS
+            self.update_shooting()
+        outcome = (player_health - player.health, npc_health - npc.health, self.hit_message)
+        self.update_result(wait=False)
+        return outcome
+
+    def simulate_game(self, player_angle=None, npc_angle=None, max_rounds=100):
+        # Play rounds until someone dies (or max_rounds pass) and return the winner
+        for _ in range(max_rounds):
+            if self.game_state == "game_over":
+                break
+            self.simulate_round(player_angle, npc_angle)
+        return self.winner
@@ -0,0 +1,391 @@
+# Gym-style environments for training duel agents.
+# DuelEnv plays one duel through DuelSimulation. VectorDuelEnv plays N
+# independent duels, each with its own terrain, duelists and shots, as rows of
+# NumPy arrays and steps them all at once. Given the same seeds and actions
+# both produce exactly the same observations, rewards and outcomes.
+#
+# An episode is one game. Every step takes one action for the agent's duelist:
+#   0 hold, 1 aim up 0.1 degrees, 2 aim down 0.1 degrees, 3 fire
+# While aiming, the other duelist drifts its aim like the NPC does in the game.
+# Firing resolves the whole round at once: both duelists shoot, as when the
+# countdown ends, and the next round starts on the following step. The reward
+# is (damage dealt - damage taken) / 100 and the episode is done once someone
+# has died or max_steps steps have passed.
+#
+#   env = VectorDuelEnv(1024, seed=0)
+#   observations = env.reset()
+#   observations, rewards, dones, info = env.step(actions)
+import math
+import random
+from collections import namedtuple
+
+import numpy as np
+
+from duel_batch import AIM_ANGLES, ZONE_DAMAGE, TerrainRows, player_contacts
+from duel_core import (
+    GRAVITY, HEAD_RADIUS, HEAD_OFFSET, MAX_HILL_HEIGHT, WIDTH, BLUE, RED, ZONE_MISS, DuelSimulation, Player,
+)
+from duel_replay import new_seed
+
+ACTION_HOLD = 0
+ACTION_UP = 1
+ACTION_DOWN = 2
+ACTION_FIRE = 3
+ACTION_COUNT = 4
+ACTION_AIM = np.array([0, 1, -1, 0])  # Aim change per action, in AIM_ANGLES steps
+
+PLAYER_SIDE = 0
+NPC_SIDE = 1
+
+# A step stands for one key repeat of the aim keys (two frames); the NPC
+# re-aims every 19 frames
+NPC_AIM_STEPS = 10
+NPC_DRIFT_CHANCE = 0.3
+
+# Observations, all from the agent's side and roughly in [-1, 1]
+OBSERVATION_FIELDS = (
+    "aim_angle", "opponent_aim_angle", "health", "opponent_health",
+    "height_difference", "own_hill_height", "opponent_hill_height", "obstacle_height", "distance",
+)
+
+# info["winner"] codes
+WINNERS = (None, "Player", "NPC", "Draw - Both died!")
+
+# Shooting geometry of a freshly created duelist on each side
+DUELISTS = (Player(0, 0, BLUE, is_player=True), Player(0, 0, RED))
+
+Targets = namedtuple("Targets", ["x", "y", "width", "height"])
+
+def launch_tables():
+    # Pieces of Player.pistol_tip and the Bullet launch velocity for every aim
+    # angle and side, computed with math exactly like the scalar code so the
+    # batched shots start bit-identical
+    arm_dx = np.empty((2, len(AIM_ANGLES)))
+    arm_dy = np.empty((2, len(AIM_ANGLES)))
+    pistol_dx = np.empty((2, len(AIM_ANGLES)))
+    pistol_dy = np.empty((2, len(AIM_ANGLES)))
+    vx = np.empty((2, len(AIM_ANGLES)))
+    vy = np.empty((2, len(AIM_ANGLES)))
+    for side, duelist in enumerate(DUELISTS):
+        for index, angle in enumerate(AIM_ANGLES.tolist()):
+            arm_angle_rad = math.radians(angle if duelist.is_player else 180 - angle)
+            arm_dx[side, index] = duelist.arm_length * math.cos(arm_angle_rad)
+            arm_dy[side, index] = duelist.arm_length * math.sin(arm_angle_rad)
+            pistol_dx[side, index] = duelist.pistol_length * math.cos(arm_angle_rad)
+            pistol_dy[side, index] = duelist.pistol_length * math.sin(arm_angle_rad)
+            angle_rad = math.radians(angle)
+            vx[side, index] = math.cos(angle_rad) * duelist.bullet_velocity * (1 if duelist.is_player else -1)
+            vy[side, index] = -math.sin(angle_rad) * duelist.bullet_velocity
+    return arm_dx, arm_dy, pistol_dx, pistol_dy, vx, vy
+
+ARM_DX, ARM_DY, PISTOL_DX, PISTOL_DY, LAUNCH_VX, LAUNCH_VY = launch_tables()
+
+def counter_random(keys, counters):
+    # Uniform numbers in [0, 1) from a counter-based generator (SplitMix64):
+    # number counters[i] of the stream keys[i]. Every duel gets its own
+    # reproducible stream however duels are batched.
+    z = keys + (counters.astype(np.uint64) + np.uint64(1)) * np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+def drift_key(seed):
+    return np.uint64(seed & 0xFFFFFFFFFFFFFFFF)
+
+def aim_index(angle):
+    # AIM_ANGLES index of a whole-degree or tenth-of-a-degree angle
+    return int(round(angle * 10))
+
+def terrain_features(sim, agent_side):
+    # Terrain part of the observation for the game sim has just set up
+    terrain = sim.terrain
+    hills = [hill[3] for hill in terrain.hills]
+    duelists = (sim.player, sim.npc)
+    own = duelists[agent_side]
+    opponent = duelists[1 - agent_side]
+    sides = (hills[0], hills[1])
+    return np.array([
+        (opponent.y - own.y) / MAX_HILL_HEIGHT,
+        sides[agent_side] / MAX_HILL_HEIGHT,
+        sides[1 - agent_side] / MAX_HILL_HEIGHT,
+        max(hills[2:], default=0) / MAX_HILL_HEIGHT,
+        (sim.npc.x - sim.player.x) / WIDTH,
+    ])
+
+# One duel through DuelSimulation, also the reference for VectorDuelEnv
+class DuelEnv:
+    def __init__(self, seed=None, agent_side=PLAYER_SIDE, max_steps=2000, world_width=WIDTH):
+        self.agent_side = agent_side
+        self.max_steps = max_steps
+        self.world_width = world_width
+        self.seed = seed
+        self.sim = None
+
+    def reset(self, seed=None):
+        # Start a game: on a new seed when given one (or on the first reset),
+        # otherwise the next game of the same DuelSimulation, as after R
+        if seed is not None or self.sim is None:
+            if seed is None:
+                seed = self.seed if self.seed is not None else new_seed()
+            self.seed = seed
+            self.sim = DuelSimulation(random.Random(seed), self.world_width)
+            self.drift_key = np.array([drift_key(seed)])
+            self.drift_count = 0
+        else:
+            self.sim.new_game()
+        self.angles = [0, aim_index(self.sim.npc.aim_angle)]
+        self.drift = self.sim.npc_aim_angle_change
+        self.round_steps = 0
+        self.game_steps = 0
+        self.features = terrain_features(self.sim, self.agent_side)
+        return self.observation()
+
+    def observation(self):
+        side = self.agent_side
+        duelists = (self.sim.player, self.sim.npc)
+        return np.concatenate((
+            [self.angles[side] / 600, self.angles[1 - side] / 600,
+             duelists[side].health / 100, duelists[1 - side].health / 100],
+            self.features,
+        )).astype(np.float32)
+
+    def step(self, action):
+        sim = self.sim
+        side = self.agent_side
+        self.round_steps += 1
+        self.game_steps += 1
+        reward = 0.0
+        if action == ACTION_FIRE:
+            player_taken, npc_taken, _ = sim.simulate_round(float(AIM_ANGLES[self.angles[PLAYER_SIDE]]),
+                                                            float(AIM_ANGLES[self.angles[NPC_SIDE]]))
+            taken = (player_taken, npc_taken)
+            reward = (taken[1 - side] - taken[side]) / 100
+            if sim.game_state != "game_over":
+                self.angles[NPC_SIDE] = aim_index(sim.npc.aim_angle)
+                self.drift = sim.npc_aim_angle_change
+                self.round_steps = 0
+        else:
+            self.angles[side] = max(0, min(self.angles[side] + int(ACTION_AIM[action]), len(AIM_ANGLES) - 1))
+            if self.round_steps % NPC_AIM_STEPS == 0:
+                # Same drift as DuelSimulation.step gives the NPC
+                count = np.array([2 * self.drift_count])
+                if counter_random(self.drift_key, count)[0] < NPC_DRIFT_CHANCE:
+                    self.drift = int(counter_random(self.drift_key, count + 1)[0] * 3) - 1
+                self.drift_count += 1
+                other = 1 - side
+                self.angles[other] = max(0, min(self.angles[other] + self.drift, len(AIM_ANGLES) - 1))
+
+        game_over = sim.game_state == "game_over"
+        done = game_over or self.game_steps >= self.max_steps
+        info = {"winner": sim.winner if game_over else None, "truncated": done and not game_over,
+                "round": sim.round_number}
+        return self.observation(), reward, done, info
+
+# N duels stepped together; finished games are reset automatically
+class VectorDuelEnv:
+    def __init__(self, num_envs, seed=None, agent_side=PLAYER_SIDE, max_steps=2000, world_width=WIDTH):
+        self.num_envs = num_envs
+        self.agent_side = agent_side
+        self.max_steps = max_steps
+        self.world_width = world_width
+        self.seed = seed
+
+        # Every duel keeps a DuelSimulation for its random source and terrain;
+        # it is only touched when a round or game starts
+        self.sims = [None] * num_envs
+        self.terrain = TerrainRows(num_envs)
+        self.features = np.zeros((num_envs, 5))
+        self.x = np.zeros((2, num_envs))  # Per side, top left of the duelist
+        self.y = np.zeros((2, num_envs))
+        self.angles = np.zeros((2, num_envs), dtype=np.intp)  # Per side, AIM_ANGLES index
+        self.health = np.zeros((2, num_envs))
+        self.drift = np.zeros(num_envs, dtype=np.intp)
+        self.drift_keys = np.zeros(num_envs, dtype=np.uint64)
+        self.drift_count = np.zeros(num_envs, dtype=np.int64)
+        self.round_steps = np.zeros(num_envs, dtype=np.int64)
+        self.game_steps = np.zeros(num_envs, dtype=np.int64)
+        self.round_number = np.zeros(num_envs, dtype=np.int64)
+
+        # Hit zone of every (side, aim angle) shot on each duel's current
+        # terrain, filled in as shots are fired (-1 = not flown yet). Duelists
+        # stand still, so a shot always ends the same way on the same terrain.
+        self.zones = np.full((num_envs, 2, len(AIM_ANGLES)), -1, dtype=np.int8)
+        self.width = DUELISTS[0].width
+        self.height = DUELISTS[0].height
+
+    def reset(self, seed=None):
+        # Start a game in every duel; duel i gets seed + i
+        if seed is None:
+            seed = self.seed if self.seed is not None else new_seed()
+        self.seed = seed
+        for index in range(self.num_envs):
+            self.sims[index] = DuelSimulation(random.Random(seed + index), self.world_width)
+            self.drift_keys[index] = drift_key(seed + index)
+        self.drift_count[:] = 0
+        self.start_games(np.arange(self.num_envs), new_games=False)
+        return self.observations()
+
+    def start_games(self, indices, new_games=True):
+        for index in indices.tolist():
+            sim = self.sims[index]
+            if new_games:
+                sim.new_game()
+            self.terrain.set(index, sim.terrain)
+            self.features[index] = terrain_features(sim, self.agent_side)
+            for side, duelist in enumerate((sim.player, sim.npc)):
+                self.x[side, index] = duelist.x
+                self.y[side, index] = duelist.y
+            self.angles[NPC_SIDE, index] = aim_index(sim.npc.aim_angle)
+            self.drift[index] = sim.npc_aim_angle_change
+        self.angles[PLAYER_SIDE, indices] = 0
+        self.health[:, indices] = DUELISTS[0].max_health
+        self.round_steps[indices] = 0
+        self.game_steps[indices] = 0
+        self.round_number[indices] = 1
+        self.zones[indices] = -1
+
+    def observations(self):
+        side = self.agent_side
+        observations = np.empty((self.num_envs, len(OBSERVATION_FIELDS)), dtype=np.float32)
+        observations[:, 0] = self.angles[side] / 600
+        observations[:, 1] = self.angles[1 - side] / 600
+        observations[:, 2] = self.health[side] / 100
+        observations[:, 3] = self.health[1 - side] / 100
+        observations[:, 4:] = self.features
+        return observations
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        side = self.agent_side
+        other = 1 - side
+        last_angle = len(AIM_ANGLES) - 1
+        self.round_steps += 1
+        self.game_steps += 1
+
+        # Aim the agent's duelist
+        fire = actions == ACTION_FIRE
+        np.clip(self.angles[side] + ACTION_AIM[actions], 0, last_angle, out=self.angles[side])
+
+        # Drift the other one where it's time to
+        drifting = np.flatnonzero(~fire & (self.round_steps % NPC_AIM_STEPS == 0))
+        if drifting.size:
+            keys = self.drift_keys[drifting]
+            count = 2 * self.drift_count[drifting]
+            reroll = counter_random(keys, count) < NPC_DRIFT_CHANCE
+            new_drift = (counter_random(keys, count + 1) * 3).astype(np.intp) - 1
+            self.drift[drifting] = np.where(reroll, new_drift, self.drift[drifting])
+            self.drift_count[drifting] += 1
+            self.angles[other, drifting] = np.clip(self.angles[other, drifting] + self.drift[drifting], 0, last_angle)
+
+        # Resolve the rounds of the duels that fired
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        game_over = np.zeros(self.num_envs, dtype=bool)
+        winners = np.zeros(self.num_envs, dtype=np.int8)
+        fired = np.flatnonzero(fire)
+        if fired.size:
+            damage = ZONE_DAMAGE[self.shot_zones(fired)]  # Per side, damage dealt
+            health = self.health[:, fired]
+            self.health[:, fired] = np.maximum(0, health - damage[::-1])
+            taken = health - self.health[:, fired]  # Per side, health lost
+            rewards[fired] = (taken[other] - taken[side]) / 100
+
+            dead = self.health[:, fired] <= 0
+            winners[fired] = np.where(dead[0] & dead[1], 3, np.where(dead[0], 2, np.where(dead[1], 1, 0)))
+            game_over[fired] = dead[0] | dead[1]
+
+            # Next round for the others, with the NPC's new aim from the same
+            # random draws DuelSimulation.reset_for_next_round makes
+            next_round = fired[~game_over[fired]]
+            for index in next_round.tolist():
+                rng = self.sims[index].rng
+                self.angles[NPC_SIDE, index] = rng.randint(5, 30) * 10
+                self.drift[index] = rng.choice([-1, 0, 1])
+            self.round_steps[next_round] = 0
+            self.round_number[next_round] += 1
+
+        dones = game_over | (self.game_steps >= self.max_steps)
+        info = {"winner": winners, "truncated": dones & ~game_over, "round": self.round_number.copy()}
+        observations = self.observations()
+        finished = np.flatnonzero(dones)
+        if finished.size:
+            info["final_observations"] = observations[finished]
+            info["finished"] = finished
+            self.start_games(finished)
+            observations[finished] = self.observations()[finished]
+        return observations, rewards, dones, info
+
+    def shot_zones(self, fired):
+        # Zone hit by each side's shot in the duels that fired, flying only the
+        # shots not seen on that terrain before
+        angles = self.angles[:, fired]
+        zones = np.stack((self.zones[fired, PLAYER_SIDE, angles[PLAYER_SIDE]],
+                          self.zones[fired, NPC_SIDE, angles[NPC_SIDE]]))
+        unknown_side, unknown = np.nonzero(zones < 0)
+        if unknown.size:
+            envs = fired[unknown]
+            flown = self.fly(envs, unknown_side, angles[unknown_side, unknown])
+            zones[unknown_side, unknown] = flown
+            self.zones[envs, unknown_side, angles[unknown_side, unknown]] = flown
+        return zones
+
+    def fly(self, envs, sides, angles):
+        # Fly one shot per entry, from duelist sides[i] of duel envs[i] at the
+        # other one, like Bullet.update and Bullet.check_hit frame by frame
+        x = (self.x[sides, envs] + self.width // 2 + ARM_DX[sides, angles]) + PISTOL_DX[sides, angles]
+        y = (self.y[sides, envs] + 10 - ARM_DY[sides, angles]) - PISTOL_DY[sides, angles]
+        vx = LAUNCH_VX[sides, angles]
+        vy = LAUNCH_VY[sides, angles]
+        target_x = self.x[1 - sides, envs]
+        target_y = self.y[1 - sides, envs]
+
+        zone = np.full(envs.size, ZONE_MISS, dtype=np.int8)
+        ids = np.arange(envs.size)
+        terrain = self.terrain
+        width = self.width
+        height = self.height
+        while ids.size:
+            x0 = x
+            y0 = y
+            x1 = x0 + vx
+            y1 = y0 + vy
+
+            # Ground and hill walls
+            x = x1
+            y = y1
+            landed = np.zeros(ids.size, dtype=bool)
+            t_end = np.ones(ids.size)
+            near = np.flatnonzero(np.maximum(y0, y1) > terrain.ground_top[envs])
+            if near.size:
+                near_landed, near_t, near_x, near_y = terrain.ground_contacts(
+                    envs[near], x0[near], y0[near], vx[near], vy[near])
+                landed[near] = near_landed
+                t_end[near] = np.where(near_landed, near_t, 1.0)
+                x[near] = near_x
+                y[near] = near_y
+            done = landed | (x < 0) | (x > terrain.width[envs])
+
+            # The other duelist, up to where the shot stopped
+            center_x = target_x + width // 2
+            near = np.flatnonzero((np.maximum(x0, x1) >= np.minimum(target_x, center_x - HEAD_RADIUS)) &
+                                  (np.minimum(x0, x1) <= np.maximum(target_x + width, center_x + HEAD_RADIUS)) &
+                                  (np.maximum(y0, y1) >= target_y - HEAD_OFFSET - HEAD_RADIUS) &
+                                  (np.minimum(y0, y1) <= target_y + height))
+            if near.size:
+                targets = Targets(target_x[near], target_y[near], width, height)
+                t_hit, hit_zone = player_contacts(targets, x0[near], y0[near], vx[near], vy[near])
+                hit = t_hit <= t_end[near]
+                zone[ids[near[hit]]] = hit_zone[hit]
+                done[near[hit]] = True
+
+            vy = vy + GRAVITY
+            keep = ~done
+            ids = ids[keep]
+            envs = envs[keep]
+            x = x[keep]
+            y = y[keep]
+            vx = vx[keep]
+            vy = vy[keep]
+            target_x = target_x[keep]
+            target_y = target_y[keep]
+        return zone
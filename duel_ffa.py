@@ -0,0 +1,391 @@
+# Free-for-all: any number of duelists on one wide battlefield.
+# Every duelist stands on a hill of its own, turns toward the nearest
+# opponent still standing at the start of each round, and everyone fires at
+# once when the countdown ends. Shots fly in a ProjectilePool and are tested
+# against the duelists through its broad phase, so a frame costs about the
+# same with 4 duelists as with 100. A duelist can take several hits in one
+# round; everyone at 0 health once the last shot has landed is eliminated,
+# and the last one standing wins.
+#
+# The first duelist is the local player, steered with the same INPUT_* bits
+# as DuelSimulation.step (human=False makes it an NPC too). NPCs pick a
+# random angle every round, or aim at their opponent with duel_ai's solver
+# when given a difficulty. Solving takes a sizeable fraction of a frame, so
+# step() works out one NPC's aim per frame while the others aim and count
+# down, and a new opponent costs one solve. Shots use the built-in physics.
+#
+#   python duel_ffa.py --duelists 8 32 128 --games 5
+#   python duel_game.py --free-for-all 24
+import argparse
+import bisect
+import json
+import random
+import sys
+import time
+
+import numpy as np
+
+from duel_ai import DIFFICULTY_AIM_ERROR, AimSolver, add_aim_error
+from duel_core import (
+    WIDTH, NPC_X, PLAYER_X, BLUE, RED, MIN_HILL_HEIGHT, MAX_HILL_HEIGHT, HILL_WIDTH_RANGE, BASE_GROUND_LEVEL,
+    FPS, COUNTDOWN_MS, RESULT_DELAY_MS, KEY_REPEAT_INTERVAL_MS, ZONE_DAMAGE,
+    INPUT_UP, INPUT_DOWN, INPUT_READY, INPUT_RESTART, Player, Terrain, aim_key_presses,
+)
+from duel_projectiles import ProjectilePool, TargetIndex
+
+# Narrowest gap between neighbouring duelists; the world is widened to fit
+MIN_SPACING = 320
+
+# Random NPC aim range in degrees, as in the two-player game
+NPC_AIM_RANGE = (5, 30)
+
+def world_width_for(duelists, world_width=WIDTH):
+    # Smallest world at least world_width wide with room for every duelist
+    return max(world_width, PLAYER_X + (duelists - 1) * MIN_SPACING + (WIDTH - NPC_X))
+
+def face(duelist, target):
+    # Turn duelist toward target. Player.is_player only decides which way a
+    # duelist faces and shoots (the left-hand duelist of a duel faces right).
+    duelist.is_player = target.x > duelist.x
+    duelist.aim_direction = 1 if duelist.is_player else -1
+
+class FreeForAll:
+    def __init__(self, rng=None, duelists=8, world_width=WIDTH, human=True, difficulty=None):
+        if duelists < 2:
+            raise ValueError("a free-for-all needs at least two duelists")
+        # Random source for terrain and NPC aim (defaults to the global random module)
+        self.rng = rng if rng is not None else random
+        self.count = duelists
+        self.world_width = world_width_for(duelists, world_width)
+        self.human = human
+
+        # NPC aim: random, or the solver with the difficulty's aim error
+        self.difficulty = difficulty
+        if difficulty is not None and difficulty not in DIFFICULTY_AIM_ERROR:
+            raise ValueError(f"unknown difficulty {difficulty!r}")
+        self.solver = AimSolver(max_cached=4 * duelists) if difficulty else None
+
+        # Every duelist fires one shot per round
+        self.pool = ProjectilePool(max(16, duelists))
+
+        # Virtual clock
+        self.frame = 0
+        self.current_time = 0
+
+        # Optional per-phase frame profiler (see duel_profiler), None when off
+        self.profiler = None
+
+        # Key state tracking for continuous adjustments
+        self.held_inputs = 0
+        self.last_key_action_time = 0
+
+        self.new_game()
+
+    def new_game(self):
+        rng = self.rng
+        count = self.count
+
+        # Duelists spread evenly from the player's spot to the NPC's, each on
+        # its own hill. The generated hills stay in between as cover; the
+        # duelists' hills come first so they decide the ground where they overlap.
+        span = self.world_width - PLAYER_X - (WIDTH - NPC_X)
+        slots = [PLAYER_X + round(index * span / (count - 1)) for index in range(count)]
+        terrain = Terrain(rng, self.world_width)
+        hills = []
+        for x in slots:
+            hill_height = rng.randint(MIN_HILL_HEIGHT, MAX_HILL_HEIGHT)
+            hill_width = rng.randint(*HILL_WIDTH_RANGE)
+            hills.append((max(0, x + 15 - hill_width // 2), BASE_GROUND_LEVEL - hill_height, hill_width, hill_height))
+        terrain.hills = hills + terrain.hills[2:]
+        terrain.build_height_index()
+        self.terrain = terrain
+        Player.terrain = terrain
+
+        self.duelists = [Player(x, terrain.get_ground_level_at(x + 30) - 60,
+                                BLUE if self.human and index == 0 else RED, is_player=True)
+                         for index, x in enumerate(slots)]
+        self.player = self.duelists[0]
+
+        # Indices of the duelists still standing, in x order, and their x
+        # positions for bisecting
+        self.alive = list(range(count))
+        self.alive_x = [duelist.x for duelist in self.duelists]
+        self.eliminations = []  # (round, [duelists]) for every round that eliminated someone
+        self.game_state = "aiming"
+        self.round_number = 1
+        self.winner = None
+        self.start_round()
+
+    def nearest_opponent(self, index):
+        # Closest standing duelist to index; duelists are in x order, so it is
+        # a neighbour in self.alive
+        alive = self.alive
+        position = bisect.bisect_left(alive, index)
+        neighbours = [alive[position - 1]] if position > 0 else []
+        if position + 1 < len(alive):
+            neighbours.append(alive[position + 1])
+        x = self.duelists[index].x
+        return min(neighbours, key=lambda other: abs(self.duelists[other].x - x))
+
+    def start_round(self):
+        self.pool.clear()
+        self.game_state = "aiming"
+        self.countdown_value = 3
+        self.countdown_start = 0
+        self.result_start_time = 0
+        self.hit_message = None
+        self.round_hits = []  # (shooter, target, zone) of every hit this round
+        self.player_ready = False
+        self.player_shot = None  # Pool row of the local player's shot
+        self.pending_aims = []  # NPCs still waiting for the solver, solved in order
+
+        # Everyone turns toward their nearest opponent and picks an aim
+        self.opponents = {}
+        for index in self.alive:
+            duelist = self.duelists[index]
+            opponent = self.nearest_opponent(index)
+            self.opponents[index] = opponent
+            face(duelist, self.duelists[opponent])
+            duelist.bullet = None
+            duelist.has_shot = False
+            duelist.current_arm_angle = -45
+            if index == 0 and self.human:
+                duelist.update_reticle_position(self.terrain)
+            elif self.solver:
+                self.pending_aims.append(index)
+            else:
+                duelist.aim_angle = round(self.rng.uniform(*NPC_AIM_RANGE), 1)
+        self.pending_aims.reverse()  # Popped from the end
+
+    def solve_pending(self, limit=None):
+        # Aim up to limit (default all) of the NPCs waiting for the solver
+        while self.pending_aims and limit != 0:
+            index = self.pending_aims.pop()
+            duelist = self.duelists[index]
+            opponent = self.duelists[self.opponents[index]]
+            # Aim angles go up to 60 degrees, so shots cross at least half their
+            # speed sideways each frame; one that hasn't hit by the time it is
+            # past the opponent never will, however long it flies on
+            reach = abs(opponent.x - duelist.x) + 2 * (duelist.width + duelist.arm_length + duelist.pistol_length)
+            max_frames = int(reach / (duelist.bullet_velocity / 2)) + 1
+            angle = self.solver.best_angle(duelist, opponent, self.terrain, max_frames=max_frames)
+            duelist.aim_angle = add_aim_error(angle, DIFFICULTY_AIM_ERROR[self.difficulty], self.rng)
+            if limit is not None:
+                limit -= 1
+
+    def player_alive(self):
+        return self.human and self.player.health > 0
+
+    def step(self, inputs=0):
+        # Advance the virtual clock by one frame with the local player's input bits
+        self.frame += 1
+        self.current_time = current_time = self.frame * 1000 / FPS
+        player = self.player
+        profiler = self.profiler
+
+        # Keys that went down this frame act immediately, like a KEYDOWN event
+        held = inputs & (INPUT_UP | INPUT_DOWN)
+        pressed = aim_key_presses(inputs, self.held_inputs)
+        self.held_inputs = held
+        if pressed:
+            self.last_key_action_time = current_time
+
+        if self.game_state == "aiming":
+            if self.player_alive():
+                if pressed & INPUT_UP:
+                    player.adjust_aim_angle(1)
+                if pressed & INPUT_DOWN:
+                    player.adjust_aim_angle(-1)
+                if current_time - self.last_key_action_time > KEY_REPEAT_INTERVAL_MS:
+                    if held & INPUT_UP:
+                        player.adjust_aim_angle(1)
+                        self.last_key_action_time = current_time
+                    elif held & INPUT_DOWN:
+                        player.adjust_aim_angle(-1)
+                        self.last_key_action_time = current_time
+                if inputs & INPUT_READY:
+                    self.player_ready = True
+            else:
+                self.player_ready = True  # Nobody to wait for
+            if self.player_ready:
+                self.game_state = "countdown"
+                self.countdown_start = current_time
+        elif self.game_state == "game_over" and inputs & INPUT_RESTART:
+            self.new_game()
+        if profiler:
+            profiler.lap("input_repeat")
+
+        if self.pending_aims and self.game_state in ("aiming", "countdown"):
+            self.solve_pending(1)
+            if profiler:
+                profiler.lap("npc_aim")
+
+        if self.game_state == "countdown":
+            for index in self.alive:
+                self.duelists[index].update_arm_animation()
+            if profiler:
+                profiler.lap("arm_animation")
+
+            elapsed = current_time - self.countdown_start
+            if elapsed < 3 * COUNTDOWN_MS:
+                self.countdown_value = 3 - int(elapsed // COUNTDOWN_MS)
+            else:
+                self.fire()
+
+        elif self.game_state == "shooting":
+            self.update_shooting()
+
+        elif self.game_state == "result":
+            self.update_result()
+
+        if profiler:
+            profiler.lap("other")
+
+    def fire(self):
+        # Every standing duelist shoots at once
+        self.solve_pending()
+        duelists = self.duelists
+        for facing_right in (True, False):
+            shooters = [index for index in self.alive if duelists[index].is_player == facing_right]
+            if not shooters:
+                continue
+            tips = np.array([duelists[index].pistol_tip() for index in shooters], dtype=float)
+            speeds = [duelists[index].bullet_velocity for index in shooters]
+            rows = self.pool.spawn(tips[:, 0], tips[:, 1], tips[:, 2], speeds, facing_right, np.array(shooters))
+            if self.human and shooters[0] == 0:
+                self.player_shot = int(rows[0])
+        for index in self.alive:
+            duelists[index].has_shot = True
+
+        # Nobody moves until every shot has landed
+        self.target_index = TargetIndex([duelists[index] for index in self.alive], self.alive)
+        self.game_state = "shooting"
+        self.countdown_value = "FIRE!"
+
+    def update_shooting(self):
+        profiler = self.profiler
+        hits = self.pool.update(self.terrain, self.target_index)
+        if profiler:
+            profiler.lap("bullet_update")
+
+        owners = self.pool.owner[hits.index].tolist()
+        for shooter, target, zone in zip(owners, hits.target.tolist(), hits.zone.tolist()):
+            duelist = self.duelists[target]
+            duelist.health = max(0, duelist.health - ZONE_DAMAGE[zone])
+            self.round_hits.append((shooter, target, zone))
+        if profiler:
+            profiler.lap("hit_checks")
+
+        if not self.pool.count():
+            self.end_round()
+
+    def end_round(self):
+        # Everyone at 0 health once the last shot has landed is out
+        eliminated = [index for index in self.alive if self.duelists[index].health <= 0]
+        if eliminated:
+            self.eliminations.append((self.round_number, eliminated))
+            self.alive = [index for index in self.alive if self.duelists[index].health > 0]
+            self.alive_x = [self.duelists[index].x for index in self.alive]
+        self.hit_message = self.round_summary(eliminated)
+        self.game_state = "result"
+        self.result_start_time = self.current_time
+
+    def name(self, index):
+        return "Player" if self.human and index == 0 else f"Duelist {index}"
+
+    def round_summary(self, eliminated):
+        if not self.round_hits:
+            return "Everyone missed!"
+        parts = [f"{len(self.round_hits)} hits"]
+        if eliminated:
+            parts.append(f"{len(eliminated)} eliminated")
+        if self.human:
+            dealt = sum(ZONE_DAMAGE[zone] for shooter, _, zone in self.round_hits if shooter == 0)
+            taken = sum(ZONE_DAMAGE[zone] for _, target, zone in self.round_hits if target == 0)
+            if dealt:
+                parts.append(f"you dealt {dealt}")
+            if taken:
+                parts.append(f"you took {taken}")
+        return ", ".join(parts) + "!"
+
+    def update_result(self, wait=True):
+        if len(self.alive) <= 1:
+            self.winner = self.name(self.alive[0]) if self.alive else "Nobody"
+            self.game_state = "game_over"
+        elif not wait or self.current_time - self.result_start_time > RESULT_DELAY_MS:
+            self.round_number += 1
+            self.start_round()
+
+    def simulate_round(self):
+        # Resolve a whole round from the aiming phase without animating it.
+        # Returns the round's hits as (shooter, target, zone).
+        if self.game_state != "aiming":
+            return None
+        for index in self.alive:
+            duelist = self.duelists[index]
+            duelist.current_arm_angle = duelist.aim_angle
+        self.fire()
+        while self.game_state == "shooting":
+            self.frame += 1
+            self.current_time = self.frame * 1000 / FPS
+            self.update_shooting()
+        hits = self.round_hits
+        self.update_result(wait=False)
+        return hits
+
+    def simulate_game(self, max_rounds=100):
+        # Play rounds until one duelist (or nobody) is left and return the winner
+        for _ in range(max_rounds):
+            if self.game_state == "game_over":
+                break
+            self.simulate_round()
+        return self.winner
+
+def time_frames(duelists, games, seed=0, difficulty=None):
+    # Mean and worst time of a shooting frame over whole NPC-only games,
+    # stepped frame by frame as the game window would
+    frame_times = []
+    rounds = 0
+    for game in range(games):
+        sim = FreeForAll(random.Random(seed + game), duelists, human=False, difficulty=difficulty)
+        while sim.game_state != "game_over" and sim.round_number <= 100:
+            state = sim.game_state
+            start = time.perf_counter()
+            sim.step()
+            if state == "shooting":
+                frame_times.append(time.perf_counter() - start)
+        rounds += sim.round_number
+    frame_times = np.array(frame_times) * 1000
+    return {
+        "duelists": duelists,
+        "games": games,
+        "rounds": rounds,
+        "shooting_frames": int(frame_times.size),
+        "mean_frame_ms": round(float(frame_times.mean()), 4),
+        "p99_frame_ms": round(float(np.percentile(frame_times, 99)), 4),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time headless free-for-all games between NPC duelists")
+    parser.add_argument("--duelists", type=int, nargs="+", default=[8, 32, 128],
+                        help="duelist counts to time (default 8 32 128)")
+    parser.add_argument("--games", type=int, default=5, help="games per duelist count (default 5)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game (default 0)")
+    parser.add_argument("--difficulty", choices=tuple(DIFFICULTY_AIM_ERROR),
+                        help="NPCs aim with the solver at this difficulty instead of at random")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+    if min(args.duelists) < 2:
+        parser.error("a free-for-all needs at least two duelists")
+
+    rows = [time_frames(duelists, args.games, args.seed, args.difficulty) for duelists in args.duelists]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    for row in rows:
+        print(f"{row['duelists']:>5} duelists  {row['rounds']:>5} rounds  "
+              f"shooting frame mean {row['mean_frame_ms']:.3f} ms, p99 {row['p99_frame_ms']:.3f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,720 +1,1027 @@
-import pygame
-import sys
 import time
+
+# Taken before the heavy imports so --startup-time can report import cost
+STARTUP_START = time.perf_counter()
+
+import pygame
+import argparse
+import bisect
+import json
+import os
 import random
+import sys
 import math
+from collections import OrderedDict
 
-# Initialize pygame
-pygame.init()
-
-# Screen dimensions
-WIDTH, HEIGHT = 1920, 1080
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Wild West Duel")
-
-# Colors
-WHITE = (255, 255, 255)
-BLACK = (0, 0, 0)
-RED = (255, 0, 0)
-BLUE = (0, 0, 255)
-GREEN = (0, 255, 0)
-BROWN = (139, 69, 19)
-SKY_BLUE = (135, 206, 235)
-YELLOW = (255, 255, 0)
-DARK_GRAY = (50, 50, 50)
-
-# Load fonts
-font_large = pygame.font.SysFont('Arial', 120)  # Increased from 72
-font_medium = pygame.font.SysFont('Arial', 48)  # Increased from 36
-font_small = pygame.font.SysFont('Arial', 36)   # Increased from 24
-
-# Physics constants
-GRAVITY = 0.3  # Reduced gravity to account for longer distances
-BASE_GROUND_LEVEL = HEIGHT - 200  # Base ground level for higher resolution
-
-# Terrain generation parameters
-MAX_HILL_HEIGHT = 250  # Maximum height of hills
-MIN_HILL_HEIGHT = 30   # Minimum height of hills
-HILL_WIDTH_RANGE = (100, 300)  # Range of hill widths
-CENTER_GAP = 600  # Gap in the center to ensure line of sight
-
-# Terrain class to handle the ground and hills
-class Terrain:
-    def __init__(self):
-        self.ground_level = BASE_GROUND_LEVEL
-        self.hills = []  # List of hills [(x, y, width, height), ...]
-        self.generate_terrain()
-        
-    def generate_terrain(self):
-        self.hills = []
-        
-        # Generate left hill (player side) - ensure player is on a hill
-        left_hill_height = random.randint(MIN_HILL_HEIGHT, MAX_HILL_HEIGHT)
-        left_hill_width = random.randint(*HILL_WIDTH_RANGE)
-        # Position the hill so the player is centered on it
-        player_x = 50
-        left_hill_x = max(0, player_x - left_hill_width // 2)
-        self.hills.append((left_hill_x, BASE_GROUND_LEVEL - left_hill_height, left_hill_width, left_hill_height))
-        
-        # Generate right hill (NPC side) - ensure NPC is on a hill
-        right_hill_height = random.randint(MIN_HILL_HEIGHT, MAX_HILL_HEIGHT)
-        right_hill_width = random.randint(*HILL_WIDTH_RANGE)
-        # Position the hill so the NPC is centered on it
-        npc_x = WIDTH - 110
-        right_hill_x = max(0, npc_x - right_hill_width // 2)
-        self.hills.append((right_hill_x, BASE_GROUND_LEVEL - right_hill_height, right_hill_width, right_hill_height))
-        
-        # Randomly decide if we add a middle hill (with lower height to not block view)
-        if random.random() < 0.3:  # 30% chance
-            middle_hill_height = random.randint(MIN_HILL_HEIGHT, MIN_HILL_HEIGHT + 20)
-            middle_hill_width = random.randint(100, 200)
-            middle_hill_x = WIDTH // 2 - middle_hill_width // 2
-            self.hills.append((middle_hill_x, BASE_GROUND_LEVEL - middle_hill_height, middle_hill_width, middle_hill_height))
-    
-    def draw(self, screen):
-        # Draw base ground
-        pygame.draw.rect(screen, BROWN, (0, BASE_GROUND_LEVEL, WIDTH, HEIGHT - BASE_GROUND_LEVEL))
-        
-        # Draw hills
-        for x, y, width, height in self.hills:
-            # Draw hill with a slightly darker color
-            hill_color = (139, 69, 19)  # Darker brown
-            pygame.draw.rect(screen, hill_color, (x, y, width, height))
-            
-            # Draw grass on top of the hill
-            grass_color = (34, 139, 34)  # Forest green
-            pygame.draw.rect(screen, grass_color, (x, y, width, 10))
-    
-    def get_ground_level_at(self, x):
-        # Return the ground level at position x
-        for hill_x, hill_y, hill_width, hill_height in self.hills:
-            if hill_x <= x < hill_x + hill_width:
-                return hill_y
-        return BASE_GROUND_LEVEL
-
-class Bullet:
-    def __init__(self, x, y, angle, speed, is_player):
-        self.x = x
-        self.y = y
-        self.angle = angle  # in degrees
-        self.speed = speed
-        self.is_player = is_player
-        self.active = True
-        self.radius = 2  # Larger bullet for higher resolution
-        self.trail = []  # Store positions for bullet trail
-        self.max_trail_length = 6  # Longer trail for better visibility at distance
-        
-        # Convert angle to radians and calculate velocity components
-        angle_rad = math.radians(angle)
-        # No need for direction multiplier since we're already using the correct angle for each character
-        self.vx = math.cos(angle_rad) * speed * (1 if is_player else -1)
-        self.vy = -math.sin(angle_rad) * speed  # Negative because y increases downward
-        
-    def update(self, terrain):
-        if not self.active:
-            return
-            
-        # Store current position for trail
-        self.trail.append((self.x, self.y))
-        if len(self.trail) > self.max_trail_length:
-            self.trail.pop(0)
-            
-        # Update position based on velocity
-        self.x += self.vx
-        self.y += self.vy
-        
-        # Apply gravity to vertical velocity
-        self.vy += GRAVITY
-        
-        # Check if bullet hit ground or terrain
-        ground_level_at_bullet = terrain.get_ground_level_at(self.x)
-        if self.y > ground_level_at_bullet:
-            self.y = ground_level_at_bullet
-            self.active = False
-            
-        # Check if bullet is out of bounds
-        if self.x < 0 or self.x > WIDTH:
-            self.active = False
-            
-    def draw(self, screen):
-        if not self.active:
-            return
-            
-        # Draw bullet trail
-        for i, (trail_x, trail_y) in enumerate(self.trail):
-            # Make trail fade out
-            alpha = int(255 * (i / len(self.trail)))
-            trail_color = (100, 100, 100, alpha)
-            trail_radius = int(self.radius * (i / len(self.trail)))
-            if trail_radius < 1:
-                trail_radius = 1
-            pygame.draw.circle(screen, DARK_GRAY, (int(trail_x), int(trail_y)), trail_radius)
-            
-        # Draw bullet
-        pygame.draw.circle(screen, BLACK, (int(self.x), int(self.y)), self.radius)
-        
-    def check_hit(self, player):
-        if not self.active:
-            return False
-            
-        # Check if bullet is in the vertical range of the player
-        if (self.y > player.y - 10 - 12 and  # Head top (with radius)
-            self.y < player.y + player.height):  # Body bottom
-            
-            # Check horizontal position
-            if self.is_player:  # Player bullet
-                if self.x > player.x - 12:  # Account for head radius
-                    self.active = False
-                    # Calculate damage based on hit location
-                    if self.y < player.y:  # Headshot
-                        damage = 40
-                    else:  # Body shot
-                        damage = 20
-                    player.health -= damage
-                    player.health = max(0, player.health)  # Ensure health doesn't go below 0
-                    return True
-            else:  # NPC bullet
-                if self.x < player.x + player.width + 12:  # Account for head radius
-                    self.active = False
-                    # Calculate damage based on hit location
-                    if self.y < player.y:  # Headshot
-                        damage = 40
-                    else:  # Body shot
-                        damage = 20
-                    player.health -= damage
-                    player.health = max(0, player.health)  # Ensure health doesn't go below 0
-                    return True
-        return False
-
-class Player:
-    # Class variable to store terrain reference
-    terrain = None
-    
-    def __init__(self, x, y, color, is_player=False):
-        self.x = x
-        self.y = y
-        self.width = 30  # Reduced from 60 (half size)
-        self.height = 60  # Reduced from 120 (half size)
-        self.color = color
-        self.has_shot = False
-        self.shot_time = 0
-        self.bullet = None
-        self.health = 100  # Starting health
-        self.max_health = 100  # Maximum health
-        self.is_player = is_player
-        self.aim_y = y + 10  # Adjusted for upper body position (reduced)
-        self.aim_direction = 1 if is_player else -1  # 1 for right, -1 for left
-        self.aim_angle = 0  # Angle in degrees (0 is horizontal)
-        self.bullet_velocity = 45  # Increased for larger screen
-        
-        # Arm and pistol properties - keeping these unchanged
-        self.arm_length = 35  # Keeping arm length unchanged
-        self.arm_width = 8  # Keeping arm width unchanged
-        self.pistol_length = 10  # Keeping pistol length unchanged
-        self.current_arm_angle = -70  # Start downward (-45 degrees), no direction multiplier
-        self.target_arm_angle = self.aim_angle  # Target angle for animation
-        self.arm_animation_speed = 3  # Increased speed for quicker draw
-        
-        # Reticle properties
-        self.reticle_x = 0
-        self.reticle_y = 0
-        self.update_reticle_position()  # Initialize reticle position
-        
-    def draw(self, screen, aiming=False):
-        # Draw body
-        pygame.draw.rect(screen, self.color, (self.x, self.y, self.width, self.height))
-        # Draw head
-        pygame.draw.circle(screen, self.color, (self.x + self.width // 2, self.y - 10), 12)  # Reduced from 24 to 12 (half size)
-        
-        # Calculate arm position - moved higher up on the body
-        arm_start_x = self.x + self.width // 2
-        arm_start_y = self.y + 10  # Upper part of body
-        
-        # Calculate arm end point based on current arm angle
-        # For NPC, we need to flip the angle calculation to make it face the player
-        if self.is_player:
-            arm_angle_rad = math.radians(self.current_arm_angle)
-            arm_end_x = arm_start_x + (self.arm_length * math.cos(arm_angle_rad))
-        else:
-            arm_angle_rad = math.radians(180 - self.current_arm_angle)  # Flip angle for NPC
-            arm_end_x = arm_start_x + (self.arm_length * math.cos(arm_angle_rad))
-            
-        arm_end_y = arm_start_y - (self.arm_length * math.sin(arm_angle_rad))
-        
-        # Draw arm with black outline
-        # First draw a slightly thicker black line for the outline
-        pygame.draw.line(screen, BLACK, (arm_start_x, arm_start_y), 
-                        (arm_end_x, arm_end_y), self.arm_width + 2)
-        # Then draw the colored arm on top
-        pygame.draw.line(screen, self.color, (arm_start_x, arm_start_y), 
-                        (arm_end_x, arm_end_y), self.arm_width)
-        
-        # Calculate pistol position at the end of arm
-        # Use the same angle calculation as for the arm
-        if self.is_player:
-            pistol_end_x = arm_end_x + (self.pistol_length * math.cos(arm_angle_rad))
-        else:
-            pistol_end_x = arm_end_x + (self.pistol_length * math.cos(arm_angle_rad))
-            
-        pistol_end_y = arm_end_y - (self.pistol_length * math.sin(arm_angle_rad))
-        
-        # Draw pistol
-        pygame.draw.line(screen, BLACK, (arm_end_x, arm_end_y), 
-                        (pistol_end_x, pistol_end_y), 6)  # Keeping pistol thickness
-        
-        # Draw reticle if in aiming phase and is player
-        if aiming and self.is_player:
-            # Draw reticle
-            reticle_size = 15  # Keeping reticle size
-            # Outer circle
-            pygame.draw.circle(screen, RED, (int(self.reticle_x), int(self.reticle_y)), reticle_size, 2)
-            # Inner circle
-            pygame.draw.circle(screen, RED, (int(self.reticle_x), int(self.reticle_y)), reticle_size // 2, 2)
-            # Crosshairs
-            pygame.draw.line(screen, RED, (self.reticle_x - reticle_size, self.reticle_y), 
-                            (self.reticle_x + reticle_size, self.reticle_y), 2)
-            pygame.draw.line(screen, RED, (self.reticle_x, self.reticle_y - reticle_size), 
-                            (self.reticle_x, self.reticle_y + reticle_size), 2)
-            
-            # Draw angle text
-            angle_text = font_small.render(f"Angle: {self.aim_angle:.2f}°", True, BLACK)
-            screen.blit(angle_text, (self.x, self.y - 50))  # Adjusted position for smaller body
-            
-    def update_arm_animation(self):
-        # Animate the arm to move toward the target angle
-        if self.current_arm_angle != self.aim_angle:
-            # Calculate the difference
-            angle_diff = self.aim_angle - self.current_arm_angle
-            
-            # Determine the direction and amount to move
-            if abs(angle_diff) < self.arm_animation_speed:
-                # If we're close enough, just set to the target
-                self.current_arm_angle = self.aim_angle
-            else:
-                # Otherwise move in the right direction
-                direction = 1 if angle_diff > 0 else -1
-                self.current_arm_angle += direction * self.arm_animation_speed
-    def adjust_aim_angle(self, direction):
-        # Adjust aim angle (up/down) with finer control (0.10 degrees per adjustment)
-        self.aim_angle += direction * 0.10
-        # Limit angle to reasonable range (0-60 degrees)
-        self.aim_angle = max(0, min(self.aim_angle, 60))
-        
-        # Update aim_y based on angle for compatibility - adjusted for upper body position
-        self.aim_y = self.y + 10 - (self.aim_angle * 0.8)
-        
-        # Update target arm angle for animation
-        self.target_arm_angle = self.aim_angle
-        
-        # Calculate reticle position for visual feedback
-        self.update_reticle_position()
-        
-    def adjust_aim_power(self, direction):
-        # Adjust aim power (stronger/weaker)
-        self.aim_power += direction
-        # Limit power to reasonable range
-        self.aim_power = max(self.min_power, min(self.aim_power, self.max_power))
-        
-        # Update reticle position for visual feedback
-        self.update_reticle_position()
-        
-    def update_reticle_position(self, terrain=None):
-        # Use class terrain if none provided
-        if terrain is None:
-            terrain = Player.terrain
-            
-        # Calculate reticle position based on current angle and fixed velocity
-        angle_rad = math.radians(self.aim_angle)
-        distance_multiplier = 2.5  # Reduced from 5 to make reticle twice as close
-        
-        # Calculate gun position
-        gun_x = self.x + self.width if self.is_player else self.x
-        gun_y = self.aim_y
-        
-        # Calculate gun end point
-        gun_length = 20
-        gun_end_x = gun_x + (gun_length * math.cos(angle_rad) * self.aim_direction)
-        gun_end_y = gun_y - (gun_length * math.sin(angle_rad))
-        
-        # Calculate reticle position using fixed bullet velocity
-        self.reticle_x = gun_end_x + (math.cos(angle_rad) * self.bullet_velocity * distance_multiplier * self.aim_direction)
-        self.reticle_y = gun_end_y - (math.sin(angle_rad) * self.bullet_velocity * distance_multiplier)
-        
-        # Ensure reticle stays within screen bounds
-        self.reticle_x = max(0, min(self.reticle_x, WIDTH))
-        
-        # If terrain is provided, ensure reticle doesn't go below ground
-        if terrain:
-            ground_level_at_reticle = terrain.get_ground_level_at(self.reticle_x)
-            self.reticle_y = min(self.reticle_y, ground_level_at_reticle - 10)  # Keep slightly above ground
+from duel_ai import DIFFICULTY_LEVELS, NpcBrain
+from duel_core import (
+    WIDTH, HEIGHT, WHITE, BLACK, RED, GREEN, BROWN, SKY_BLUE, DARK_GRAY,
+    BASE_GROUND_LEVEL, INPUT_UP, INPUT_DOWN, INPUT_READY, INPUT_RESTART, INPUT_UP_PRESSED, INPUT_DOWN_PRESSED,
+    DuelSimulation,
+)
+from duel_physics import INTEGRATORS, WEAPON_NAMES, simulation_physics
+from duel_preview import TrajectoryPreview
+from duel_profiler import FrameProfiler, HISTOGRAM_BIN_MS
+from duel_replay import Replay, ReplayRecorder, new_seed
+from duel_text import TextCache
+
+IMPORTS_DONE = time.perf_counter()
+
+# The display is created by init_display() and fonts by get_font() on first use,
+# so importing this module (and the rules in duel_core) never opens a window
+screen = None
+
+# Font sizes by name
+FONT_SIZES = {
+    "large": 120,  # Increased from 72
+    "medium": 48,  # Increased from 36
+    "small": 36,   # Increased from 24
+}
+
+# System font to use instead of the bundled one (e.g. 'Arial'). Looking up
+# system fonts scans every installed font, which is slow on some machines.
+system_font_name = None
+fonts = {}
+
+# Rendered HUD text, shared by all drawing code
+text_cache = TextCache()
+
+# Profiler overlay label, refreshed a few times a second so it stays readable
+# (and doesn't push the HUD text out of the cache) as (refresh time, text)
+profiler_label = (0, "")
+PROFILER_LABEL_INTERVAL_MS = 500
+
+# Everything is laid out in logical units of a WIDTH x HEIGHT screen and
+# drawn at the internal resolution chosen in init_display(), render_scale
+# internal pixels per logical unit. Any other resolution than the logical one
+# is upscaled to the window by SDL (pygame.SCALED), so a small one cuts the
+# fill cost and a large one stays sharp on high-DPI displays.
+render_scale = 1
+view_size = (WIDTH, HEIGHT)
+
+def parse_resolution(text):
+    # "WIDTHxHEIGHT" for --resolution, 16:9 like the logical screen
+    try:
+        width, height = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    if width <= 0 or width % 16 or height * 16 != width * 9:
+        raise argparse.ArgumentTypeError(f"{text} isn't 16:9 with a width divisible by 16 (e.g. 960x540)")
+    return width, height
+
+def to_pixels(value):
+    # Logical coordinate or length to internal pixels (unchanged at scale 1)
+    return value * render_scale
+
+def to_size(value):
+    # Line widths, radii and font sizes: whole pixels, at least one
+    if render_scale == 1:
+        return value
+    return max(1, int(round(value * render_scale)))
+
+def to_point(x, y, camera_x=0):
+    return (x - camera_x) * render_scale, y * render_scale
+
+def to_rect(x, y, width, height, camera_x=0):
+    # Edges are scaled rather than the size, so touching shapes stay touching
+    if render_scale == 1:
+        return pygame.Rect(x - camera_x, y, width, height)
+    left = int(round((x - camera_x) * render_scale))
+    top = int(round(y * render_scale))
+    return pygame.Rect(left, top, int(round((x - camera_x + width) * render_scale)) - left,
+                       int(round((y + height) * render_scale)) - top)
+
+def init_display(resolution=None):
+    global screen, render_scale, view_size, background_surface
+
+    # Initialize only the pygame subsystems the game uses
+    pygame.display.init()
+    pygame.font.init()
+
+    # Internal resolution, the logical screen size unless one is given
+    view_size = resolution or (WIDTH, HEIGHT)
+    render_scale = 1 if view_size == (WIDTH, HEIGHT) else view_size[0] / WIDTH
+    fonts.clear()
+    text_cache.clear()
+    circle_stamps.clear()
+    pose_sprites.clear()
+    terrain_chunks.clear()
+    background_surface = None
+    try:
+        screen = pygame.display.set_mode(view_size, pygame.SCALED if resolution else 0)
+    except pygame.error:
+        # No renderer to scale with (e.g. the dummy video driver): show the
+        # internal resolution as it is
+        screen = pygame.display.set_mode(view_size)
+    pygame.display.set_caption("Wild West Duel")
+    return screen
+
+def bundled_font_path():
+    # FreeSans Bold ships inside the pygame package, so no font scan is needed
+    return os.path.join(os.path.dirname(pygame.__file__), pygame.font.get_default_font())
+
+def get_font(name):
+    # Load fonts on first use
+    font = fonts.get(name)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        if system_font_name:
+            font = pygame.font.SysFont(system_font_name, to_size(FONT_SIZES[name]))
         else:
-            self.reticle_y = max(0, min(self.reticle_y, BASE_GROUND_LEVEL))
-    def shoot(self):
-        if not self.has_shot:
-            self.has_shot = True
-            self.shot_time = pygame.time.get_ticks()
-            
-            # Calculate pistol position at the end of arm - using upper body position
-            arm_start_x = self.x + self.width // 2
-            arm_start_y = self.y + 10  # Upper part of body
-            
-            # Calculate arm and pistol positions with correct angles for both player and NPC
-            if self.is_player:
-                arm_angle_rad = math.radians(self.current_arm_angle)
-                arm_end_x = arm_start_x + (self.arm_length * math.cos(arm_angle_rad))
-                bullet_angle = self.current_arm_angle
-            else:
-                arm_angle_rad = math.radians(180 - self.current_arm_angle)  # Flip angle for NPC
-                arm_end_x = arm_start_x + (self.arm_length * math.cos(arm_angle_rad))
-                bullet_angle = self.current_arm_angle  # Use original angle for NPC bullet
-                
-            arm_end_y = arm_start_y - (self.arm_length * math.sin(arm_angle_rad))
-            
-            pistol_end_x = arm_end_x + (self.pistol_length * math.cos(arm_angle_rad))
-            pistol_end_y = arm_end_y - (self.pistol_length * math.sin(arm_angle_rad))
-            
-            # Create bullet - using fixed velocity and correct angle
-            self.bullet = Bullet(pistol_end_x, pistol_end_y, 
-                                bullet_angle, self.bullet_velocity, self.is_player)
-                
-    def update_bullet(self, terrain):
-        if self.bullet and self.bullet.active:
-            self.bullet.update(terrain)
-            
-    def draw_bullet(self, screen):
-        if self.bullet:
-            self.bullet.draw(screen)
-            
-    def check_hit(self, other):
-        if self.bullet and self.bullet.active:
-            return self.bullet.check_hit(other)
-        return False
-
-def draw_scene(player, npc, terrain, game_state, mode="simultaneous", countdown=None, winner=None, hit_message=None):
-    # Draw sky
-    screen.fill(SKY_BLUE)
-    
-    # Draw terrain (ground and hills)
-    terrain.draw(screen)
-    
+            font = pygame.font.Font(bundled_font_path(), to_size(FONT_SIZES[name]))
+        fonts[name] = font
+    return font
+
+def draw_terrain(screen, terrain, camera_x=0):
+    # Draw base ground
+    ground = to_rect(0, BASE_GROUND_LEVEL, 0, HEIGHT - BASE_GROUND_LEVEL)
+    ground.width = screen.get_width()
+    pygame.draw.rect(screen, BROWN, ground)
+
+    # Draw hills
+    for x, y, width, height in terrain.hills:
+        # Draw hill with a slightly darker color
+        hill_color = (139, 69, 19)  # Darker brown
+        pygame.draw.rect(screen, hill_color, to_rect(x, y, width, height, camera_x))
+
+        # Draw grass on top of the hill
+        grass_color = (34, 139, 34)  # Forest green
+        pygame.draw.rect(screen, grass_color, to_rect(x, y, width, 10, camera_x))
+
+# Sky and terrain are rasterized in fixed-width chunks of the world. Only the
+# chunks around the view are kept, so memory doesn't grow with the world width.
+CHUNK_WIDTH = 480  # Logical units; a whole number of pixels at every allowed resolution
+MAX_CHUNKS = WIDTH // CHUNK_WIDTH + 2
+terrain_chunks = OrderedDict()  # Chunk index -> Surface, least recently used first
+chunks_terrain = None
+
+def get_chunk(terrain, index):
+    global chunks_terrain
+    if terrain is not chunks_terrain:
+        terrain_chunks.clear()
+        chunks_terrain = terrain
+    chunk = terrain_chunks.get(index)
+    if chunk is None:
+        chunk = pygame.Surface((int(to_pixels(CHUNK_WIDTH)), view_size[1])).convert()
+        # Draw sky
+        chunk.fill(SKY_BLUE)
+        # Draw terrain (ground and hills)
+        draw_terrain(chunk, terrain, index * CHUNK_WIDTH)
+        terrain_chunks[index] = chunk
+        if len(terrain_chunks) > MAX_CHUNKS:
+            terrain_chunks.popitem(last=False)
+    else:
+        terrain_chunks.move_to_end(index)
+    return chunk
+
+# The screen's view of sky and terrain, recomposed from the chunks only when
+# the terrain or the camera changes
+background_surface = None
+background_terrain = None
+background_camera_x = None
+
+def get_background(terrain, camera_x=0):
+    global background_surface, background_terrain, background_camera_x
+    if terrain is not background_terrain or camera_x != background_camera_x or background_surface is None:
+        if background_surface is None:
+            background_surface = pygame.Surface(view_size).convert()
+        first_chunk = camera_x // CHUNK_WIDTH
+        last_chunk = (camera_x + WIDTH - 1) // CHUNK_WIDTH
+        chunk_pixels = int(to_pixels(CHUNK_WIDTH))
+        camera_pixels = int(round(to_pixels(camera_x)))
+        for index in range(first_chunk, last_chunk + 1):
+            background_surface.blit(get_chunk(terrain, index), (index * chunk_pixels - camera_pixels, 0))
+        background_camera_x = camera_x
+        background_terrain = terrain
+    return background_surface
+
+def union_rect(rects):
+    # Bounding box of the rects returned by pygame draw and blit calls, padded
+    # slightly so restoring the background never leaves stray pixels behind
+    return rects[0].unionall(rects[1:]).inflate(4, 4)
+
+def draw_bullet(screen, bullet, camera_x=0):
+    if not bullet.active:
+        return None
+    rects = []
+
+    # Draw bullet trail
+    for i, (trail_x, trail_y) in enumerate(bullet.trail):
+        # Make trail fade out
+        trail_radius = int(bullet.radius * (i / len(bullet.trail)))
+        if trail_radius < 1:
+            trail_radius = 1
+        rects.append(pygame.draw.circle(screen, DARK_GRAY, to_point(int(trail_x), int(trail_y), camera_x),
+                                        to_size(trail_radius)))
+
+    # Draw bullet
+    rects.append(pygame.draw.circle(screen, BLACK, to_point(int(bullet.x), int(bullet.y), camera_x),
+                                    to_size(bullet.radius)))
+    return union_rect(rects)
+
+# Pixel offsets covered by pygame.draw.circle for each small radius, so
+# pooled projectiles can be stamped into the screen with array writes
+circle_stamps = {}
+
+def circle_stamp(radius):
+    stamp = circle_stamps.get(radius)
+    if stamp is None:
+        import numpy as np
+        size = radius * 2 + 3
+        surface = pygame.Surface((size, size))
+        pygame.draw.circle(surface, WHITE, (radius + 1, radius + 1), radius)
+        dx, dy = np.nonzero(pygame.surfarray.array2d(surface))
+        stamp = circle_stamps[radius] = (dx - radius - 1, dy - radius - 1)
+    return stamp
+
+def stamp_circles(pixels, xs, ys, radius, color):
+    dx, dy = circle_stamp(radius)
+    px = (xs[:, None] + dx[None, :]).ravel()
+    py = (ys[:, None] + dy[None, :]).ravel()
+    inside = (px >= 0) & (px < pixels.shape[0]) & (py >= 0) & (py < pixels.shape[1])
+    pixels[px[inside], py[inside]] = color
+
+def draw_projectiles(screen, pool, camera_x=0):
+    # Draw every live pooled projectile and its trail like draw_bullet does,
+    # writing the pixels directly instead of one draw call per point. All
+    # trails go down first so no trail covers another projectile.
+    import numpy as np
+    rows = np.flatnonzero(pool.alive)
+    if not rows.size:
+        return None
+    trail_x, trail_y, ages, lengths = pool.trail_points()
+    trail_radius = np.maximum((pool.radius * (ages / lengths)).astype(int), 1)
+    radius = to_size(pool.radius)
+    if render_scale != 1:
+        trail_radius = np.maximum(np.round(trail_radius * render_scale).astype(int), 1)
+    trail_x = ((trail_x.astype(int) - camera_x) * render_scale).astype(int)
+    trail_y = (trail_y.astype(int) * render_scale).astype(int)
+    xs = ((pool.x[rows].astype(int) - camera_x) * render_scale).astype(int)
+    ys = (pool.y[rows].astype(int) * render_scale).astype(int)
+
+    pixels = pygame.surfarray.pixels2d(screen)
+    trail_color = screen.map_rgb(DARK_GRAY)
+    for radius in np.unique(trail_radius).tolist():
+        same = trail_radius == radius
+        stamp_circles(pixels, trail_x[same], trail_y[same], radius, trail_color)
+    stamp_circles(pixels, xs, ys, radius, screen.map_rgb(BLACK))
+    del pixels
+
+    # One rect around everything drawn
+    left = int(min(xs.min(), trail_x.min(initial=xs.min()))) - radius
+    top = int(min(ys.min(), trail_y.min(initial=ys.min()))) - radius
+    right = int(max(xs.max(), trail_x.max(initial=xs.max()))) + radius + 1
+    bottom = int(max(ys.max(), trail_y.max(initial=ys.max()))) + radius + 1
+    return pygame.Rect(left, top, right - left, bottom - top).inflate(4, 4).clip(screen.get_rect())
+
+# Duelist poses (body, head, arm and pistol) are rasterized once per look,
+# facing and quantized arm angle into small colorkeyed sprites, so drawing a
+# duelist is one blit instead of a rect, a circle, three lines and the trig
+# for them. The NPC's poses are drawn facing left rather than flipped, so they
+# cover exactly the pixels the primitives would.
+POSE_ANGLE_STEP = 0.5  # Degrees; the pistol tip moves under half a pixel per step
+MAX_POSES = 1024
+POSE_COLORKEY = (255, 0, 255)
+# Pose key -> (Surface, top-left of the drawing box relative to the duelist in
+# logical units, top-left of the sprite inside that box in internal pixels),
+# least recently used first
+pose_sprites = OrderedDict()
+
+def draw_pose(surface, player, arm_angle, x, y):
+    # Draw body
+    pygame.draw.rect(surface, player.color, to_rect(x, y, player.width, player.height))
+    # Draw head
+    pygame.draw.circle(surface, player.color, to_point(x + player.width // 2, y - 10),
+                       to_size(12))  # Reduced from 24 to 12 (half size)
+
+    # Calculate arm position - moved higher up on the body
+    arm_start_x = x + player.width // 2
+    arm_start_y = y + 10  # Upper part of body
+
+    # Calculate arm end point based on the arm angle
+    # For NPC, we need to flip the angle calculation to make it face the player
+    if player.is_player:
+        arm_angle_rad = math.radians(arm_angle)
+    else:
+        arm_angle_rad = math.radians(180 - arm_angle)  # Flip angle for NPC
+    arm_end_x = arm_start_x + (player.arm_length * math.cos(arm_angle_rad))
+    arm_end_y = arm_start_y - (player.arm_length * math.sin(arm_angle_rad))
+
+    # Draw arm with black outline
+    # First draw a slightly thicker black line for the outline
+    pygame.draw.line(surface, BLACK, to_point(arm_start_x, arm_start_y),
+                     to_point(arm_end_x, arm_end_y), to_size(player.arm_width + 2))
+    # Then draw the colored arm on top
+    pygame.draw.line(surface, player.color, to_point(arm_start_x, arm_start_y),
+                     to_point(arm_end_x, arm_end_y), to_size(player.arm_width))
+
+    # Calculate pistol position at the end of arm
+    # Use the same angle calculation as for the arm
+    pistol_end_x = arm_end_x + (player.pistol_length * math.cos(arm_angle_rad))
+    pistol_end_y = arm_end_y - (player.pistol_length * math.sin(arm_angle_rad))
+
+    # Draw pistol
+    pygame.draw.line(surface, BLACK, to_point(arm_end_x, arm_end_y),
+                     to_point(pistol_end_x, pistol_end_y), to_size(6))  # Keeping pistol thickness
+
+def get_pose(player):
+    # Sprite of the duelist's current pose and its top-left corner relative to
+    # the duelist's position, in logical units and internal pixels
+    index = int(round(player.current_arm_angle / POSE_ANGLE_STEP))
+    key = (player.color, player.is_player, player.width, player.height, player.arm_length,
+           player.arm_width, player.pistol_length, index)
+    pose = pose_sprites.get(key)
+    if pose is None:
+        # Box around everything the arm can reach, in logical units
+        reach = player.arm_length + player.pistol_length + player.arm_width
+        left = min(0, player.width // 2 - reach) - 2
+        top = min(-22, 10 - reach) - 2
+        right = max(player.width, player.width // 2 + reach) + 2
+        bottom = max(player.height, 10 + reach) + 2
+        full = pygame.Surface((int(to_pixels(right - left)) + 2, int(to_pixels(bottom - top)) + 2)).convert()
+        full.fill(POSE_COLORKEY)
+        full.set_colorkey(POSE_COLORKEY)
+        draw_pose(full, player, index * POSE_ANGLE_STEP, -left, -top)
+
+        # Keep only the drawn part
+        bounds = full.get_bounding_rect()
+        sprite = full.subsurface(bounds).copy()
+        sprite.set_colorkey(POSE_COLORKEY, pygame.RLEACCEL)
+        pose = pose_sprites[key] = (sprite, (left, top), bounds.topleft)
+        if len(pose_sprites) > MAX_POSES:
+            pose_sprites.popitem(last=False)
+    else:
+        pose_sprites.move_to_end(key)
+    return pose
+
+def draw_player(screen, player, aiming=False, camera_x=0):
+    rects = []
+
+    # Screen position of the duelist and reticle
+    x = player.x - camera_x
+    reticle_x = player.reticle_x - camera_x
+
+    # Draw body, head, arm and pistol
+    sprite, (left, top), (pixel_x, pixel_y) = get_pose(player)
+    sprite_x, sprite_y = to_point(x + left, player.y + top)
+    rects.append(screen.blit(sprite, (sprite_x + pixel_x, sprite_y + pixel_y)))
+
+    # Draw reticle if this is the local duelist aiming
+    if aiming:
+        # Draw reticle
+        reticle_size = 15  # Keeping reticle size
+        reticle_center = to_point(int(reticle_x), int(player.reticle_y))
+        # Outer circle
+        rects.append(pygame.draw.circle(screen, RED, reticle_center, to_size(reticle_size), to_size(2)))
+        # Inner circle
+        pygame.draw.circle(screen, RED, reticle_center, to_size(reticle_size // 2), to_size(2))
+        # Crosshairs
+        rects.append(pygame.draw.line(screen, RED, to_point(reticle_x - reticle_size, player.reticle_y),
+                                      to_point(reticle_x + reticle_size, player.reticle_y), to_size(2)))
+        rects.append(pygame.draw.line(screen, RED, to_point(reticle_x, player.reticle_y - reticle_size),
+                                      to_point(reticle_x, player.reticle_y + reticle_size), to_size(2)))
+
+        # Draw angle text
+        angle_text = text_cache.render(get_font("small"), f"Angle: {player.aim_angle:.2f}°", BLACK)
+        rects.append(screen.blit(angle_text, to_point(x, player.y - 50)))  # Adjusted position for smaller body
+
+    return union_rect(rects)
+
+def draw_preview(screen, points, camera_x=0):
+    # Draw the simulated flight path of the current aim
+    if camera_x or render_scale != 1:
+        points = [to_point(x, y, camera_x) for x, y in points]
+    if len(points) > 1:
+        return pygame.draw.lines(screen, WHITE, False, points, to_size(2)).inflate(4, 4)
+    return None
+
+def draw_actors(screen, player, npc, game_state, preview=None, camera_x=0):
+    # Draw everything that moves and return the screen areas it covers
+    rects = []
+
+    # Draw trajectory preview arc during aiming
+    if preview and game_state == "aiming":
+        rects.append(draw_preview(screen, preview, camera_x))
+
     # Draw players - show aiming line for player during aiming phase
-    player.draw(screen, game_state == "aiming")
-    npc.draw(screen, False)  # NPC never shows trajectory prediction
-    
+    rects.append(draw_player(screen, player, game_state == "aiming", camera_x))
+    rects.append(draw_player(screen, npc, False, camera_x))  # NPC never shows trajectory prediction
+
     # Draw bullets
-    player.draw_bullet(screen)
-    npc.draw_bullet(screen)
-    
+    if player.bullet:
+        rects.append(draw_bullet(screen, player.bullet, camera_x))
+    if npc.bullet:
+        rects.append(draw_bullet(screen, npc.bullet, camera_x))
+    return [rect for rect in rects if rect is not None]
+
+def draw_hud(screen, player, npc, game_state, countdown=None, winner=None, hit_message=None, wind=0.0):
+    # Draw health bars, messages and prompts and return the screen areas they cover
+    rects = []
+
     # Draw health bars - scaled for higher resolution
     # Player health bar
-    pygame.draw.rect(screen, RED, (100, 40, 400, 30))
+    rects.append(pygame.draw.rect(screen, RED, to_rect(100, 40, 400, 30)))
     health_width = int(400 * (player.health / player.max_health))
-    pygame.draw.rect(screen, GREEN, (100, 40, health_width, 30))
-    
+    pygame.draw.rect(screen, GREEN, to_rect(100, 40, health_width, 30))
+
     # NPC health bar
-    pygame.draw.rect(screen, RED, (WIDTH - 500, 40, 400, 30))
+    rects.append(pygame.draw.rect(screen, RED, to_rect(WIDTH - 500, 40, 400, 30)))
     health_width = int(400 * (npc.health / npc.max_health))
-    pygame.draw.rect(screen, GREEN, (WIDTH - 500, 40, health_width, 30))
-    
+    pygame.draw.rect(screen, GREEN, to_rect(WIDTH - 500, 40, health_width, 30))
+
     # Draw health numbers
-    player_health_text = font_small.render(f"{player.health}/{player.max_health}", True, BLACK)
-    npc_health_text = font_small.render(f"{npc.health}/{npc.max_health}", True, BLACK)
-    screen.blit(player_health_text, (100, 80))
-    screen.blit(npc_health_text, (WIDTH - 500, 80))
-    
+    player_health_text = text_cache.render(get_font("small"), f"{player.health}/{player.max_health}", BLACK)
+    npc_health_text = text_cache.render(get_font("small"), f"{npc.health}/{npc.max_health}", BLACK)
+    rects.append(screen.blit(player_health_text, to_point(100, 80)))
+    rects.append(screen.blit(npc_health_text, to_point(WIDTH - 500, 80)))
+
     # Draw round indicator
     if game_state != "game_over":
-        round_text = font_medium.render("Prepare to Duel!", True, BLACK)
-        screen.blit(round_text, (WIDTH // 2 - 100, 40))
-    
+        round_text = text_cache.render(get_font("medium"), "Prepare to Duel!", BLACK)
+        rects.append(screen.blit(round_text, to_point(WIDTH // 2 - 100, 40)))
+
+    # Draw this round's wind, if any
+    if wind:
+        direction = "right" if wind > 0 else "left"
+        wind_text = text_cache.render(get_font("small"), f"Wind: {abs(wind):.3f} to the {direction}", BLACK)
+        rects.append(screen.blit(wind_text, to_point(WIDTH // 2 - 100, 220)))
+
     # Draw hit message if available
     if hit_message:
-        hit_text = font_medium.render(hit_message, True, RED)
-        screen.blit(hit_text, (WIDTH // 2 - 200, 100))
-    
+        hit_text = text_cache.render(get_font("medium"), hit_message, RED)
+        rects.append(screen.blit(hit_text, to_point(WIDTH // 2 - 200, 100)))
+
     # Draw game state specific information
     if game_state == "aiming":
-        instructions = font_medium.render("UP/DOWN: Adjust Angle, SPACE: Ready", True, BLACK)
-        screen.blit(instructions, (WIDTH // 2 - 200, 160))
+        instructions = text_cache.render(get_font("medium"), "UP/DOWN: Adjust Angle, SPACE: Ready", BLACK)
+        rects.append(screen.blit(instructions, to_point(WIDTH // 2 - 200, 160)))
     elif game_state == "countdown" and countdown is not None:
-        countdown_text = font_large.render(str(countdown), True, RED)
-        screen.blit(countdown_text, (WIDTH // 2 - 40, HEIGHT // 2 - 100))
+        countdown_text = text_cache.render(get_font("large"), str(countdown), RED)
+        rects.append(screen.blit(countdown_text, to_point(WIDTH // 2 - 40, HEIGHT // 2 - 100)))
     elif game_state == "game_over" and winner is not None:
-        winner_text = font_medium.render(f"{winner} wins!", True, BLACK)
-        screen.blit(winner_text, (WIDTH // 2 - 100, HEIGHT // 2 - 50))
-        restart_text = font_small.render("Press R to restart or Q to quit", True, BLACK)
-        screen.blit(restart_text, (WIDTH // 2 - 150, HEIGHT // 2 + 20))
+        winner_text = text_cache.render(get_font("medium"), f"{winner} wins!", BLACK)
+        rects.append(screen.blit(winner_text, to_point(WIDTH // 2 - 100, HEIGHT // 2 - 50)))
+        restart_text = text_cache.render(get_font("small"), "Press R to restart or Q to quit", BLACK)
+        rects.append(screen.blit(restart_text, to_point(WIDTH // 2 - 150, HEIGHT // 2 + 20)))
+    return rects
+
+# Duelists this far outside the view are skipped when drawing a free-for-all
+VIEW_MARGIN = 200
+
+def draw_free_for_all(sim, preview=None, camera_x=0):
+    screen.blit(get_background(sim.terrain, camera_x), (0, 0))
+    aiming = sim.game_state == "aiming"
+    if preview and aiming:
+        draw_preview(screen, preview, camera_x)
+
+    # Duelists stand in x order, so the ones in view are one run of sim.alive
+    # and drawing costs the same however many there are
+    duelists = sim.duelists
+    first = bisect.bisect_left(sim.alive_x, camera_x - VIEW_MARGIN)
+    last = bisect.bisect_right(sim.alive_x, camera_x + WIDTH + VIEW_MARGIN)
+    for index in sim.alive[first:last]:
+        duelist = duelists[index]
+        draw_player(screen, duelist, aiming and index == 0 and sim.human, camera_x)
+        # Health bar over every head
+        bar_x = duelist.x - camera_x - 5
+        bar_y = duelist.y - 45
+        pygame.draw.rect(screen, RED, to_rect(bar_x, bar_y, 40, 5))
+        pygame.draw.rect(screen, GREEN, to_rect(bar_x, bar_y, 40 * duelist.health // duelist.max_health, 5))
+    draw_projectiles(screen, sim.pool, camera_x)
+    draw_free_for_all_hud(screen, sim)
+
+def draw_free_for_all_hud(screen, sim):
+    # The local player's health, who is left, messages and prompts
+    small = get_font("small")
+    medium = get_font("medium")
+    if sim.human:
+        player = sim.player
+        pygame.draw.rect(screen, RED, to_rect(100, 40, 400, 30))
+        pygame.draw.rect(screen, GREEN, to_rect(100, 40, int(400 * (player.health / player.max_health)), 30))
+        screen.blit(text_cache.render(small, f"{player.health}/{player.max_health}", BLACK), to_point(100, 80))
+    standing_text = text_cache.render(small, f"Standing: {len(sim.alive)}/{sim.count}", BLACK)
+    screen.blit(standing_text, to_point(WIDTH - 500, 40))
+    round_text = text_cache.render(small, f"Round {sim.round_number}", BLACK)
+    screen.blit(round_text, to_point(WIDTH - 500, 80))
+
+    if sim.hit_message:
+        screen.blit(text_cache.render(medium, sim.hit_message, RED), to_point(WIDTH // 2 - 200, 100))
+    if sim.game_state == "aiming" and sim.player_alive():
+        instructions = text_cache.render(medium, "UP/DOWN: Adjust Angle, SPACE: Ready", BLACK)
+        screen.blit(instructions, to_point(WIDTH // 2 - 200, 160))
+    elif sim.game_state == "countdown":
+        countdown_text = text_cache.render(get_font("large"), str(sim.countdown_value), RED)
+        screen.blit(countdown_text, to_point(WIDTH // 2 - 40, HEIGHT // 2 - 100))
+    elif sim.game_state == "game_over":
+        if sim.winner == "Nobody":
+            winner_text = text_cache.render(medium, "Nobody is left standing!", BLACK)
+        else:
+            winner_text = text_cache.render(medium, f"{sim.winner} wins!", BLACK)
+        screen.blit(winner_text, to_point(WIDTH // 2 - 100, HEIGHT // 2 - 50))
+        restart_text = text_cache.render(small, "Press R to restart or Q to quit", BLACK)
+        screen.blit(restart_text, to_point(WIDTH // 2 - 150, HEIGHT // 2 + 20))
+    if sim.human and not sim.player_alive() and sim.game_state != "game_over":
+        screen.blit(text_cache.render(small, "You're out - watching the rest", BLACK), to_point(100, 120))
+
+def draw_profiler_overlay(screen, profiler):
+    # Rolling FPS and a histogram of frame work times in the bottom left corner
+    global profiler_label
+    now = pygame.time.get_ticks()
+    if now - profiler_label[0] >= PROFILER_LABEL_INTERVAL_MS:
+        frame_times = profiler.frame_times
+        average = sum(frame_times) / len(frame_times) if frame_times else 0.0
+        profiler_label = (now, f"{profiler.fps():.1f} FPS  {average:.1f} ms")
+
+    panel = pygame.Rect(20, HEIGHT - 170, 320, 150)
+    pygame.draw.rect(screen, DARK_GRAY, to_rect(*panel))
+    screen.blit(text_cache.render(get_font("small"), profiler_label[1], WHITE), to_point(panel.x + 10, panel.y + 5))
+
+    # One bar per bin, scaled to the fullest bin
+    counts = profiler.histogram()
+    tallest = max(counts) or 1
+    bar_width = (panel.width - 20) // len(counts)
+    bottom = panel.bottom - 10
+    for index, count in enumerate(counts):
+        bar_height = int(80 * count / tallest)
+        if bar_height:
+            pygame.draw.rect(screen, GREEN, to_rect(panel.x + 10 + index * bar_width, bottom - bar_height,
+                                                    bar_width - 2, bar_height))
+
+    # Frame budget at 60 fps
+    budget_x = panel.x + 10 + int(1000 / 60 / HISTOGRAM_BIN_MS * bar_width)
+    pygame.draw.line(screen, RED, to_point(budget_x, bottom - 85), to_point(budget_x, bottom), to_size(1))
+    return [to_rect(*panel)]
+
+def draw_scene(player, npc, terrain, game_state, mode="simultaneous", countdown=None, winner=None, hit_message=None, preview=None,
+               camera_x=0, wind=0.0):
+    # Draw sky and terrain from the cached background layer
+    screen.blit(get_background(terrain, camera_x), (0, 0))
+
+    draw_actors(screen, player, npc, game_state, preview, camera_x)
+    draw_hud(screen, player, npc, game_state, countdown, winner, hit_message, wind)
+
+# Horizontal scrolling over worlds wider than the screen. The camera keeps the
+# local duelist in view while aiming and follows the bullet in flight, easing
+# toward its target so the view doesn't jump.
+CAMERA_EASING = 0.2
+
+class Camera:
+    def __init__(self, world_width):
+        self.world_width = world_width
+        self.x = 0
+
+    def follow(self, sim, duelist=None):
+        # duelist is the one to keep in view outside of shooting (the player by default)
+        duelist = duelist or sim.player
+        focus_x = None
+        if sim.game_state == "shooting":
+            for duelist in (sim.player, sim.npc):
+                if duelist.bullet and duelist.bullet.active:
+                    focus_x = duelist.bullet.x
+                    break
+        elif sim.game_state != "result":
+            focus_x = duelist.x + duelist.width // 2
+        return self.move_toward(focus_x)
+
+    def follow_free_for_all(self, sim):
+        # The local player's shot in flight, otherwise the local player or,
+        # once they are out, the middle of the duelists still standing
+        focus_x = None
+        if sim.game_state == "shooting":
+            row = sim.player_shot
+            if row is not None and sim.pool.alive[row]:
+                focus_x = sim.pool.x[row]
+        elif sim.game_state != "result" and sim.alive:
+            duelist = sim.player if sim.player_alive() else sim.duelists[sim.alive[len(sim.alive) // 2]]
+            focus_x = duelist.x + duelist.width // 2
+        return self.move_toward(focus_x)
+
+    def move_toward(self, focus_x):
+        # Ease toward centring focus_x; None holds still (on an impact)
+        if focus_x is None:
+            return self.x
+
+        goal = int(min(max(focus_x - WIDTH // 2, 0), self.world_width - WIDTH))
+        distance = goal - self.x
+        if abs(distance) <= 2:
+            self.x = goal
+        else:
+            self.x += int(distance * CAMERA_EASING)
+        return self.x
+
+# Redraws only what changed since the last frame. Areas under last frame's
+# actors are restored from the cached background, actors are drawn again, and
+# the HUD is repainted only when its contents change or an actor touches it.
+# draw() returns the rects to pass to pygame.display.update(), or None when the
+# whole screen was repainted and needs a flip.
+class DirtyRectRenderer:
+    def __init__(self, screen):
+        self.screen = screen
+        self.terrain = None
+        self.camera_x = None
+        self.actor_rects = []
+        self.hud_rects = []
+        self.hud_state = None
+
+    def draw(self, player, npc, terrain, game_state, countdown=None, winner=None, hit_message=None, preview=None,
+             overlay=None, camera_x=0, wind=0.0):
+        # overlay, if given, draws on top of everything and returns its rects;
+        # it is erased next frame like an actor
+        screen = self.screen
+        background = get_background(terrain, camera_x)
+        hud_state = (player.health, npc.health, game_state, countdown, winner, hit_message, wind)
+
+        # New terrain or the camera moved - repaint the whole screen
+        if terrain is not self.terrain or camera_x != self.camera_x:
+            self.terrain = terrain
+            self.camera_x = camera_x
+            screen.blit(background, (0, 0))
+            self.actor_rects = draw_actors(screen, player, npc, game_state, preview, camera_x)
+            self.hud_rects = draw_hud(screen, player, npc, game_state, countdown, winner, hit_message, wind)
+            self.hud_state = hud_state
+            if overlay:
+                self.actor_rects += overlay(screen)
+            return None
+
+        # Restore the background under last frame's actors
+        dirty = list(self.actor_rects)
+        for rect in self.actor_rects:
+            screen.blit(background, rect, rect)
+
+        # The HUD sits on top of actors and its text is blended, so it is cleared
+        # and repainted when its contents change or an actor crossed it
+        hud_dirty = (hud_state != self.hud_state or
+                     any(rect.collidelist(self.hud_rects) != -1 for rect in self.actor_rects))
+        if hud_dirty:
+            self.clear_hud(background)
+
+        actor_rects = draw_actors(screen, player, npc, game_state, preview, camera_x)
+
+        # An actor moved under the HUD this frame - clear it and draw the actors again
+        if not hud_dirty and any(rect.collidelist(self.hud_rects) != -1 for rect in actor_rects):
+            hud_dirty = True
+            for rect in actor_rects:
+                screen.blit(background, rect, rect)
+            self.clear_hud(background)
+            actor_rects = draw_actors(screen, player, npc, game_state, preview, camera_x)
+
+        if hud_dirty:
+            dirty.extend(self.hud_rects)
+            self.hud_rects = draw_hud(screen, player, npc, game_state, countdown, winner, hit_message, wind)
+            dirty.extend(self.hud_rects)
+            self.hud_state = hud_state
+
+        if overlay:
+            actor_rects += overlay(screen)
+
+        dirty.extend(actor_rects)
+        self.actor_rects = actor_rects
+        return dirty
+
+    def clear_hud(self, background):
+        for rect in self.hud_rects:
+            self.screen.blit(background, rect, rect)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Wild West Duel")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="only repaint and present the parts of the screen that change")
+    parser.add_argument("--text-stats", action="store_true",
+                        help="print HUD text cache hit/miss statistics on exit")
+    parser.add_argument("--system-font", metavar="NAME",
+                        help="use an installed system font (e.g. Arial) instead of the bundled one")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="print how long startup took up to the first frame as JSON and exit")
+    parser.add_argument("--seed", type=int,
+                        help="seed for terrain and NPC aim, to reproduce a match")
+    parser.add_argument("--terrain", type=int, metavar="SEED",
+                        help="play every game on the terrain with this seed (see duel_catalog.py)")
+    parser.add_argument("--catalog", metavar="DIR",
+                        help="take the trajectory preview of seeded terrains from this terrain catalog")
+    parser.add_argument("--record", metavar="PATH",
+                        help="record the match to a replay file")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="watch a recorded match instead of playing")
+    parser.add_argument("--uncapped", action="store_true",
+                        help="don't limit the frame rate to 60 fps (fast replay playback)")
+    parser.add_argument("--profile", action="store_true",
+                        help="start with the frame profiler overlay shown (F3 toggles it)")
+    parser.add_argument("--profile-log", metavar="PATH",
+                        help="write per-frame phase timings to a CSV file")
+    parser.add_argument("--telemetry", metavar="DIR",
+                        help="write per-round telemetry (aims, impacts, damage...) to JSONL files in DIR")
+    parser.add_argument("--resolution", type=parse_resolution, metavar="WxH",
+                        help=f"render at this internal resolution and scale it to the window "
+                             f"(16:9, e.g. 960x540; default {WIDTH}x{HEIGHT} unscaled)")
+    parser.add_argument("--world-width", type=int, default=WIDTH, metavar="PIXELS",
+                        help=f"width of the battlefield, at least the screen width (default {WIDTH})")
+    parser.add_argument("--difficulty", choices=DIFFICULTY_LEVELS,
+                        help="let the NPC aim with the ballistic solver at this skill (default: random drift)")
+    parser.add_argument("--weapon", choices=WEAPON_NAMES,
+                        help="your weapon (default: revolver)")
+    parser.add_argument("--npc-weapon", choices=WEAPON_NAMES,
+                        help="the other duelist's weapon (default: revolver)")
+    parser.add_argument("--integrator", choices=INTEGRATORS,
+                        help="integrate bullet flight with this method (default: euler, one step per frame)")
+    parser.add_argument("--substeps", type=int, default=1, metavar="N",
+                        help="integrator steps per frame (default 1)")
+    parser.add_argument("--tolerance", type=float, metavar="PX",
+                        help="with --integrator rk4, halve each shot's steps until they agree to PX (adaptive)")
+    parser.add_argument("--wind", type=float, default=0.0, metavar="MAX",
+                        help="blow a random wind of up to MAX px/frame^2 each round (e.g. 0.05)")
+    parser.add_argument("--free-for-all", type=int, metavar="DUELISTS",
+                        help="free-for-all against DUELISTS - 1 NPCs, everyone firing at once")
+    parser.add_argument("--host", type=int, metavar="PORT",
+                        help="host a two-player match over the network on this UDP port")
+    parser.add_argument("--connect", metavar="HOST:PORT",
+                        help="join a two-player match hosted with --host")
+    args = parser.parse_args(argv)
+    if args.world_width < WIDTH:
+        parser.error(f"--world-width must be at least {WIDTH}")
+    network = args.host is not None or args.connect
+    if network and (args.record or args.replay):
+        parser.error("network matches can't be recorded or replayed")
+    if network and args.difficulty:
+        parser.error("--difficulty only applies when playing the NPC")
+    if not 1 <= args.substeps <= 255:
+        parser.error("--substeps must be between 1 and 255")
+    if args.tolerance is not None and (args.integrator != "rk4" or args.tolerance <= 0):
+        parser.error("--tolerance needs --integrator rk4 and a positive value")
+    physics = None
+    if args.integrator or args.weapon or args.npc_weapon or args.wind:
+        physics = {"integrator": args.integrator, "substeps": args.substeps, "tolerance": args.tolerance,
+                   "weapon": args.weapon, "npc_weapon": args.npc_weapon, "max_wind": abs(args.wind)}
+    if network and physics:
+        parser.error("weapons, integrators and wind aren't supported in network matches")
+    if network and args.terrain is not None:
+        parser.error("--terrain isn't supported in network matches")
+    free_for_all = args.free_for_all is not None
+    if free_for_all and (network or args.record or args.replay or physics or args.terrain is not None or
+                         args.dirty_rects):
+        parser.error("--free-for-all can't be combined with network play, replays, physics options, "
+                     "--terrain or --dirty-rects")
+    if args.telemetry and (network or free_for_all):
+        parser.error("--telemetry isn't supported in network or free-for-all matches")
+    if free_for_all and args.free_for_all < 2:
+        parser.error("--free-for-all needs at least two duelists")
+
+    global system_font_name
+    system_font_name = args.system_font
 
-def main():
+    startup = {"imports": IMPORTS_DONE - STARTUP_START}
+    phase_start = time.perf_counter()
+
+    init_display(args.resolution)
     clock = pygame.time.Clock()
-    
-    # Define player and NPC positions
-    player_x = 50
-    npc_x = WIDTH - 110
-    
-    # Create terrain
-    terrain = Terrain()
-    
-    # Set the terrain in the Player class
-    Player.terrain = terrain
-    
-    # Get ground levels for player and NPC positions
-    player_ground_level = terrain.get_ground_level_at(player_x + 30)  # Center of player (half width)
-    npc_ground_level = terrain.get_ground_level_at(npc_x + 30)  # Center of NPC (half width)
-    
-    # Create player and NPC with positions based on terrain
-    player = Player(player_x, player_ground_level - 60, BLUE, is_player=True)  # Height is 60 now
-    npc = Player(npc_x, npc_ground_level - 60, RED)
-    
-    # Game states: "aiming" -> "countdown" -> "shooting" -> "result" -> back to "aiming" or "game_over"
-    game_state = "aiming"
-    countdown_start = 0
-    countdown_value = 3
-    winner = None
-    hit_message = None
-    
+    startup["display"] = time.perf_counter() - phase_start
+    renderer = DirtyRectRenderer(screen) if args.dirty_rects else None
+
+    # All game rules run in the headless simulation; this loop only feeds it
+    # keyboard input once per frame and draws the result
+    phase_start = time.perf_counter()
+    replay = None
+    recorder = None
+    session = None
+    if network:
+        # Two-player match: the simulation is driven through the rollback
+        # session, the host playing the left duelist. Networking (and
+        # asyncio) is only imported for it, like the other optional modes.
+        import asyncio
+        from duel_net import NetError, NetSession
+        net_loop = asyncio.new_event_loop()
+        try:
+            if args.host is not None:
+                session = net_loop.run_until_complete(NetSession.host(args.host, args.seed, args.world_width))
+                print(f"Waiting for the other player on port {args.host}...")
+            else:
+                host, _, port = args.connect.rpartition(":")
+                session = net_loop.run_until_complete(NetSession.connect(host or "127.0.0.1", int(port)))
+                print(f"Connecting to {args.connect}...")
+            duel = net_loop.run_until_complete(session.wait_connected(timeout=120))
+        except (OSError, ValueError, NetError) as error:
+            print(f"Network error: {error}")
+            pygame.quit()
+            sys.exit(1)
+        sim = duel.sim
+        pending_inputs = 0
+    elif free_for_all:
+        from duel_ffa import FreeForAll
+        sim = FreeForAll(random.Random(args.seed) if args.seed is not None else None, args.free_for_all,
+                         args.world_width, difficulty=args.difficulty)
+    elif args.replay:
+        # Replays re-simulate the recorded inputs from the recorded seed
+        replay = Replay.load(args.replay)
+        replay_frame = 0
+        sim = replay.new_simulation()
+    else:
+        seed = args.seed
+        if seed is None and args.record:
+            seed = new_seed()
+        brain = NpcBrain(args.difficulty) if args.difficulty else None
+        sim = DuelSimulation(random.Random(seed) if seed is not None else None, args.world_width, npc_brain=brain,
+                             terrain_seed=args.terrain, **simulation_physics(**physics or {}))
+        if args.record:
+            recorder = ReplayRecorder(args.record, seed, args.world_width, args.difficulty, physics, args.terrain)
+    startup["simulation"] = time.perf_counter() - phase_start
+
+    camera = Camera(sim.world_width)
+
+    # The duelist this keyboard controls
+    local_is_player = session is None or session.is_host
+
+    # Trajectory preview tables are built once per terrain; T toggles the arc
+    catalog = None
+    if args.catalog:
+        from duel_catalog import TerrainCatalog
+        catalog = TerrainCatalog(args.catalog)
+    trajectory_preview = TrajectoryPreview(catalog)
+    show_preview = True
+
+    # Frame profiler; None whenever it is neither shown nor logging, so the
+    # phase timing costs nothing while it's off
+    frame_profiler = FrameProfiler(log_path=args.profile_log)
+    show_profiler = args.profile
+    profiler = frame_profiler if show_profiler or args.profile_log else None
+    sim.profiler = profiler
+
+    # Per-round telemetry, written out by a background thread
+    telemetry = None
+    if args.telemetry:
+        from duel_telemetry import TelemetryWriter
+        header = {"source": "replay" if replay else "game", "replay": args.replay,
+                  "seed": replay.seed if replay else seed, "world_width": sim.world_width,
+                  "difficulty": replay.difficulty if replay else args.difficulty,
+                  "physics": replay.physics if replay else physics,
+                  "terrain": replay.terrain_seed if replay else args.terrain}
+        telemetry = TelemetryWriter(args.telemetry, header)
+        sim.telemetry = telemetry
+
     # Key state tracking for continuous adjustments
     keys_pressed = {
         pygame.K_UP: False,
         pygame.K_DOWN: False
     }
-    
-    # Key repeat settings
-    key_repeat_delay = 100  # ms before starting to repeat
-    key_repeat_interval = 30  # ms between repeats
-    last_key_action_time = 0
-    
-    # NPC variables
-    npc_aim_angle_change = 0
-    npc_last_aim_time = 0
-    npc_aim_interval = 300  # Time between NPC aim adjustments (ms)
-    
-    # Randomize initial NPC aim
-    npc.aim_angle = random.randint(5, 15)
-    
-    # Reset function for next round
-    def reset_for_next_round():
-        nonlocal game_state, hit_message, countdown_value
-        # Reset bullets
-        player.bullet = None
-        npc.bullet = None
-        player.has_shot = False
-        npc.has_shot = False
-        
-        # Define player and NPC positions - keep the same positions
-        player_x = 50
-        npc_x = WIDTH - 110
-        
-        # Keep the same terrain between rounds
-        # Just reset player positions to their original spots
-        player_ground_level = terrain.get_ground_level_at(player_x + 30)
-        npc_ground_level = terrain.get_ground_level_at(npc_x + 30)
-        
-        # Update player positions
-        player.x = player_x
-        player.y = player_ground_level - 60
-        npc.x = npc_x
-        npc.y = npc_ground_level - 60
-        
-        # Reset arm positions to downward position
-        player.current_arm_angle = -45  # No direction multiplier
-        npc.current_arm_angle = -45  # No direction multiplier
-        
-        # Reset game state
-        game_state = "aiming"
-        hit_message = None
-        countdown_value = 3
-        
-        # Randomize NPC aim for next round
-        npc.aim_angle = random.randint(5, 30)
-        
-        # Reset NPC aim behavior
-        nonlocal npc_aim_angle_change, npc_last_aim_time
-        npc_aim_angle_change = random.choice([-1, 0, 1])
-        npc_last_aim_time = pygame.time.get_ticks()
-    
-    # Initialize NPC aim behavior
-    npc_aim_angle_change = random.choice([-1, 0, 1])
-    npc_last_aim_time = pygame.time.get_ticks()
-    
+
     running = True
     while running:
-        current_time = pygame.time.get_ticks()
-        
+        if profiler:
+            profiler.begin_frame()
+        inputs = 0
+
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
-                
+
             if event.type == pygame.KEYDOWN:
                 # Track key press state for continuous adjustments
                 if event.key in keys_pressed:
                     keys_pressed[event.key] = True
-                    last_key_action_time = current_time - key_repeat_delay  # Allow immediate action
-                
-                # Player controls during aiming - immediate response
-                if game_state == "aiming":
-                    if event.key == pygame.K_UP:
-                        player.adjust_aim_angle(1)  # Increase angle
-                    elif event.key == pygame.K_DOWN:
-                        player.adjust_aim_angle(-1)  # Decrease angle
-                    elif event.key == pygame.K_SPACE:
-                        # Start countdown when player is ready
-                        game_state = "countdown"
-                        countdown_start = pygame.time.get_ticks()
-                
-                # Game over controls
-                if game_state == "game_over":
-                    if event.key == pygame.K_r:
-                        # Reset game completely
-                        # Define player and NPC positions
-                        player_x = 50
-                        npc_x = WIDTH - 110
-                        
-                        # Generate new terrain
-                        terrain = Terrain()
-                        
-                        # Update the terrain in the Player class
-                        Player.terrain = terrain
-                        
-                        # Get new ground levels
-                        player_ground_level = terrain.get_ground_level_at(player_x + 30)
-                        npc_ground_level = terrain.get_ground_level_at(npc_x + 30)
-                        
-                        # Create new players at the correct heights
-                        player = Player(player_x, player_ground_level - 60, BLUE, is_player=True)
-                        npc = Player(npc_x, npc_ground_level - 60, RED)
-                        npc.aim_angle = random.randint(5, 30)
-                        game_state = "aiming"
-                        winner = None
-                        hit_message = None
-                        countdown_value = 3
-                        
-                        # Reset NPC aim behavior
-                        npc_aim_angle_change = random.choice([-1, 0, 1])
-                        npc_last_aim_time = pygame.time.get_ticks()
-                        
-                        # Make sure arms start in downward position
-                        player.current_arm_angle = -45  # No direction multiplier
-                        npc.current_arm_angle = -45  # No direction multiplier
-                    elif event.key == pygame.K_q:
-                        running = False
-            
+
+                # A tap shorter than one frame still counts as a press
+                if event.key == pygame.K_UP:
+                    inputs |= INPUT_UP | INPUT_UP_PRESSED
+                elif event.key == pygame.K_DOWN:
+                    inputs |= INPUT_DOWN | INPUT_DOWN_PRESSED
+                elif event.key == pygame.K_SPACE:
+                    inputs |= INPUT_READY
+                elif event.key == pygame.K_r:
+                    inputs |= INPUT_RESTART
+                elif event.key == pygame.K_t:
+                    show_preview = not show_preview
+                elif event.key == pygame.K_F3:
+                    show_profiler = not show_profiler
+                    if renderer:
+                        renderer.terrain = None  # Repaint the whole screen without the overlay
+                elif event.key == pygame.K_q and sim.game_state == "game_over":
+                    running = False
+
             elif event.type == pygame.KEYUP:
                 # Track key release
                 if event.key in keys_pressed:
                     keys_pressed[event.key] = False
-        
-        # Handle continuous key presses for aiming adjustments
-        if game_state == "aiming" and current_time - last_key_action_time > key_repeat_interval:
-            if keys_pressed[pygame.K_UP]:
-                player.adjust_aim_angle(1)
-                last_key_action_time = current_time
-            elif keys_pressed[pygame.K_DOWN]:
-                player.adjust_aim_angle(-1)
-                last_key_action_time = current_time
-        
-        # Update game state based on current state
-        if game_state == "aiming":
-            # NPC randomly adjusts aim periodically
-            if current_time - npc_last_aim_time > npc_aim_interval:
-                # Randomly change aim direction occasionally
-                if random.random() < 0.3:
-                    npc_aim_angle_change = random.choice([-1, 0, 1])
-                
-                # Apply the changes
-                if npc_aim_angle_change != 0:
-                    npc.adjust_aim_angle(npc_aim_angle_change)
-                
-                npc_last_aim_time = current_time
-        
-        elif game_state == "countdown":
-            elapsed = current_time - countdown_start
-            
-            # Animate arms to move toward target angle during countdown
-            player.target_arm_angle = player.aim_angle
-            npc.target_arm_angle = npc.aim_angle
-            
-            # Update arm animations
-            player.update_arm_animation()
-            npc.update_arm_animation()
-            
-            if elapsed < 1000:
-                countdown_value = 3
-            elif elapsed < 2000:
-                countdown_value = 2
-            elif elapsed < 3000:
-                countdown_value = 1
-            else:
-                # Both shoot simultaneously after countdown
-                player.shoot()
-                npc.shoot()
-                game_state = "shooting"
-                countdown_value = "FIRE!"
-        
-        elif game_state == "shooting":
-            # Update both bullets
-            player.update_bullet(terrain)
-            npc.update_bullet(terrain)
-            
-            # Track hits
-            player_hit_npc = False
-            npc_hit_player = False
-            
-            # Check for player hitting NPC
-            if player.bullet and player.bullet.active:
-                if player.check_hit(npc):
-                    player_hit_npc = True
-                    damage = 40 if player.bullet.y < npc.y else 20
-                    hit_message = f"Player hit NPC for {damage} damage!"
-            
-            # Check for NPC hitting player
-            if npc.bullet and npc.bullet.active:
-                if npc.check_hit(player):
-                    npc_hit_player = True
-                    damage = 40 if npc.bullet.y < player.y else 20
-                    if hit_message:
-                        hit_message += f" NPC hit Player for {damage} damage!"
-                    else:
-                        hit_message = f"NPC hit Player for {damage} damage!"
-            
-            # Check if both bullets are no longer active
-            bullets_done = ((not player.bullet or not player.bullet.active) and 
-                           (not npc.bullet or not npc.bullet.active))
-            
-            if bullets_done:
-                if not player_hit_npc and not npc_hit_player:
-                    hit_message = "Both missed!"
-                game_state = "result"
-                # Store the time when we entered result state
-                main.result_start_time = current_time
-        
-        elif game_state == "result":
-            # Check if anyone has died
-            if player.health <= 0 and npc.health <= 0:
-                winner = "Draw - Both died!"
-                game_state = "game_over"
-            elif player.health <= 0:
-                winner = "NPC"
-                game_state = "game_over"
-            elif npc.health <= 0:
-                winner = "Player"
-                game_state = "game_over"
+
+        if keys_pressed[pygame.K_UP]:
+            inputs |= INPUT_UP
+        if keys_pressed[pygame.K_DOWN]:
+            inputs |= INPUT_DOWN
+
+        # During playback the recorded inputs replace the keyboard
+        if replay:
+            if replay_frame >= len(replay.inputs):
+                break
+            inputs = replay.inputs[replay_frame]
+            replay_frame += 1
+
+        if profiler:
+            profiler.lap("events")
+        if args.startup_time:
+            phase_start = time.perf_counter()
+
+        if session:
+            # Presses made while waiting on the other player are kept for the next frame
+            pending_inputs |= inputs
+            net_loop.run_until_complete(asyncio.sleep(0))  # Handle packets that arrived
+            if duel.can_advance():
+                duel.advance(pending_inputs)
+                pending_inputs = 0
+            session.send_inputs()
+        else:
+            sim.step(inputs)
+        if recorder:
+            recorder.record(inputs, sim)
+        if replay:
+            expected = replay.checksums.get(sim.frame)
+            if expected is not None and sim.checksum() != expected:
+                print(f"Replay out of sync at frame {sim.frame}")
+        if profiler:
+            profiler.lap("other")
+
+        preview = None
+        if show_preview and sim.game_state == "aiming":
+            if free_for_all:
+                if sim.player_alive():
+                    preview = trajectory_preview.points_for(sim.player, sim.duelists[sim.opponents[0]], sim.terrain)
+            elif local_is_player:
+                preview = trajectory_preview.points_for(sim.player, sim.npc, sim.terrain, sim.ballistics, sim.wind)
             else:
-                # Wait a moment before next round
-                if not hasattr(main, "result_start_time"):
-                    main.result_start_time = current_time
-                
-                # After 2 seconds, move to next round
-                if current_time - main.result_start_time > 2000:
-                    delattr(main, "result_start_time")
-                    reset_for_next_round()
-        
+                preview = trajectory_preview.points_for(sim.npc, sim.player, sim.terrain, sim.ballistics, sim.wind)
+
         # Draw everything
-        draw_scene(player, npc, terrain, game_state, "simultaneous", countdown_value, winner, hit_message)
-        
-        pygame.display.flip()
-        clock.tick(60)
-    
+        if free_for_all:
+            camera_x = camera.follow_free_for_all(sim)
+        else:
+            camera_x = camera.follow(sim, sim.player if local_is_player else sim.npc)
+        overlay = None
+        if show_profiler and profiler:
+            def draw_overlay(surface):
+                profiler.lap("scene_draw")
+                rects = draw_profiler_overlay(surface, profiler)
+                profiler.lap("profiler")
+                return rects
+            overlay = draw_overlay
+        if free_for_all:
+            draw_free_for_all(sim, preview, camera_x)
+            if overlay:
+                overlay(screen)
+            dirty = None
+        elif renderer:
+            dirty = renderer.draw(sim.player, sim.npc, sim.terrain, sim.game_state,
+                                  sim.countdown_value, sim.winner, sim.hit_message, preview, overlay, camera_x,
+                                  sim.wind)
+        else:
+            draw_scene(sim.player, sim.npc, sim.terrain, sim.game_state, "simultaneous",
+                       sim.countdown_value, sim.winner, sim.hit_message, preview, camera_x, sim.wind)
+            if overlay:
+                overlay(screen)
+            dirty = None
+        if profiler:
+            profiler.lap("scene_draw")
+
+        if dirty is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
+        if profiler:
+            profiler.lap("flip")
+            profiler.end_frame()
+
+        # Time to first frame includes loading fonts, the background layer and
+        # the trajectory preview tables
+        if args.startup_time:
+            startup["first_frame"] = time.perf_counter() - phase_start
+            startup["total"] = time.perf_counter() - STARTUP_START
+            print(json.dumps({name: round(seconds * 1000, 2) for name, seconds in startup.items()}))
+            running = False
+        if not args.uncapped:
+            clock.tick(60)
+
+        # Start or stop timing when the overlay is toggled
+        if not args.profile_log and (profiler is not None) != show_profiler:
+            profiler = frame_profiler if show_profiler else None
+            sim.profiler = profiler
+
+    if recorder:
+        recorder.close()
+        print(f"Recorded {recorder.frames} frames to {args.record}")
+
+    if session:
+        session.close()
+        print("Network:", json.dumps(session.stats()))
+        net_loop.close()
+
+    if telemetry:
+        telemetry.close()
+        print("Telemetry:", json.dumps(telemetry.stats()))
+
+    if args.text_stats:
+        print("Text cache:", text_cache.stats())
+
+    frame_profiler.close()
+    if args.profile_log:
+        averages = frame_profiler.phase_averages()
+        print("Mean ms per frame:", {phase: round(milliseconds, 3) for phase, milliseconds in averages.items()})
+
     pygame.quit()
     sys.exit()
 
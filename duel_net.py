@@ -0,0 +1,457 @@
+# Networked two-player duels over UDP.
+# Both peers run the same DuelSimulation from a seed the host picks, so the
+# only traffic is each side's per-frame input bits. Remote inputs that haven't
+# arrived yet are predicted (the last known aim keys stay held); when the real
+# ones differ, the simulation is rolled back to a snapshot taken before that
+# frame and re-simulated, so local input never waits on the network.
+#
+# The host plays the left duelist, the peer that joins plays the right one.
+#
+#   python duel_game.py --host 7777                # play, waiting for a peer
+#   python duel_game.py --connect 127.0.0.1:7777   # join it
+#
+#   python duel_net.py selftest --latency 60 --jitter 20 --loss 0.05
+# runs two scripted players in separate processes over loopback with
+# artificial latency and packet loss and checks they finish in sync.
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+from duel_core import (
+    WIDTH, INPUT_UP, INPUT_DOWN, INPUT_READY, INPUT_RESTART, DuelSimulation,
+)
+from duel_replay import new_seed
+
+PROTOCOL_VERSION = 1
+
+# Packets, all starting with a one byte type
+PACKET_HELLO = 1  # peer -> host: protocol version
+PACKET_WELCOME = 2  # host -> peer: seed, world width
+PACKET_INPUTS = 3  # ack, first frame, count, then count input bytes
+PACKET_PING = 4  # sender's clock, echoed back in a PONG
+PACKET_PONG = 5
+PACKET_FIN = 6  # last frame, state checksum at that frame
+HELLO = struct.Struct("<BI")
+WELCOME = struct.Struct("<BQI")
+INPUTS = struct.Struct("<BIIB")
+PING = struct.Struct("<Bd")
+FIN = struct.Struct("<BII")
+
+# Rollback window: the simulation never runs more than this many frames past
+# the last frame it has the remote inputs for
+MAX_ROLLBACK = 15
+
+# Unacknowledged inputs are resent in every packet, so a lost packet costs
+# nothing as long as a later one arrives
+MAX_INPUTS_PER_PACKET = 64
+
+HANDSHAKE_RESEND_S = 0.2
+PING_INTERVAL_S = 0.5
+
+# Remote aim keys are predicted to stay held; presses are never predicted
+PREDICTED_BITS = INPUT_UP | INPUT_DOWN
+
+class NetError(Exception):
+    pass
+
+# Rollback bookkeeping for one side of a match, independent of the transport
+class RollbackDuel:
+    def __init__(self, sim, local_is_player, max_rollback=MAX_ROLLBACK):
+        self.sim = sim
+        self.local_is_player = local_is_player
+        self.max_rollback = max_rollback
+
+        self.local_inputs = {}  # Frame -> local input bits, kept until the peer has them
+        self.remote_inputs = {}  # Frame -> remote input bits received
+        self.used_remote = {}  # Frame -> remote input bits the frame was simulated with
+        self.snapshots = {}  # Frame -> state just before that frame was simulated
+        self.confirmed = 0  # Remote inputs are known for every frame up to this one
+
+        self.rollbacks = 0
+        self.resimulated_frames = 0
+        self.max_rollback_depth = 0
+
+    def can_advance(self):
+        return self.sim.frame - self.confirmed < self.max_rollback
+
+    def advance(self, local_inputs):
+        frame = self.sim.frame + 1
+        self.local_inputs[frame] = local_inputs
+        self.simulate(frame)
+        self.confirm()
+
+    def simulate(self, frame):
+        remote = self.remote_inputs.get(frame)
+        if remote is None:
+            remote = self.remote_inputs.get(self.confirmed, 0) & PREDICTED_BITS
+        self.snapshots[frame] = self.sim.snapshot()
+        self.used_remote[frame] = remote
+        local = self.local_inputs[frame]
+        if self.local_is_player:
+            self.sim.step(local, remote)
+        else:
+            self.sim.step(remote, local)
+
+    def add_remote(self, first_frame, inputs):
+        # Take remote inputs in, roll back to the first frame that was
+        # simulated with a wrong prediction and re-simulate up to now
+        wrong = None
+        for frame, value in enumerate(inputs, first_frame):
+            if frame <= self.confirmed or frame in self.remote_inputs:
+                continue
+            self.remote_inputs[frame] = value
+            if frame <= self.sim.frame and self.used_remote[frame] != value and (wrong is None or frame < wrong):
+                wrong = frame
+
+        if wrong is not None:
+            current = self.sim.frame
+            self.sim.restore(self.snapshots[wrong])
+            for frame in range(wrong, current + 1):
+                self.simulate(frame)
+            depth = current - wrong + 1
+            self.rollbacks += 1
+            self.resimulated_frames += depth
+            self.max_rollback_depth = max(self.max_rollback_depth, depth)
+
+        self.confirm()
+
+    def confirm(self):
+        # Frames up to the confirmed one can never be rolled back again
+        confirmed = self.confirmed
+        while confirmed + 1 in self.remote_inputs and confirmed + 1 <= self.sim.frame:
+            confirmed += 1
+            self.snapshots.pop(confirmed, None)
+            self.used_remote.pop(confirmed, None)
+            self.remote_inputs.pop(confirmed - 1, None)
+        self.confirmed = confirmed
+
+    def forget_local(self, peer_confirmed):
+        # Drop local inputs the peer has confirmed and we can't roll back past
+        for frame in [frame for frame in self.local_inputs if frame <= min(peer_confirmed, self.confirmed)]:
+            del self.local_inputs[frame]
+
+# Artificial network conditions applied to outgoing packets, for testing
+class LinkConditions:
+    def __init__(self, latency_ms=0, jitter_ms=0, loss=0.0, rng=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.loss = loss
+        self.rng = rng or random.Random()
+
+    def delay(self):
+        # One-way delay in seconds for the next packet, or None to drop it
+        if self.loss and self.rng.random() < self.loss:
+            return None
+        return (self.latency_ms + self.rng.uniform(0, self.jitter_ms)) / 1000
+
+class PeerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, session):
+        self.session = session
+
+    def datagram_received(self, data, address):
+        self.session.receive(data, address)
+
+    def error_received(self, error):
+        # ICMP errors (e.g. the peer isn't listening yet) are harmless for UDP
+        pass
+
+# One peer of a match: handshake, input exchange, RTT and traffic statistics
+class NetSession:
+    def __init__(self, is_host, conditions=None):
+        self.is_host = is_host
+        self.conditions = conditions or LinkConditions()
+        self.transport = None
+        self.peer = None
+        self.seed = None
+        self.world_width = WIDTH
+        self.connected = None  # Future set once the handshake is done
+        self.duel = None
+
+        self.peer_confirmed = 0  # Our inputs the peer has up to this frame
+        self.peer_fin = None  # (frame, checksum) the peer finished with
+        self.last_ping = 0.0
+        self.started = None
+
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.packets_dropped = 0
+        self.rtt_samples = []
+
+    @classmethod
+    async def host(cls, port, seed=None, world_width=WIDTH, conditions=None, bind="0.0.0.0"):
+        session = cls(True, conditions)
+        session.seed = seed if seed is not None else new_seed()
+        session.world_width = world_width
+        await session.open(local_addr=(bind, port))
+        return session
+
+    @classmethod
+    async def connect(cls, host, port, conditions=None):
+        session = cls(False, conditions)
+        # Resolve the host so datagrams from it match the peer address
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, port, family=socket.AF_INET,
+                                                                 type=socket.SOCK_DGRAM)
+        if not addresses:
+            raise NetError(f"can't resolve {host}")
+        session.peer = addresses[0][4]
+        await session.open(local_addr=("0.0.0.0", 0))
+        return session
+
+    async def open(self, **endpoint):
+        loop = asyncio.get_running_loop()
+        self.connected = loop.create_future()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: PeerProtocol(self), **endpoint)
+
+    async def wait_connected(self, timeout=None):
+        # Finish the handshake and set up the match
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while not self.connected.done():
+            if not self.is_host:
+                self.send(HELLO.pack(PACKET_HELLO, PROTOCOL_VERSION))
+            if deadline is not None and time.perf_counter() > deadline:
+                raise NetError("timed out waiting for the other player")
+            try:
+                await asyncio.wait_for(asyncio.shield(self.connected), HANDSHAKE_RESEND_S)
+            except asyncio.TimeoutError:
+                pass
+        sim = DuelSimulation(random.Random(self.seed), self.world_width, two_player=True)
+        self.duel = RollbackDuel(sim, local_is_player=self.is_host)
+        self.started = time.perf_counter()
+        return self.duel
+
+    def send(self, data):
+        if self.peer is None:
+            return
+        delay = self.conditions.delay()
+        if delay is None:
+            self.packets_dropped += 1
+            return
+        self.bytes_sent += len(data)
+        self.packets_sent += 1
+        if delay:
+            asyncio.get_running_loop().call_later(delay, self.send_now, data, self.peer)
+        else:
+            self.send_now(data, self.peer)
+
+    def send_now(self, data, peer):
+        if not self.transport.is_closing():
+            self.transport.sendto(data, peer)
+
+    def receive(self, data, address):
+        if not data:
+            return
+        self.bytes_received += len(data)
+        self.packets_received += 1
+        packet_type = data[0]
+
+        if packet_type == PACKET_HELLO and self.is_host and len(data) == HELLO.size:
+            (_, version) = HELLO.unpack(data)
+            if version != PROTOCOL_VERSION or (self.peer is not None and address != self.peer):
+                return
+            self.peer = address
+            self.send(WELCOME.pack(PACKET_WELCOME, self.seed, self.world_width))
+            if not self.connected.done():
+                self.connected.set_result(True)
+        elif address != self.peer:
+            return
+        elif packet_type == PACKET_WELCOME and not self.is_host and len(data) == WELCOME.size:
+            _, self.seed, self.world_width = WELCOME.unpack(data)
+            if not self.connected.done():
+                self.connected.set_result(True)
+        elif packet_type == PACKET_INPUTS and self.duel and len(data) >= INPUTS.size:
+            _, ack, first_frame, count = INPUTS.unpack_from(data)
+            self.peer_confirmed = max(self.peer_confirmed, ack)
+            self.duel.add_remote(first_frame, data[INPUTS.size:INPUTS.size + count])
+            self.duel.forget_local(self.peer_confirmed)
+        elif packet_type == PACKET_PING and len(data) == PING.size:
+            self.send(PING.pack(PACKET_PONG, PING.unpack(data)[1]))
+        elif packet_type == PACKET_PONG and len(data) == PING.size:
+            self.rtt_samples.append((time.perf_counter() - PING.unpack(data)[1]) * 1000)
+        elif packet_type == PACKET_FIN and len(data) == FIN.size:
+            _, frame, checksum = FIN.unpack(data)
+            self.peer_fin = (frame, checksum)
+
+    def send_inputs(self):
+        # Every local input the peer hasn't confirmed yet, plus our ack
+        duel = self.duel
+        first = self.peer_confirmed + 1
+        last = min(duel.sim.frame, first + MAX_INPUTS_PER_PACKET - 1)
+        inputs = bytes(duel.local_inputs[frame] for frame in range(first, last + 1))
+        self.send(INPUTS.pack(PACKET_INPUTS, duel.confirmed, first, len(inputs)) + inputs)
+
+        now = time.perf_counter()
+        if now - self.last_ping >= PING_INTERVAL_S:
+            self.last_ping = now
+            self.send(PING.pack(PACKET_PING, now))
+
+    def all_confirmed(self, frame):
+        return self.duel.confirmed >= frame and self.peer_confirmed >= frame
+
+    def send_fin(self):
+        self.send(FIN.pack(PACKET_FIN, self.duel.sim.frame, self.duel.sim.checksum()))
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        rtt = sorted(self.rtt_samples)
+        duel = self.duel
+        return {
+            "role": "host" if self.is_host else "peer",
+            "seconds": round(elapsed, 2),
+            "frames": duel.sim.frame if duel else 0,
+            "rtt_ms": {
+                "mean": round(sum(rtt) / len(rtt), 2) if rtt else None,
+                "min": round(rtt[0], 2) if rtt else None,
+                "max": round(rtt[-1], 2) if rtt else None,
+                "samples": len(rtt),
+            },
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "bandwidth_up_bps": round(self.bytes_sent * 8 / elapsed) if elapsed else 0,
+            "bandwidth_down_bps": round(self.bytes_received * 8 / elapsed) if elapsed else 0,
+            "packets_sent": self.packets_sent,
+            "packets_received": self.packets_received,
+            "packets_dropped": self.packets_dropped,
+            "rollbacks": duel.rollbacks if duel else 0,
+            "resimulated_frames": duel.resimulated_frames if duel else 0,
+            "max_rollback_depth": duel.max_rollback_depth if duel else 0,
+        }
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+
+# Scripted player for tests: wiggles its aim, readies up after a while and
+# restarts finished games
+class BotPlayer:
+    def __init__(self, rng):
+        self.rng = rng
+        self.held = 0
+        self.wait = 0
+
+    def inputs(self, sim):
+        rng = self.rng
+        if sim.game_state == "game_over":
+            return INPUT_RESTART if rng.random() < 0.02 else 0
+        if sim.game_state != "aiming":
+            return 0
+        if rng.random() < 0.05:
+            self.held = rng.choice([0, INPUT_UP, INPUT_DOWN])
+        self.wait += 1
+        if self.wait > 60 and rng.random() < 0.02:
+            self.wait = 0
+            return self.held | INPUT_READY
+        return self.held
+
+async def run_bot_match(session, frames, fps, bot_seed, timeout=60.0):
+    # Play frames frames with a BotPlayer, then wait for both sides to confirm
+    # everything and compare final checksums. Returns the match report.
+    duel = await session.wait_connected(timeout)
+    bot = BotPlayer(random.Random(bot_seed))
+    frame_time = 1 / fps if fps else 0
+    next_frame = time.perf_counter()
+    stalls = 0
+    while duel.sim.frame < frames:
+        if duel.can_advance():
+            duel.advance(bot.inputs(duel.sim))
+        else:
+            stalls += 1
+        session.send_inputs()
+        next_frame += frame_time
+        await asyncio.sleep(max(0.0, next_frame - time.perf_counter()))
+
+    # Keep exchanging until both have every input, then compare final states
+    deadline = time.perf_counter() + timeout
+    while not (session.all_confirmed(frames) and session.peer_fin):
+        if time.perf_counter() > deadline:
+            raise NetError("timed out finishing the match")
+        session.send_inputs()
+        if session.all_confirmed(frames):
+            session.send_fin()
+        await asyncio.sleep(frame_time or 0.001)
+    # Linger so the peer gets our FIN even if a few were lost
+    for _ in range(25):
+        session.send_fin()
+        session.send_inputs()
+        await asyncio.sleep(0.02)
+
+    report = session.stats()
+    report["stalled_frames"] = stalls
+    report["checksum"] = duel.sim.checksum()
+    report["peer_checksum"] = session.peer_fin[1]
+    report["in_sync"] = session.peer_fin == (frames, report["checksum"])
+    return report
+
+async def bot_main(args):
+    conditions = LinkConditions(args.latency, args.jitter, args.loss)
+    if args.command == "host":
+        session = await NetSession.host(args.port, args.seed, args.world_width, conditions)
+    else:
+        host, _, port = args.address.rpartition(":")
+        session = await NetSession.connect(host or "127.0.0.1", int(port), conditions)
+    try:
+        return await run_bot_match(session, args.frames, args.fps, args.bot_seed)
+    finally:
+        session.close()
+
+def selftest(args):
+    # Host and peer bots in two processes on loopback
+    common = ["--frames", str(args.frames), "--fps", str(args.fps), "--latency", str(args.latency),
+              "--jitter", str(args.jitter), "--loss", str(args.loss)]
+    script = os.path.abspath(__file__)
+    host = subprocess.Popen([sys.executable, script, "host", "--port", str(args.port), "--bot-seed", "1"] + common,
+                            stdout=subprocess.PIPE, text=True)
+    peer = subprocess.Popen([sys.executable, script, "join", f"127.0.0.1:{args.port}", "--bot-seed", "2"] + common,
+                            stdout=subprocess.PIPE, text=True)
+    reports = []
+    for process in (host, peer):
+        output, _ = process.communicate()
+        if process.returncode:
+            raise NetError(f"{'host' if process is host else 'peer'} failed")
+        reports.append(json.loads(output))
+    print(json.dumps(reports, indent=2))
+    in_sync = all(report["in_sync"] for report in reports) and reports[0]["checksum"] == reports[1]["checksum"]
+    print("in sync" if in_sync else "DESYNC", file=sys.stderr)
+    return 0 if in_sync else 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless networked duels for testing")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    host_parser = subparsers.add_parser("host", help="host a match played by a bot")
+    host_parser.add_argument("--port", type=int, default=7777)
+    host_parser.add_argument("--seed", type=int, help="match seed (random by default)")
+    host_parser.add_argument("--world-width", type=int, default=WIDTH)
+    join_parser = subparsers.add_parser("join", help="join a match as a bot")
+    join_parser.add_argument("address", help="HOST:PORT of the host")
+    selftest_parser = subparsers.add_parser("selftest", help="run a host and a peer bot on loopback")
+    selftest_parser.add_argument("--port", type=int, default=7777)
+    for subparser in (host_parser, join_parser, selftest_parser):
+        subparser.add_argument("--frames", type=int, default=1800, help="frames to play (default 1800)")
+        subparser.add_argument("--fps", type=float, default=60, help="frame rate, 0 for uncapped (default 60)")
+        subparser.add_argument("--latency", type=float, default=0, help="added one-way latency in ms")
+        subparser.add_argument("--jitter", type=float, default=0, help="added random one-way latency in ms")
+        subparser.add_argument("--loss", type=float, default=0, help="fraction of packets to drop")
+    for subparser in (host_parser, join_parser):
+        subparser.add_argument("--bot-seed", type=int, default=None, help="seed for the bot's inputs")
+    args = parser.parse_args(argv)
+
+    if args.command == "selftest":
+        return selftest(args)
+    try:
+        report = asyncio.run(bot_main(args))
+    except NetError as error:
+        print(error, file=sys.stderr)
+        return 1
+    print(json.dumps(report))
+    return 0 if report["in_sync"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
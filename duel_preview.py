@@ -0,0 +1,87 @@
+# Ballistic trajectory preview.
+# For every reachable aim angle the flight path from the shooter's pistol tip
+# is simulated once per terrain (and wind) with the batch engine, so showing
+# the true arc while aiming is just a table lookup. Seeded terrains can take
+# their tables from a terrain catalog (see duel_catalog) instead, as long as
+# the default revolver flies without wind or a custom integrator.
+import numpy as np
+
+from duel_batch import AIM_ANGLES, sweep_aim_angles
+
+# Aim angles are adjusted in 0.10 degree steps
+ANGLE_STEP = 0.10
+
+class TrajectoryTable:
+    def __init__(self, shooter, target, terrain, angles=AIM_ANGLES, ballistics=None, wind=0.0, entry=None):
+        self.terrain = terrain
+        if entry is not None:
+            # Read from a catalog entry, which covers every AIM_ANGLES angle
+            side = 0 if shooter.is_player else 1
+            self.angles = AIM_ANGLES
+            self.results = entry.shots(side)
+            self.paths_x = entry.path_x[side]
+            self.paths_y = entry.path_y[side]
+        else:
+            self.angles = np.asarray(angles, dtype=float)
+            self.results, paths = sweep_aim_angles(shooter, target, terrain, self.angles, trace=True,
+                                                   ballistics=ballistics, wind=wind)
+            self.paths_x = paths.x
+            self.paths_y = paths.y
+
+        # Screen points per angle index, converted on first use
+        self.points = {}
+
+    def index_for(self, angle):
+        # Aim angles drift slightly from exact tenths as steps accumulate
+        index = int(round((angle - self.angles[0]) / ANGLE_STEP))
+        return max(0, min(index, len(self.angles) - 1))
+
+    def points_for(self, angle):
+        # Integer screen points of the flight path, ready for pygame.draw.lines
+        index = self.index_for(angle)
+        points = self.points.get(index)
+        if points is None:
+            length = int(self.results.impact_frame[index]) + 1
+            xs = self.paths_x[index, :length].astype(int).tolist()
+            ys = self.paths_y[index, :length].astype(int).tolist()
+            points = self.points[index] = list(zip(xs, ys))
+        return points
+
+    def impact_for(self, angle):
+        # Impact point and hit zone for a shot at this angle
+        index = self.index_for(angle)
+        return (self.results.impact_x[index], self.results.impact_y[index],
+                int(self.results.zone[index]))
+
+# Holds one table per shooter and target for the current terrain and physics
+# and rebuilds them only when a new terrain is generated or the wind changes
+class TrajectoryPreview:
+    def __init__(self, catalog=None):
+        self.catalog = catalog  # duel_catalog.TerrainCatalog for seeded terrains, or None
+        self.terrain = None
+        self.physics = None
+        self.tables = {}
+
+    def table_for(self, shooter, target, terrain, ballistics=None, wind=0.0):
+        if terrain is not self.terrain or (ballistics, wind) != self.physics:
+            self.terrain = terrain
+            self.physics = (ballistics, wind)
+            self.tables = {}
+        key = (shooter.is_player, target.x, target.y)
+        table = self.tables.get(key)
+        if table is None:
+            entry = self.catalog_entry(shooter, target, terrain, ballistics, wind)
+            table = self.tables[key] = TrajectoryTable(shooter, target, terrain, ballistics=ballistics, wind=wind,
+                                                       entry=entry)
+        return table
+
+    def catalog_entry(self, shooter, target, terrain, ballistics, wind):
+        # The catalog entry holding this table, or None if there is no
+        # catalog or it wasn't built for these shots
+        if self.catalog is None or terrain.seed is None or ballistics is not None or wind:
+            return None
+        entry = self.catalog.get(terrain.seed, terrain.width)
+        return entry if entry.matches(shooter, target) else None
+
+    def points_for(self, shooter, target, terrain, ballistics=None, wind=0.0):
+        return self.table_for(shooter, target, terrain, ballistics, wind).points_for(shooter.aim_angle)
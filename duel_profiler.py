@@ -0,0 +1,95 @@
+# Per-phase frame profiler.
+# The game loop calls begin_frame() at the top of each frame, lap(phase) at
+# the end of each phase (the simulation does this for its own phases through
+# DuelSimulation.profiler) and end_frame() once the frame has been presented.
+# Time since the previous lap is charged to the named phase.
+#
+# Per-frame records can be written to a CSV file for offline analysis. When
+# the profiler is off the game holds None instead, so the only cost left is a
+# handful of `if profiler:` checks per frame.
+import csv
+import time
+from collections import deque
+
+# Phases in frame order
+PHASES = (
+    "events", "input_repeat", "npc_aim", "arm_animation", "bullet_update",
+    "hit_checks", "other", "scene_draw", "profiler", "flip",
+)
+
+# Frame-time histogram bins, in milliseconds (the last bin collects the rest)
+HISTOGRAM_BIN_MS = 2
+HISTOGRAM_BINS = 17
+
+class FrameProfiler:
+    def __init__(self, history=240, log_path=None):
+        # Rolling windows for the overlay
+        self.frame_times = deque(maxlen=history)  # Work time per frame (ms)
+        self.intervals = deque(maxlen=history)  # Start-to-start time per frame (ms)
+        self.phase_totals = dict.fromkeys(PHASES, 0.0)
+        self.frames = 0
+
+        self.frame_start = None
+        self.last = None
+        self.current = None
+        self.since_last_frame = 0.0
+
+        self.log_file = None
+        self.log_writer = None
+        if log_path:
+            self.log_file = open(log_path, "w", newline="")
+            self.log_writer = csv.writer(self.log_file)
+            self.log_writer.writerow(["frame", "since_last_frame_ms", "work_ms"] + [f"{phase}_ms" for phase in PHASES])
+
+    def begin_frame(self):
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.since_last_frame = (now - self.frame_start) * 1000
+            self.intervals.append(self.since_last_frame)
+        self.frame_start = self.last = now
+        self.current = dict.fromkeys(PHASES, 0.0)
+
+    def lap(self, phase):
+        # Charge the time since the last lap to phase
+        now = time.perf_counter()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        if self.current is None:
+            return
+        work = (self.last - self.frame_start) * 1000
+        self.frame_times.append(work)
+        self.frames += 1
+        phase_ms = [self.current[phase] * 1000 for phase in PHASES]
+        for phase, milliseconds in zip(PHASES, phase_ms):
+            self.phase_totals[phase] += milliseconds
+        if self.log_writer:
+            self.log_writer.writerow([self.frames, round(self.since_last_frame, 3), round(work, 3)] +
+                                     [round(milliseconds, 3) for milliseconds in phase_ms])
+        self.current = None
+
+    def fps(self):
+        # Rolling frames per second over the history window
+        if not self.intervals:
+            return 0.0
+        return 1000 * len(self.intervals) / sum(self.intervals)
+
+    def histogram(self):
+        # Frame count per work-time bin over the history window
+        counts = [0] * HISTOGRAM_BINS
+        for milliseconds in self.frame_times:
+            counts[min(int(milliseconds // HISTOGRAM_BIN_MS), HISTOGRAM_BINS - 1)] += 1
+        return counts
+
+    def phase_averages(self):
+        # Mean milliseconds per frame spent in each phase since the start
+        if not self.frames:
+            return dict.fromkeys(PHASES, 0.0)
+        return {phase: total / self.frames for phase, total in self.phase_totals.items()}
+
+    def close(self):
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
+            self.log_writer = None
@@ -0,0 +1,208 @@
+# Pooled projectiles.
+# Every projectile lives in a row of parallel NumPy arrays (position,
+# velocity, owner, alive flag and a fixed-size ring buffer of trail points),
+# so hundreds of shots in flight are updated with a handful of array
+# operations per frame and firing one never allocates an object. Rows are
+# recycled once their projectile has landed, left the screen or hit someone.
+#
+# Movement and hit tests are the batch engine's, so a pooled shot flies and
+# hits exactly like a Bullet fired with the same angle and speed.
+#
+# Hit tests go through a sort-and-sweep broad phase: duelists are sorted by
+# the left edge of their hitbox once (TargetIndex), each projectile's movement
+# finds the few whose x range it overlaps with a binary search, and only those
+# pairs get the exact swept test. The cost follows the number of projectiles
+# and near misses, not projectiles times duelists.
+from collections import namedtuple
+
+import numpy as np
+
+from duel_batch import ground_contacts, launch_velocities, player_contacts
+from duel_core import GRAVITY, HEAD_RADIUS, HEAD_OFFSET, ZONE_MISS
+
+# Projectiles that hit a duelist this frame, one array entry per hit: the pool
+# row, the index of the duelist in the targets list, the hit zone and the
+# impact point
+ProjectileHits = namedtuple("ProjectileHits", ["index", "target", "zone", "x", "y"])
+
+# Hitboxes of many duelists as arrays, in the shape player_contacts expects
+Hitboxes = namedtuple("Hitboxes", ["x", "y", "width", "height"])
+
+class TargetIndex:
+    def __init__(self, targets, indices=None):
+        # targets are Players; indices are what hits report as their target
+        # (and what projectile owners are compared with), their positions in
+        # targets by default. Build once per round: duelists don't move while
+        # shots are in flight.
+        count = len(targets)
+        boxes = np.array([(target.x, target.y, target.width, target.height) for target in targets], dtype=float)
+        x, y, width, height = boxes.reshape(count, 4).T
+        indices = np.arange(count) if indices is None else np.asarray(indices)
+
+        # Horizontal extent of body and head together
+        center_x = x + width // 2
+        left = np.minimum(x, center_x - HEAD_RADIUS)
+        right = np.maximum(x + width, center_x + HEAD_RADIUS)
+
+        order = np.argsort(left, kind="stable")
+        self.left = left[order]
+        self.right = right[order]
+        self.top = (y - HEAD_OFFSET - HEAD_RADIUS)[order]
+        self.bottom = (y + height)[order]
+        self.hitboxes = Hitboxes(x[order], y[order], width[order], height[order])
+        self.indices = indices[order].astype(np.int16)
+        self.widest = float((right - left).max()) if count else 0.0
+
+    def __len__(self):
+        return len(self.left)
+
+    def candidates(self, x_low, x_high):
+        # Pairs (position in x_low/x_high, position in this index) whose x
+        # ranges overlap. A hitbox starting left of x_low - widest can't reach
+        # x_low, so each range only scans the sorted run between two bisections.
+        start = np.searchsorted(self.left, x_low - self.widest, "left")
+        stop = np.searchsorted(self.left, x_high, "right")
+        counts = stop - start
+        total = int(counts.sum())
+        if not total:
+            return counts[:0], counts[:0]
+        ranges = np.repeat(np.arange(x_low.size), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        targets = np.repeat(start, counts) + offsets
+        overlap = self.right[targets] >= x_low[ranges]
+        return ranges[overlap], targets[overlap]
+
+class ProjectilePool:
+    def __init__(self, capacity=1024, trail_length=6):
+        self.capacity = capacity
+        self.trail_length = trail_length
+        self.radius = 2
+
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.owner = np.zeros(capacity, dtype=np.int16)  # Index of the duelist that fired
+        self.alive = np.zeros(capacity, dtype=bool)
+
+        # Trail ring buffers. All live projectiles move together, so they share
+        # one write position; trail_count says how many points each one has.
+        self.trail_x = np.zeros((capacity, trail_length))
+        self.trail_y = np.zeros((capacity, trail_length))
+        self.trail_count = np.zeros(capacity, dtype=np.int8)
+        self.trail_head = 0
+
+    def clear(self):
+        self.alive[:] = False
+
+    def count(self):
+        return int(np.count_nonzero(self.alive))
+
+    def spawn(self, x, y, angles, speeds, is_player, owner):
+        # Fire one projectile per angle (x, y and speeds broadcast against the
+        # angles) and return their rows. Shots that don't fit are dropped.
+        angles = np.atleast_1d(np.asarray(angles, dtype=float))
+        x, y, speeds = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float),
+                                           np.asarray(speeds, dtype=float))
+        x, y, speeds = (np.broadcast_to(values, angles.shape) for values in (x, y, speeds))
+        rows = np.flatnonzero(~self.alive)[:angles.size]
+        count = rows.size
+
+        vx, vy = launch_velocities(angles[:count], speeds[:count], is_player)
+        self.x[rows] = x[:count]
+        self.y[rows] = y[:count]
+        self.vx[rows] = vx
+        self.vy[rows] = vy
+        self.owner[rows] = owner
+        self.alive[rows] = True
+        self.trail_count[rows] = 0
+        return rows
+
+    def update(self, terrain, targets=()):
+        # Advance every live projectile by one frame, like Bullet.update followed
+        # by Bullet.check_hit against each duelist in targets except its owner.
+        # targets is a list of Players or a TargetIndex of them. Damage is left
+        # to the caller; returns the hits as ProjectileHits.
+        if not isinstance(targets, TargetIndex):
+            targets = TargetIndex(targets)
+        rows = np.flatnonzero(self.alive)
+        if not rows.size:
+            return ProjectileHits(rows, rows, rows, self.x[rows], self.y[rows])
+        x0 = self.x[rows]
+        y0 = self.y[rows]
+        vx = self.vx[rows]
+        vy = self.vy[rows]
+
+        # Store current positions for the trails
+        head = self.trail_head
+        self.trail_x[rows, head] = x0
+        self.trail_y[rows, head] = y0
+        self.trail_count[rows] = np.minimum(self.trail_count[rows] + 1, self.trail_length)
+        self.trail_head = (head + 1) % self.trail_length
+
+        x1 = x0 + vx
+        y1 = y0 + vy
+
+        # Sweep the movement against the ground and hill walls
+        x = x1
+        y = y1
+        landed = np.zeros(rows.size, dtype=bool)
+        t_end = np.ones(rows.size)
+        near = np.flatnonzero(np.maximum(y0, y1) > terrain.ground_top)
+        if near.size:
+            near_landed, near_t, near_x, near_y = ground_contacts(terrain, x0[near], y0[near], vx[near], vy[near])
+            landed[near] = near_landed
+            t_end[near] = np.where(near_landed, near_t, 1.0)
+            x[near] = near_x
+            y[near] = near_y
+        done = landed | (x < 0) | (x > terrain.width)
+
+        # Sweep the same movement against every duelist near it but the
+        # shooter, up to where it stopped; the earliest contact wins, and the
+        # lowest target index on a tie
+        owner = self.owner[rows]
+        hit_t = np.full(rows.size, np.inf)
+        hit_target = np.full(rows.size, -1, dtype=np.int16)
+        hit_zone = np.full(rows.size, ZONE_MISS, dtype=np.int8)
+        if len(targets):
+            near, target = targets.candidates(np.minimum(x0, x1), np.maximum(x0, x1))
+            index = targets.indices[target]
+            keep = ((owner[near] != index) &
+                    (np.maximum(y0, y1)[near] >= targets.top[target]) &
+                    (np.minimum(y0, y1)[near] <= targets.bottom[target]))
+            near, target, index = near[keep], target[keep], index[keep]
+            if near.size:
+                hitboxes = Hitboxes(*(values[target] for values in targets.hitboxes))
+                t, zone = player_contacts(hitboxes, x0[near], y0[near], vx[near], vy[near])
+                contact = np.flatnonzero(t <= t_end[near])
+                order = contact[np.lexsort((index[contact], t[contact], near[contact]))]
+                first = order[np.unique(near[order], return_index=True)[1]]
+                hit_t[near[first]] = t[first]
+                hit_target[near[first]] = index[first]
+                hit_zone[near[first]] = zone[first]
+
+        hit = np.flatnonzero(hit_target >= 0)
+        x[hit] = x0[hit] + vx[hit] * hit_t[hit]
+        y[hit] = y0[hit] + vy[hit] * hit_t[hit]
+        done[hit] = True
+
+        # Apply gravity to vertical velocity
+        self.x[rows] = x
+        self.y[rows] = y
+        self.vy[rows] = vy + GRAVITY
+        self.alive[rows[done]] = False
+        return ProjectileHits(rows[hit], hit_target[hit], hit_zone[hit], x[hit], y[hit])
+
+    def trail_points(self):
+        # Trail points of every live projectile as flat (x, y, age, length)
+        # arrays; age 0 is the oldest point of a trail with length points
+        rows = np.flatnonzero(self.alive)
+        length = self.trail_length
+        # Slots from oldest to newest, ending just before the write position
+        slots = (self.trail_head - length + np.arange(length)) % length
+        ages = np.arange(length) - (length - self.trail_count[rows, None])
+        valid = ages >= 0
+        row_index = np.broadcast_to(rows[:, None], valid.shape)[valid]
+        slot_index = np.broadcast_to(slots[None, :], valid.shape)[valid]
+        return (self.trail_x[row_index, slot_index], self.trail_y[row_index, slot_index],
+                ages[valid], np.broadcast_to(self.trail_count[rows, None], valid.shape)[valid])
@@ -0,0 +1,249 @@
+# Deterministic match replays.
+# A match is fully determined by the seed of its random source and the input
+# bits fed to DuelSimulation.step each frame, so a replay file stores just
+# those, run-length encoded, plus a state checksum after every round.
+#
+#   python duel_replay.py info match.rpl
+#   python duel_replay.py verify recordings/*.rpl
+#
+# Use `python duel_game.py --replay match.rpl` to watch one in the game window.
+import argparse
+import random
+import struct
+import sys
+import time
+
+from duel_ai import DIFFICULTY_LEVELS, NpcBrain
+from duel_core import WIDTH, DuelSimulation
+from duel_physics import INTEGRATORS, WEAPON_NAMES, simulation_physics
+
+REPLAY_MAGIC = b"DUELRPL"
+REPLAY_VERSION = 1
+
+# File layout: header, then a stream of tagged records
+HEADER = struct.Struct("<7sBQ")  # magic, version, seed
+TAG = struct.Struct("<B")
+INPUT_RUN = struct.Struct("<BH")  # input bits, number of frames
+CHECKSUM = struct.Struct("<II")  # frame, crc32 of the state
+WORLD_WIDTH = struct.Struct("<I")  # world width, only written for wide worlds
+DIFFICULTY = struct.Struct("<B")  # index into DIFFICULTY_LEVELS, only written for an aiming NPC
+# Integrator, substeps, RK4 tolerance, player's and NPC's weapon and maximum
+# wind, only written when any of them isn't the original physics. Names are
+# stored as 1 + their index in INTEGRATORS/WEAPON_NAMES, 0 for none, and a
+# tolerance of 0 means fixed steps.
+PHYSICS = struct.Struct("<BBdBBd")
+TERRAIN = struct.Struct("<q")  # terrain seed, only written when every game is on one seeded terrain
+TAG_INPUT_RUN = 1
+TAG_CHECKSUM = 2
+TAG_WORLD_WIDTH = 3
+TAG_DIFFICULTY = 4
+TAG_PHYSICS = 5
+TAG_TERRAIN = 6
+MAX_RUN_LENGTH = 0xFFFF
+
+class ReplayError(Exception):
+    pass
+
+def name_index(name, names):
+    return names.index(name) + 1 if name else 0
+
+def index_name(index, names, path):
+    if index > len(names):
+        raise ReplayError(f"{path}: unknown physics option {index}")
+    return names[index - 1] if index else None
+
+def new_seed():
+    return random.SystemRandom().getrandbits(63)
+
+class ReplayRecorder:
+    def __init__(self, path, seed, world_width=WIDTH, difficulty=None, physics=None, terrain_seed=None):
+        # physics holds the keyword arguments of duel_physics.simulation_physics
+        self.seed = seed
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed))
+        if world_width != WIDTH:
+            self.file.write(TAG.pack(TAG_WORLD_WIDTH) + WORLD_WIDTH.pack(world_width))
+        if difficulty is not None:
+            self.file.write(TAG.pack(TAG_DIFFICULTY) + DIFFICULTY.pack(DIFFICULTY_LEVELS.index(difficulty)))
+        if physics is not None:
+            self.file.write(TAG.pack(TAG_PHYSICS) + PHYSICS.pack(
+                name_index(physics["integrator"], INTEGRATORS), physics["substeps"], physics["tolerance"] or 0.0,
+                name_index(physics["weapon"], WEAPON_NAMES), name_index(physics["npc_weapon"], WEAPON_NAMES),
+                physics["max_wind"]))
+        if terrain_seed is not None:
+            self.file.write(TAG.pack(TAG_TERRAIN) + TERRAIN.pack(terrain_seed))
+        self.run_inputs = 0
+        self.run_length = 0
+        self.frames = 0
+        self.last_state = None
+
+    def record(self, inputs, sim):
+        # Call once per frame, right after sim.step(inputs)
+        if inputs == self.run_inputs and self.run_length < MAX_RUN_LENGTH:
+            self.run_length += 1
+        else:
+            self.flush_run()
+            self.run_inputs = inputs
+            self.run_length = 1
+        self.frames += 1
+
+        # Checksum the state whenever a round has just been resolved
+        if sim.game_state == "result" and self.last_state == "shooting":
+            self.flush_run()
+            self.file.write(TAG.pack(TAG_CHECKSUM) + CHECKSUM.pack(sim.frame, sim.checksum()))
+        self.last_state = sim.game_state
+
+    def flush_run(self):
+        if self.run_length:
+            self.file.write(TAG.pack(TAG_INPUT_RUN) + INPUT_RUN.pack(self.run_inputs, self.run_length))
+            self.run_length = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.flush_run()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class Replay:
+    def __init__(self, seed, inputs, checksums, world_width=WIDTH, difficulty=None, physics=None,
+                 terrain_seed=None):
+        self.seed = seed
+        self.world_width = world_width
+        self.difficulty = difficulty  # None for the randomly drifting NPC
+        self.physics = physics  # simulation_physics arguments, None for the original physics
+        self.terrain_seed = terrain_seed  # None for a new random terrain every game
+        self.inputs = inputs  # One byte of input bits per frame
+        self.checksums = checksums  # Frame number -> expected state checksum
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as replay_file:
+            data = replay_file.read()
+        if len(data) < HEADER.size:
+            raise ReplayError(f"{path}: truncated header")
+        magic, version, seed = HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC:
+            raise ReplayError(f"{path}: not a replay file")
+        if version != REPLAY_VERSION:
+            raise ReplayError(f"{path}: unsupported replay version {version}")
+
+        inputs = bytearray()
+        checksums = {}
+        world_width = WIDTH
+        difficulty = None
+        physics = None
+        terrain_seed = None
+        offset = HEADER.size
+        while offset < len(data):
+            (tag,) = TAG.unpack_from(data, offset)
+            offset += TAG.size
+            if tag == TAG_INPUT_RUN and offset + INPUT_RUN.size <= len(data):
+                run_inputs, run_length = INPUT_RUN.unpack_from(data, offset)
+                offset += INPUT_RUN.size
+                inputs.extend(bytes([run_inputs]) * run_length)
+            elif tag == TAG_CHECKSUM and offset + CHECKSUM.size <= len(data):
+                frame, checksum = CHECKSUM.unpack_from(data, offset)
+                offset += CHECKSUM.size
+                checksums[frame] = checksum
+            elif tag == TAG_WORLD_WIDTH and offset + WORLD_WIDTH.size <= len(data):
+                (world_width,) = WORLD_WIDTH.unpack_from(data, offset)
+                offset += WORLD_WIDTH.size
+            elif tag == TAG_DIFFICULTY and offset + DIFFICULTY.size <= len(data):
+                (level,) = DIFFICULTY.unpack_from(data, offset)
+                offset += DIFFICULTY.size
+                if level >= len(DIFFICULTY_LEVELS):
+                    raise ReplayError(f"{path}: unknown difficulty {level}")
+                difficulty = DIFFICULTY_LEVELS[level]
+            elif tag == TAG_PHYSICS and offset + PHYSICS.size <= len(data):
+                integrator, substeps, tolerance, weapon, npc_weapon, max_wind = PHYSICS.unpack_from(data, offset)
+                offset += PHYSICS.size
+                physics = {
+                    "integrator": index_name(integrator, INTEGRATORS, path),
+                    "substeps": substeps,
+                    "tolerance": tolerance or None,
+                    "weapon": index_name(weapon, WEAPON_NAMES, path),
+                    "npc_weapon": index_name(npc_weapon, WEAPON_NAMES, path),
+                    "max_wind": max_wind,
+                }
+            elif tag == TAG_TERRAIN and offset + TERRAIN.size <= len(data):
+                (terrain_seed,) = TERRAIN.unpack_from(data, offset)
+                offset += TERRAIN.size
+            else:
+                raise ReplayError(f"{path}: corrupt record at byte {offset - TAG.size}")
+        return cls(seed, bytes(inputs), checksums, world_width, difficulty, physics, terrain_seed)
+
+    def new_simulation(self):
+        brain = NpcBrain(self.difficulty) if self.difficulty else None
+        physics = simulation_physics(**self.physics) if self.physics else {}
+        return DuelSimulation(random.Random(self.seed), self.world_width, npc_brain=brain,
+                              terrain_seed=self.terrain_seed, **physics)
+
+    def play(self, on_frame=None):
+        # Re-simulate the whole match as fast as possible. Returns the final
+        # simulation and the frames whose checksum didn't match the recording.
+        sim = self.new_simulation()
+        mismatches = []
+        checksums = self.checksums
+        for inputs in self.inputs:
+            sim.step(inputs)
+            expected = checksums.get(sim.frame)
+            if expected is not None and sim.checksum() != expected:
+                mismatches.append(sim.frame)
+            if on_frame:
+                on_frame(sim)
+        return sim, mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and verify Wild West Duel replays")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    info_parser = subparsers.add_parser("info", help="show what a replay contains")
+    info_parser.add_argument("replays", nargs="+")
+    verify_parser = subparsers.add_parser("verify", help="re-simulate replays and check their checksums")
+    verify_parser.add_argument("replays", nargs="+")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    start = time.perf_counter()
+    for path in args.replays:
+        try:
+            replay = Replay.load(path)
+        except (OSError, ReplayError) as error:
+            print(f"{path}: {error}")
+            failures += 1
+            continue
+
+        if args.command == "info":
+            print(f"{path}: seed {replay.seed}, world width {replay.world_width}, "
+                  f"NPC {replay.difficulty or 'drifting'}, {len(replay.inputs)} frames, "
+                  f"{len(replay.checksums)} rounds")
+            if replay.terrain_seed is not None:
+                print(f"  terrain: seed {replay.terrain_seed}")
+            if replay.physics:
+                physics = replay.physics
+                integration = f"{physics['integrator'] or 'built-in'} x{physics['substeps']}"
+                if physics["tolerance"]:
+                    integration += f" to {physics['tolerance']} px"
+                print(f"  physics: {integration}, "
+                      f"weapons {physics['weapon'] or 'revolver'}/{physics['npc_weapon'] or 'revolver'}, "
+                      f"wind up to {physics['max_wind']}")
+            continue
+
+        sim, mismatches = replay.play()
+        if mismatches or len(replay.inputs) < max(replay.checksums, default=0):
+            failures += 1
+            print(f"{path}: DESYNC at frames {mismatches[:10]}")
+        else:
+            print(f"{path}: ok ({len(replay.checksums)} rounds, winner {sim.winner})")
+
+    if args.command == "verify":
+        print(f"{len(args.replays) - failures}/{len(args.replays)} replays ok "
+              f"in {time.perf_counter() - start:.2f}s")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,558 @@
+# Headless dedicated duel server.
+# Runs many independent matches at once, each the full DuelSimulation state
+# machine (aiming -> countdown -> shooting -> result -> game_over), with no
+# rendering at all. Matches are sharded across worker processes by name, one
+# worker per core by default, and every worker ticks all of its matches from
+# one asyncio loop at a fixed rate.
+#
+# Clients attach over TCP with a line of JSON naming the match they want and
+# then send one line per input change (the DuelSimulation input bits as a
+# decimal number). The server answers with the terrain whenever it changes
+# and one JSON line of match state per tick. The front port only routes: it
+# redirects each client to the port of the worker that owns its match and
+# answers {"stats": true} with the latest metrics of every worker.
+#
+#   python duel_server.py serve --workers 4 --bot-matches 2000 --duration 30
+#   python duel_server.py stats 127.0.0.1:7800
+#   python duel_server.py client 127.0.0.1:7800 --match final-1 --seat player
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import time
+import zlib
+from collections import deque
+from types import SimpleNamespace
+
+from duel_ai import DIFFICULTY_LEVELS, NpcBrain
+from duel_core import (
+    FPS, WIDTH, INPUT_UP, INPUT_DOWN, INPUT_READY, INPUT_RESTART, INPUT_UP_PRESSED, INPUT_DOWN_PRESSED,
+    DuelSimulation,
+)
+from duel_net import BotPlayer
+from duel_replay import new_seed
+
+SEATS = ("player", "npc")
+
+# Aim keys are held from one input line to the next; READY, RESTART and the
+# aim key presses are kept until the next tick so a short tap isn't lost
+# between ticks
+HELD_BITS = INPUT_UP | INPUT_DOWN
+PRESS_BITS = INPUT_READY | INPUT_RESTART | INPUT_UP_PRESSED | INPUT_DOWN_PRESSED
+
+DEFAULT_PORT = 7800
+REPORT_INTERVAL_S = 1.0
+
+# A worker that falls further behind than this many ticks drops them instead
+# of running a burst of catch-up ticks
+MAX_LATE_TICKS = FPS // 4
+
+# State lines are skipped for clients with this much unsent data queued; each
+# line is a full state, so a slow client just sees fewer frames
+MAX_CLIENT_BACKLOG = 64 * 1024
+
+class ServerError(Exception):
+    pass
+
+def match_shard(name, shards):
+    # Worker that owns a match, stable across restarts
+    return zlib.crc32(name.encode()) % shards
+
+def duelist_state(duelist):
+    bullet = duelist.bullet
+    return {
+        "x": duelist.x,
+        "y": duelist.y,
+        "health": duelist.health,
+        "aim_angle": duelist.aim_angle,
+        "arm_angle": duelist.current_arm_angle,
+        "bullet": [round(bullet.x, 2), round(bullet.y, 2)] if bullet and bullet.active else None,
+    }
+
+class Client:
+    def __init__(self, writer, seat):
+        self.writer = writer
+        self.seat = seat  # Index into SEATS, None for spectators
+        self.terrain = None  # Terrain last sent to this client
+
+class Match:
+    def __init__(self, name, seed, players=2, world_width=WIDTH, bots=False, difficulty=None):
+        self.name = name
+        self.seed = seed
+        self.players = players
+        # With one player the NPC takes the second seat, drifting as in the
+        # game or aiming with the solver at the given difficulty
+        brain = NpcBrain(difficulty) if difficulty and players == 1 else None
+        self.sim = DuelSimulation(random.Random(seed), world_width, two_player=players == 2, npc_brain=brain)
+        self.held = [0, 0]
+        self.pressed = [0, 0]
+        self.seats = [None] * players  # Client in each seat
+        self.spectators = []
+        # Bot matches play themselves and stay up for the whole run
+        self.bots = [BotPlayer(random.Random(seed + seat)) for seat in range(players)] if bots else None
+
+    def clients(self):
+        return [client for client in self.seats if client] + self.spectators
+
+    def join(self, writer, seat=None):
+        # Seat the client where asked (or in the first free seat), otherwise
+        # let it watch
+        if seat == "spectator":
+            index = None
+        elif seat is not None:
+            if seat not in SEATS:
+                raise ServerError(f"unknown seat {seat!r}")
+            index = SEATS.index(seat)
+            if index >= self.players or self.seats[index]:
+                raise ServerError(f"seat {seat} is not available in {self.name}")
+        else:
+            index = next((index for index, client in enumerate(self.seats) if client is None), None)
+        client = Client(writer, index)
+        if index is None:
+            self.spectators.append(client)
+        else:
+            self.seats[index] = client
+        return client
+
+    def leave(self, client):
+        if client.seat is None:
+            self.spectators.remove(client)
+        else:
+            self.seats[client.seat] = None
+            self.held[client.seat] = self.pressed[client.seat] = 0
+
+    def set_inputs(self, seat, inputs):
+        self.held[seat] = inputs & HELD_BITS
+        self.pressed[seat] |= inputs & PRESS_BITS
+
+    def tick(self):
+        if self.bots:
+            inputs = [bot.inputs(self.sim) for bot in self.bots]
+        else:
+            inputs = [held | pressed for held, pressed in zip(self.held, self.pressed)]
+            self.pressed = [0] * self.players
+        self.sim.step(inputs[0], inputs[1] if self.players == 2 else 0)
+
+    def state_line(self):
+        sim = self.sim
+        return (json.dumps({
+            "frame": sim.frame,
+            "state": sim.game_state,
+            "round": sim.round_number,
+            "countdown": sim.countdown_value,
+            "message": sim.hit_message,
+            "winner": sim.winner,
+            "ready": [sim.player_ready, sim.npc_ready],
+            "player": duelist_state(sim.player),
+            "npc": duelist_state(sim.npc),
+        }, separators=(",", ":")) + "\n").encode()
+
+    def terrain_line(self):
+        terrain = self.sim.terrain
+        return (json.dumps({"terrain": terrain.hills, "world_width": terrain.width},
+                           separators=(",", ":")) + "\n").encode()
+
+    def broadcast(self):
+        clients = self.clients()
+        if not clients:
+            return
+        state = self.state_line()
+        for client in clients:
+            writer = client.writer
+            if writer.transport.get_write_buffer_size() > MAX_CLIENT_BACKLOG:
+                continue
+            if client.terrain is not self.sim.terrain:
+                client.terrain = self.sim.terrain
+                writer.write(self.terrain_line())
+            writer.write(state)
+
+# Matches owned by one worker process, ticked together
+class Shard:
+    def __init__(self, index, fps=FPS, world_width=WIDTH):
+        self.index = index
+        self.fps = fps
+        self.world_width = world_width
+        self.matches = {}
+
+        # Tick latency: time to step and broadcast every match once
+        self.recent_ticks = deque(maxlen=max(1, int(fps * 10)))  # Last 10 s, in ms
+        self.ticks = 0
+        self.busy = 0.0
+        self.max_tick_ms = 0.0
+        self.late_ticks = 0
+        self.skipped_ticks = 0
+        self.frames = 0
+        self.started = None
+
+    def add_bot_matches(self, count):
+        for number in range(count):
+            name = f"bot-{self.index}-{number}"
+            self.matches[name] = Match(name, zlib.crc32(name.encode()), 2, self.world_width, bots=True)
+
+    def tick(self):
+        start = time.perf_counter()
+        for match in self.matches.values():
+            match.tick()
+            match.broadcast()
+        elapsed = time.perf_counter() - start
+        milliseconds = elapsed * 1000
+        self.recent_ticks.append(milliseconds)
+        self.ticks += 1
+        self.busy += elapsed
+        self.frames += len(self.matches)
+        self.max_tick_ms = max(self.max_tick_ms, milliseconds)
+
+    async def run(self, stop, report):
+        # Fixed-rate tick loop; stop() is polled and report() called once per
+        # REPORT_INTERVAL_S
+        interval = 1 / self.fps
+        self.started = next_tick = next_report = time.perf_counter()
+        while True:
+            self.tick()
+            next_tick += interval
+            now = time.perf_counter()
+            if now - next_tick > MAX_LATE_TICKS * interval:
+                self.skipped_ticks += int((now - next_tick) / interval)
+                next_tick = now
+            elif now > next_tick:
+                self.late_ticks += 1
+            if now >= next_report:
+                next_report = now + REPORT_INTERVAL_S
+                report(self.metrics())
+                if stop():
+                    break
+            await asyncio.sleep(max(0.0, next_tick - now))
+
+    async def handle_client(self, reader, writer):
+        match = client = None
+        try:
+            hello = await read_json(reader)
+            match = self.open_match(hello)
+            client = match.join(writer, hello.get("seat"))
+            await send_json(writer, {
+                "welcome": match.name,
+                "seat": SEATS[client.seat] if client.seat is not None else "spectator",
+                "seed": match.seed,
+                "players": match.players,
+                "world_width": match.sim.world_width,
+                "tick_rate": self.fps,
+            })
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if client.seat is not None:
+                    match.set_inputs(client.seat, int(line))
+        except (ServerError, ValueError, KeyError) as error:
+            writer.write((json.dumps({"error": str(error)}) + "\n").encode())
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if client:
+                match.leave(client)
+            # Also drops a match just opened for a client that couldn't join it
+            if match and not match.bots and not match.clients() and self.matches.get(match.name) is match:
+                del self.matches[match.name]
+            writer.close()
+
+    async def close_clients(self):
+        # Hang up on everyone and let their handlers finish before the loop ends
+        for match in self.matches.values():
+            for client in match.clients():
+                client.writer.close()
+        await asyncio.sleep(0.1)
+
+    def open_match(self, hello):
+        name = str(hello["match"])
+        match = self.matches.get(name)
+        if match is None:
+            players = int(hello.get("players", 2))
+            if players not in (1, 2):
+                raise ServerError("players must be 1 or 2")
+            seed = hello.get("seed")
+            difficulty = hello.get("difficulty")
+            if difficulty is not None and difficulty not in DIFFICULTY_LEVELS:
+                raise ServerError(f"difficulty must be one of {', '.join(DIFFICULTY_LEVELS)}")
+            match = Match(name, int(seed) if seed is not None else new_seed(), players, self.world_width,
+                          difficulty=difficulty)
+            self.matches[name] = match
+        return match
+
+    def metrics(self):
+        recent = sorted(self.recent_ticks)
+        elapsed = time.perf_counter() - self.started
+        return {
+            "shard": self.index,
+            "pid": os.getpid(),
+            "matches": len(self.matches),
+            "clients": sum(len(match.clients()) for match in self.matches.values()),
+            "ticks": self.ticks,
+            "frames": self.frames,
+            "tick_ms": {
+                "mean": round(sum(recent) / len(recent), 3) if recent else 0.0,
+                "p50": round(recent[len(recent) // 2], 3) if recent else 0.0,
+                "p99": round(recent[min(len(recent) - 1, len(recent) * 99 // 100)], 3) if recent else 0.0,
+                "max": round(self.max_tick_ms, 3),
+            },
+            "late_ticks": self.late_ticks,
+            "skipped_ticks": self.skipped_ticks,
+            "busy": round(self.busy / elapsed, 4) if elapsed else 0.0,  # Share of the core spent ticking
+        }
+
+async def read_json(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    message = json.loads(line)
+    if not isinstance(message, dict):
+        raise ServerError("expected a JSON object")
+    return message
+
+async def send_json(writer, message):
+    writer.write((json.dumps(message) + "\n").encode())
+    await writer.drain()
+
+def run_shard(index, host, port, fps, world_width, bot_matches, metrics_queue, stop_event):
+    # Worker process entry point
+    shard = Shard(index, fps, world_width)
+    shard.add_bot_matches(bot_matches)
+
+    async def serve():
+        server = await asyncio.start_server(shard.handle_client, host, port)
+        async with server:
+            await shard.run(stop_event.is_set, metrics_queue.put)
+            await shard.close_clients()
+        metrics_queue.put(dict(shard.metrics(), final=True))
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+def summarize(shards, fps):
+    # Server-wide view of the latest metrics from every worker
+    shards = [shards[index] for index in sorted(shards)]
+    matches = sum(shard["matches"] for shard in shards)
+    busy = [shard["busy"] for shard in shards]
+    return {
+        "workers": len(shards),
+        "tick_rate": fps,
+        "matches": matches,
+        "clients": sum(shard["clients"] for shard in shards),
+        "matches_per_core": round(matches / len(shards), 1) if shards else 0,
+        # Matches one core could tick at this rate if it were fully busy
+        "capacity_per_core": round(sum(shard["matches"] / shard["busy"] for shard in shards if shard["busy"]) /
+                                   len(shards)) if any(busy) else None,
+        "tick_ms_p99": max((shard["tick_ms"]["p99"] for shard in shards), default=0.0),
+        "tick_ms_max": max((shard["tick_ms"]["max"] for shard in shards), default=0.0),
+        "late_ticks": sum(shard["late_ticks"] for shard in shards),
+        "skipped_ticks": sum(shard["skipped_ticks"] for shard in shards),
+        "shards": shards,
+    }
+
+class Server:
+    def __init__(self, host, port, workers, fps=FPS, world_width=WIDTH, bot_matches=0):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.fps = fps
+        self.world_width = world_width
+        self.bot_matches = bot_matches
+        self.metrics_queue = multiprocessing.Queue()
+        self.stop_event = multiprocessing.Event()
+        self.processes = []
+        self.shards = {}  # Latest metrics per worker
+
+    def shard_port(self, index):
+        return self.port + 1 + index
+
+    def start(self):
+        for index in range(self.workers):
+            bots = self.bot_matches // self.workers + (index < self.bot_matches % self.workers)
+            process = multiprocessing.Process(
+                target=run_shard, daemon=True,
+                args=(index, self.host, self.shard_port(index), self.fps, self.world_width, bots,
+                      self.metrics_queue, self.stop_event))
+            process.start()
+            self.processes.append(process)
+
+    def collect(self):
+        # Take in whatever metrics the workers have sent; returns how many
+        # workers have sent their final report
+        finished = 0
+        while True:
+            try:
+                metrics = self.metrics_queue.get_nowait()
+            except queue.Empty:
+                return finished
+            finished += metrics.pop("final", False)
+            self.shards[metrics["shard"]] = metrics
+
+    def summary(self):
+        return summarize(self.shards, self.fps)
+
+    async def handle_front(self, reader, writer):
+        try:
+            hello = await read_json(reader)
+            if hello.get("stats"):
+                self.collect()
+                await send_json(writer, self.summary())
+            else:
+                await send_json(writer, {"redirect": self.shard_port(match_shard(str(hello["match"]), self.workers))})
+        except (ServerError, ValueError, KeyError) as error:
+            writer.write((json.dumps({"error": str(error)}) + "\n").encode())
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, duration=0, report_interval=5.0, log=None):
+        server = await asyncio.start_server(self.handle_front, self.host, self.port)
+        deadline = time.perf_counter() + duration if duration else None
+        next_report = time.perf_counter() + report_interval
+        async with server:
+            while deadline is None or time.perf_counter() < deadline:
+                await asyncio.sleep(0.1)
+                self.collect()
+                if log and report_interval and time.perf_counter() >= next_report and self.shards:
+                    next_report += report_interval
+                    log(self.summary())
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        finished = 0
+        deadline = time.perf_counter() + timeout
+        while finished < len(self.processes) and time.perf_counter() < deadline:
+            finished += self.collect()
+            time.sleep(0.05)
+        for process in self.processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+
+async def attach(host, port, match, seat=None, players=2, seed=None, difficulty=None):
+    # Join a match through the front port; returns (reader, writer, welcome)
+    hello = {"match": match, "seat": seat, "players": players, "seed": seed, "difficulty": difficulty}
+    reader, writer = await asyncio.open_connection(host, port)
+    await send_json(writer, hello)
+    reply = await read_json(reader)
+    if "redirect" in reply:
+        writer.close()
+        reader, writer = await asyncio.open_connection(host, reply["redirect"])
+        await send_json(writer, hello)
+        reply = await read_json(reader)
+    if "error" in reply:
+        writer.close()
+        raise ServerError(reply["error"])
+    return reader, writer, reply
+
+async def query_stats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        await send_json(writer, {"stats": True})
+        return await read_json(reader)
+    finally:
+        writer.close()
+
+async def run_client(host, port, match, seat, players, frames, bot_seed, difficulty=None):
+    # Attach a BotPlayer to a match and play until frames states have arrived
+    reader, writer, welcome = await attach(host, port, match, seat, players, difficulty=difficulty)
+    bot = BotPlayer(random.Random(bot_seed))
+    state = None
+    sent = None
+    terrains = 0
+    try:
+        for _ in range(frames):
+            message = await read_json(reader)
+            if "terrain" in message:
+                terrains += 1
+                message = await read_json(reader)
+            state = message
+            if welcome["seat"] != "spectator":
+                inputs = bot.inputs(SimpleNamespace(game_state=state["state"]))
+                if inputs != sent:
+                    writer.write(b"%d\n" % inputs)
+                    sent = inputs & HELD_BITS  # Presses are resent even if repeated
+    finally:
+        writer.close()
+    return {"welcome": welcome, "terrains": terrains, "last_state": state}
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless dedicated server for many duels at once")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="run the server")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                              help=f"front port; workers use the ports after it (default {DEFAULT_PORT})")
+    serve_parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU core)")
+    serve_parser.add_argument("--fps", type=float, default=FPS, help=f"ticks per second (default {FPS})")
+    serve_parser.add_argument("--world-width", type=int, default=WIDTH, help="battlefield width for new matches")
+    serve_parser.add_argument("--bot-matches", type=int, default=0,
+                              help="matches played by bots on both seats, for load testing")
+    serve_parser.add_argument("--duration", type=float, default=0, help="stop after this many seconds")
+    serve_parser.add_argument("--report-interval", type=float, default=5.0,
+                              help="seconds between metrics lines, 0 for none (default 5)")
+    serve_parser.add_argument("--stats-output", metavar="PATH", help="write the final metrics as JSON")
+    stats_parser = subparsers.add_parser("stats", help="print the metrics of a running server")
+    stats_parser.add_argument("address", help="HOST:PORT of the front port")
+    client_parser = subparsers.add_parser("client", help="attach a bot client to a match")
+    client_parser.add_argument("address", help="HOST:PORT of the front port")
+    client_parser.add_argument("--match", required=True, help="match name")
+    client_parser.add_argument("--seat", choices=SEATS + ("spectator",), help="seat to take (default: first free)")
+    client_parser.add_argument("--players", type=int, default=2, choices=(1, 2),
+                               help="players in a new match; with 1 the NPC takes the other seat")
+    client_parser.add_argument("--difficulty", choices=DIFFICULTY_LEVELS,
+                               help="with --players 1, let the NPC aim with the solver at this skill")
+    client_parser.add_argument("--frames", type=int, default=600, help="states to receive (default 600)")
+    client_parser.add_argument("--bot-seed", type=int, help="seed for the bot's inputs")
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        print(json.dumps(asyncio.run(query_stats(*parse_address(args.address))), indent=2))
+        return 0
+    if args.command == "client":
+        host, port = parse_address(args.address)
+        try:
+            report = asyncio.run(run_client(host, port, args.match, args.seat, args.players, args.frames,
+                                            args.bot_seed, args.difficulty))
+        except (ServerError, ConnectionError) as error:
+            print(error, file=sys.stderr)
+            return 1
+        print(json.dumps(report))
+        return 0
+
+    workers = args.workers or os.cpu_count() or 1
+    server = Server(args.host, args.port, workers, args.fps, args.world_width, args.bot_matches)
+
+    def log(summary):
+        print(f"{summary['matches']} matches on {summary['workers']} workers "
+              f"({summary['matches_per_core']} per core, capacity ~{summary['capacity_per_core']} per core), "
+              f"tick p99 {summary['tick_ms_p99']:.2f} ms, max {summary['tick_ms_max']:.2f} ms, "
+              f"{summary['late_ticks']} late, {summary['skipped_ticks']} skipped", flush=True)
+
+    server.start()
+    print(f"Serving on {args.host}:{args.port} with {workers} workers "
+          f"(ports {server.shard_port(0)}-{server.shard_port(workers - 1)})", flush=True)
+    try:
+        asyncio.run(server.serve(args.duration, args.report_interval, log))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    summary = server.summary()
+    print(json.dumps(summary, indent=2))
+    if args.stats_output:
+        with open(args.stats_output, "w") as file:
+            json.dump(summary, file, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
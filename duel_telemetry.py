@@ -0,0 +1,297 @@
+# Match telemetry for balance analysis.
+# A DuelSimulation with a TelemetryWriter attached (its telemetry attribute)
+# reports every round as it resolves: the terrain's hills, the wind, each
+# shot's aim angle at fire time, flight frames, impact point, hit zone and
+# damage, and both duelists' health after the round; a game event follows the
+# last round of every game.
+#
+# The simulation only packs those values into a tuple and drops it into a
+# bounded in-memory queue, which never blocks. A background thread takes the
+# events off the queue in batches, turns them into JSON lines and writes them
+# to numbered files that rotate once they pass a size limit, so the frame
+# loop never waits for the disk. Events that don't fit in the queue (or come
+# after a write error) are counted as dropped instead. close() writes
+# everything still queued and is also run at interpreter exit.
+#
+# Every file starts with a session line holding the writer's header (seed,
+# world width, difficulty, physics...), so rotated files can be read alone.
+#
+#   python duel_game.py --telemetry telemetry
+#   python duel_telemetry.py simulate --games 1000 --difficulty hard --output telemetry
+#   python duel_telemetry.py summary telemetry
+import argparse
+import atexit
+import glob
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from duel_ai import DIFFICULTY_LEVELS, NpcBrain
+from duel_core import WIDTH, DuelSimulation
+
+DEFAULT_MAX_BYTES = 8 * 2 ** 20
+DEFAULT_QUEUE_SIZE = 4096
+BATCH_SIZE = 256  # Events written per file write at most
+
+EVENT_ROUND = 0
+EVENT_GAME = 1
+ZONE_NAMES = ("miss", "body", "head")  # Indexed by zone
+STOP = None  # Queued by close() to end the writer thread
+
+def shot_record(duelist):
+    # Compact (angle, flight frames, impact x, impact y, zone, damage) of the
+    # shot duelist fired this round
+    bullet = duelist.bullet
+    if bullet is None:
+        return None
+    return (bullet.angle, bullet.flight_frames, bullet.x, bullet.y, bullet.hit_zone, bullet.damage)
+
+def shot_json(shot):
+    if shot is None:
+        return None
+    angle, flight_frames, x, y, zone, damage = shot
+    return {"angle": angle, "flight_frames": flight_frames, "impact": [round(x, 2), round(y, 2)],
+            "zone": ZONE_NAMES[zone], "damage": damage}
+
+def event_json(event):
+    # The JSON object for a queued event tuple
+    if event[0] == EVENT_ROUND:
+        _, wall_time, game, round_number, frame, hills, wind, player_shot, npc_shot, player_health, npc_health = event
+        return {"event": "round", "time": round(wall_time, 3), "game": game, "round": round_number,
+                "frame": frame, "hills": hills, "wind": wind,
+                "shots": {"player": shot_json(player_shot), "npc": shot_json(npc_shot)},
+                "health": {"player": player_health, "npc": npc_health}}
+    _, wall_time, game, rounds, frame, winner, player_health, npc_health = event
+    return {"event": "game", "time": round(wall_time, 3), "game": game, "rounds": rounds, "frame": frame,
+            "winner": winner, "health": {"player": player_health, "npc": npc_health}}
+
+class TelemetryWriter:
+    def __init__(self, directory, header=None, max_bytes=DEFAULT_MAX_BYTES, max_files=None,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.directory = directory
+        self.header = dict(header or {})
+        self.max_bytes = max_bytes
+        self.max_files = max_files  # Oldest files of this session are deleted past this many
+        os.makedirs(directory, exist_ok=True)
+        self.prefix = os.path.join(directory, f"{time.strftime('telemetry-%Y%m%d-%H%M%S')}-{os.getpid()}")
+
+        self.queue = queue.Queue(queue_size)
+        self.emitted = 0  # Counted on the game thread
+        self.dropped = 0
+        self.written = 0  # Counted on the writer thread
+        self.failed = 0
+        self.bytes = 0
+        self.error = None
+
+        self.paths = []
+        self.file = None
+        self.file_bytes = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="telemetry-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # Game thread
+
+    def emit(self, event):
+        # Queue an event tuple; never blocks. Once closed there is no writer
+        # left to take it, so it is dropped.
+        if self.closed:
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self.emitted += 1
+
+    def record_round(self, sim):
+        player = sim.player
+        npc = sim.npc
+        self.emit((EVENT_ROUND, time.time(), sim.game_number, sim.round_number, sim.frame, sim.terrain.hills,
+                   sim.wind, shot_record(player), shot_record(npc), player.health, npc.health))
+
+    def record_game(self, sim):
+        self.emit((EVENT_GAME, time.time(), sim.game_number, sim.round_number, sim.frame, sim.winner,
+                   sim.player.health, sim.npc.health))
+
+    def close(self, timeout=5.0):
+        # Write out everything queued so far and stop the writer thread
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        try:
+            self.queue.put(STOP, timeout=timeout)
+        except queue.Full:
+            pass  # The writer is stuck on the disk; it's a daemon thread, so don't wait for it
+        else:
+            self.thread.join(timeout)
+
+    def stats(self):
+        return {
+            "emitted": self.emitted,
+            "written": self.written,
+            "dropped": self.dropped + self.failed,
+            "files": len(self.paths),
+            "bytes": self.bytes,
+        }
+
+    # Writer thread
+
+    def run(self):
+        try:
+            while True:
+                batch = [self.queue.get()]
+                while batch[-1] is not STOP and len(batch) < BATCH_SIZE:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stopping = batch[-1] is STOP
+                if stopping:
+                    batch.pop()
+                if batch:
+                    self.write(batch)
+                if stopping:
+                    break
+        finally:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    def write(self, batch):
+        if self.error:
+            self.failed += len(batch)
+            return
+        try:
+            if self.file is None or self.file_bytes >= self.max_bytes:
+                self.rotate()
+            data = "".join(json.dumps(event_json(event), separators=(",", ":")) + "\n" for event in batch).encode()
+            self.file.write(data)
+            self.file.flush()
+        except OSError as error:
+            self.error = error
+            self.failed += len(batch)
+            return
+        self.file_bytes += len(data)
+        self.bytes += len(data)
+        self.written += len(batch)
+
+    def rotate(self):
+        if self.file:
+            self.file.close()
+        path = f"{self.prefix}-{len(self.paths) + 1:04d}.jsonl"
+        self.file = open(path, "wb")
+        self.paths.append(path)
+        header = json.dumps(dict(self.header, event="session", file=len(self.paths)), separators=(",", ":"))
+        self.file.write(header.encode() + b"\n")
+        self.file_bytes = len(header) + 1
+        self.bytes += self.file_bytes
+        if self.max_files and len(self.paths) > self.max_files:
+            os.remove(self.paths[-self.max_files - 1])
+
+def read_events(paths):
+    # Every event in the telemetry files (or directories of them) in paths
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "telemetry-*.jsonl"))))
+        else:
+            files.append(path)
+    for path in files:
+        with open(path) as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+def summarize(events):
+    rounds = 0
+    games = 0
+    winners = {}
+    sides = {side: {"shots": 0, "zones": dict.fromkeys(ZONE_NAMES, 0), "damage": 0, "flight_frames": 0,
+                    "angle": 0.0} for side in ("player", "npc")}
+    for event in events:
+        if event["event"] == "game":
+            games += 1
+            winners[event["winner"]] = winners.get(event["winner"], 0) + 1
+        elif event["event"] == "round":
+            rounds += 1
+            for side, shot in event["shots"].items():
+                if shot is None:
+                    continue
+                totals = sides[side]
+                totals["shots"] += 1
+                totals["zones"][shot["zone"]] += 1
+                totals["damage"] += shot["damage"]
+                totals["flight_frames"] += shot["flight_frames"]
+                totals["angle"] += shot["angle"]
+    summary = {"rounds": rounds, "games": games, "winners": winners, "shots": {}}
+    for side, totals in sides.items():
+        shots = totals["shots"] or 1
+        summary["shots"][side] = {
+            "shots": totals["shots"],
+            "zone_rates": {zone: round(count / shots, 3) for zone, count in totals["zones"].items()},
+            "mean_damage": round(totals["damage"] / shots, 2),
+            "mean_flight_frames": round(totals["flight_frames"] / shots, 1),
+            "mean_angle": round(totals["angle"] / shots, 2),
+        }
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record and summarize per-round match telemetry")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    simulate_parser = subparsers.add_parser("simulate", help="record telemetry of headless games")
+    simulate_parser.add_argument("--games", type=int, default=100, help="games to play (default 100)")
+    simulate_parser.add_argument("--seed", type=int, default=0, help="seed of the first game (default 0)")
+    simulate_parser.add_argument("--difficulty", choices=DIFFICULTY_LEVELS,
+                                 help="NPC skill (default: random drift)")
+    simulate_parser.add_argument("--world-width", type=int, default=WIDTH, metavar="PIXELS",
+                                 help=f"world width (default {WIDTH})")
+    simulate_parser.add_argument("--output", metavar="DIR", default="telemetry",
+                                 help="directory for the telemetry files (default telemetry)")
+    simulate_parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES,
+                                 help=f"rotate files past this size (default {DEFAULT_MAX_BYTES})")
+    summary_parser = subparsers.add_parser("summary", help="hit rates, damage and flight times of recorded rounds")
+    summary_parser.add_argument("paths", nargs="+", help="telemetry files or directories")
+    summary_parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "simulate":
+        header = {"source": "simulate", "seed": args.seed, "difficulty": args.difficulty,
+                  "world_width": args.world_width}
+        telemetry = TelemetryWriter(args.output, header, max_bytes=args.max_bytes)
+        brain = NpcBrain(args.difficulty) if args.difficulty else None
+        start = time.perf_counter()
+        for game in range(args.games):
+            sim = DuelSimulation(random.Random(args.seed + game), args.world_width, npc_brain=brain)
+            sim.game_number = game + 1
+            sim.telemetry = telemetry
+            sim.simulate_game(player_angle=sim.rng.randint(5, 30))
+        simulated = time.perf_counter() - start
+        telemetry.close()
+        stats = telemetry.stats()
+        print(f"{args.games} games in {simulated:.2f}s, written in {time.perf_counter() - start:.2f}s:",
+              json.dumps(stats))
+        return 0
+
+    summary = summarize(read_events(args.paths))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return 0
+    print(f"{summary['rounds']} rounds, {summary['games']} games")
+    for winner, count in sorted(summary["winners"].items()):
+        print(f"  {winner:<20} {count} wins")
+    for side, row in summary["shots"].items():
+        rates = "  ".join(f"{zone} {rate:.1%}" for zone, rate in row["zone_rates"].items())
+        print(f"  {side:<7} {row['shots']:>6} shots  {rates}  {row['mean_damage']:.1f} damage  "
+              f"{row['mean_flight_frames']:.1f} frames  angle {row['mean_angle']:.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
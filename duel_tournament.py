@@ -0,0 +1,373 @@
+# Round-robin tournaments between NPC aiming strategies.
+# Every pair of strategies plays one match per terrain from each side, so
+# both get the same hills. A match is one game on that terrain with the usual
+# rules: 100 health, 40 damage for a head shot and 20 for a body shot, both
+# shooting at once every round, until someone dies (both dying is a draw).
+#
+# Duelists stand on the same spots every round and bullets don't interact, so
+# a round only depends on the two aim angles. Each side's shots are flown once
+# per terrain for every aim angle with the batch engine (the same rules as
+# Bullet) and the rounds of every match are table lookups.
+#
+# Strategies:
+#   drift                  the game's NPC: a random whole angle from 5 to 30
+#                          that drifts during 1-10 seconds of aiming
+#   fixed:ANGLE            always the same angle
+#   solver:DIFFICULTY      the ballistic aim solver with duel_ai's aim error
+#   policy:MODULE:FUNCTION a trained policy, called with DuelEnv observations
+#                          and returning DuelEnv actions until it fires
+#
+# With --catalog the shot tables come from the terrain catalog (see
+# duel_catalog) instead of being flown again for every tournament.
+#
+# Terrains are spread over all CPU cores, the results stream to a directory of
+# raw column files and Elo ratings with bootstrap confidence intervals are
+# printed at the end:
+#
+#   python duel_tournament.py drift fixed:20 solver:normal solver:deadly --terrains 2000 --output results
+import argparse
+import bisect
+import importlib
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from duel_ai import DIFFICULTY_AIM_ERROR, add_aim_error, best_aim_angle
+from duel_analysis import npc_angle_distribution
+from duel_batch import AIM_ANGLES, ZONE_DAMAGE, sweep_aim_angles
+from duel_catalog import TerrainCatalog
+from duel_core import DuelSimulation
+from duel_env import ACTION_AIM, ACTION_FIRE, aim_index, terrain_features
+
+ANGLE_COUNT = len(AIM_ANGLES)
+DAMAGE = ZONE_DAMAGE.tolist()
+MAX_HEALTH = 100
+
+# A policy that hasn't fired after this many actions fires anyway
+POLICY_MAX_STEPS = 600
+
+# Columns of the results, one row per match
+COLUMNS = {
+    "terrain_seed": "int64",
+    "left": "int16",  # Strategy index of the left (player) side
+    "right": "int16",  # Strategy index of the right (NPC) side
+    "score": "float32",  # Left side's score: 1 win, 0.5 draw, 0 loss
+    "rounds": "int16",
+    "left_health": "int16",
+    "right_health": "int16",
+}
+
+# Where the game's NPC ends up after aiming, as a cumulative distribution over
+# aim angles; estimated once per process
+drift_cumulative = None
+
+class Drift:
+    def __init__(self):
+        global drift_cumulative
+        if drift_cumulative is None:
+            probability = npc_angle_distribution(np.random.default_rng(0), 200000, (5, 30), (1.0, 10.0))
+            drift_cumulative = np.cumsum(probability).tolist()
+        self.cumulative = drift_cumulative
+
+    def aim(self, match, side):
+        return min(bisect.bisect_right(self.cumulative, match.rng.random()), ANGLE_COUNT - 1)
+
+class Fixed:
+    def __init__(self, angle):
+        self.index = aim_index(max(0.0, min(float(angle), 60.0)))
+
+    def aim(self, match, side):
+        return self.index
+
+class Solver:
+    def __init__(self, difficulty):
+        if difficulty not in DIFFICULTY_AIM_ERROR:
+            raise ValueError(f"unknown difficulty {difficulty!r}")
+        self.aim_error = DIFFICULTY_AIM_ERROR[difficulty]
+
+    def aim(self, match, side):
+        return aim_index(add_aim_error(match.arena.solutions[side], self.aim_error, match.rng))
+
+class Policy:
+    def __init__(self, module_name, function_name):
+        self.policy = getattr(importlib.import_module(module_name), function_name)
+
+    def aim(self, match, side):
+        # Aim from where this side aimed last round, like DuelEnv's agent
+        index = match.angles[side]
+        for _ in range(POLICY_MAX_STEPS):
+            observation = np.concatenate((
+                [index / 600, match.angles[1 - side] / 600,
+                 match.health[side] / MAX_HEALTH, match.health[1 - side] / MAX_HEALTH],
+                match.arena.features[side],
+            )).astype(np.float32)
+            action = int(self.policy(observation))
+            if action == ACTION_FIRE:
+                break
+            index = max(0, min(index + int(ACTION_AIM[action]), ANGLE_COUNT - 1))
+        return index
+
+def make_strategy(spec):
+    kind, _, argument = spec.partition(":")
+    if kind == "drift" and not argument:
+        return Drift()
+    if kind == "fixed" and argument:
+        return Fixed(argument)
+    if kind == "solver":
+        return Solver(argument or "normal")
+    if kind == "policy" and ":" in argument:
+        return Policy(*argument.split(":", 1))
+    raise ValueError(f"unknown strategy {spec!r}")
+
+# A terrain as both sides see it: the zone every aim angle hits and the
+# solver's answer, per side (0 left, 1 right)
+class Arena:
+    def __init__(self, seed, catalog=None):
+        sim = DuelSimulation(random.Random(seed))
+        duelists = (sim.player, sim.npc)
+        entry = catalog.get(seed) if catalog else None
+        self.zones = []
+        self.solutions = []
+        self.features = []
+        for side in (0, 1):
+            shooter, target = duelists[side], duelists[1 - side]
+            if entry:
+                results = entry.shots(side)
+            else:
+                results = sweep_aim_angles(shooter, target, sim.terrain)
+            self.zones.append(results.zone.tolist())
+            self.solutions.append(best_aim_angle(results, target))
+            self.features.append(terrain_features(sim, side))
+
+class Match:
+    def __init__(self, arena, rng):
+        self.arena = arena
+        self.rng = rng
+        self.health = [MAX_HEALTH, MAX_HEALTH]
+        self.angles = [0, 0]  # Last round's aim of each side
+        self.rounds = 0
+
+    def play(self, left, right, max_rounds):
+        # Left side's score: 1 win, 0.5 draw (or no result), 0 loss
+        zones = self.arena.zones
+        health = self.health
+        while self.rounds < max_rounds:
+            self.rounds += 1
+            angles = (left.aim(self, 0), right.aim(self, 1))
+            health[1] = max(0, health[1] - DAMAGE[zones[0][angles[0]]])
+            health[0] = max(0, health[0] - DAMAGE[zones[1][angles[1]]])
+            self.angles = list(angles)
+            if not health[0] or not health[1]:
+                break
+        if bool(health[0]) == bool(health[1]):
+            return 0.5
+        return 1.0 if health[0] else 0.0
+
+def play_terrains(job):
+    # Every pairing from both sides on each terrain of the job, as columns
+    seeds, specs, max_rounds, catalog = job
+    strategies = [make_strategy(spec) for spec in specs]
+    catalog = TerrainCatalog(catalog) if catalog else None
+    rows = {name: [] for name in COLUMNS}
+    for seed in seeds:
+        arena = Arena(seed, catalog)
+        for left in range(len(strategies)):
+            for right in range(len(strategies)):
+                if left == right:
+                    continue
+                match = Match(arena, random.Random(f"{seed}:{left}:{right}"))
+                score = match.play(strategies[left], strategies[right], max_rounds)
+                for name, value in (("terrain_seed", seed), ("left", left), ("right", right), ("score", score),
+                                    ("rounds", match.rounds), ("left_health", match.health[0]),
+                                    ("right_health", match.health[1])):
+                    rows[name].append(value)
+    return {name: np.array(values, dtype=COLUMNS[name]) for name, values in rows.items()}
+
+# Results on disk: one raw little-endian file per column plus columns.json
+# describing them, appended to as terrains finish
+class ResultWriter:
+    def __init__(self, path, strategies):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.strategies = strategies
+        self.rows = 0
+        self.files = {name: open(os.path.join(path, f"{name}.bin"), "wb") for name in COLUMNS}
+        self.write_header()
+
+    def write_header(self):
+        header = {"columns": {name: np.dtype(dtype).newbyteorder("<").str for name, dtype in COLUMNS.items()},
+                  "strategies": self.strategies, "rows": self.rows}
+        with open(os.path.join(self.path, "columns.json"), "w") as file:
+            json.dump(header, file, indent=2)
+
+    def write(self, columns):
+        for name, values in columns.items():
+            values.astype(np.dtype(COLUMNS[name]).newbyteorder("<")).tofile(self.files[name])
+        self.rows += len(columns["score"])
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+        self.write_header()
+
+def load_results(path):
+    # Columns written by ResultWriter, as (dict of arrays, strategy names)
+    with open(os.path.join(path, "columns.json")) as file:
+        header = json.load(file)
+    columns = {name: np.fromfile(os.path.join(path, f"{name}.bin"), dtype=dtype, count=header["rows"])
+               for name, dtype in header["columns"].items()}
+    return columns, header["strategies"]
+
+def run_tournament(specs, seeds, workers=None, max_rounds=100, output=None, terrains_per_job=16, catalog=None):
+    # Play every terrain on a process pool; returns the results as columns
+    for spec in specs:
+        make_strategy(spec)  # Fail on bad specs before starting the workers
+    workers = workers or os.cpu_count() or 1
+    seeds = list(seeds)
+    jobs = [(seeds[start:start + terrains_per_job], specs, max_rounds, catalog)
+            for start in range(0, len(seeds), terrains_per_job)]
+    writer = ResultWriter(output, list(specs)) if output else None
+    parts = []
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            for columns in pool.map(play_terrains, jobs):
+                parts.append(columns)
+                if writer:
+                    writer.write(columns)
+    finally:
+        if writer:
+            writer.close()
+    return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+def pair_totals(columns, count):
+    # Matches and score of every strategy against every other
+    games = np.zeros((count, count))
+    scores = np.zeros((count, count))
+    np.add.at(games, (columns["left"], columns["right"]), 1)
+    np.add.at(games, (columns["right"], columns["left"]), 1)
+    np.add.at(scores, (columns["left"], columns["right"]), columns["score"])
+    np.add.at(scores, (columns["right"], columns["left"]), 1 - columns["score"])
+    return games, scores
+
+def fit_elo(games, scores, prior=1.0):
+    # Maximum likelihood Bradley-Terry ratings (draws count half) on the Elo
+    # scale, centred on 1500, by Newton's method. Every pair also gets prior
+    # drawn games so a strategy that never loses still gets a finite rating.
+    others = 1 - np.eye(len(games))
+    games = games + 2 * prior * others
+    scores = scores + prior * others
+    theta = np.zeros(len(games))
+    for _ in range(100):
+        expected = 1 / (1 + np.exp(theta[None, :] - theta[:, None]))  # Chance of i beating j
+        gradient = (scores - games * expected).sum(axis=1)
+        weight = games * expected * (1 - expected)
+        hessian = weight - np.diag(weight.sum(axis=1))
+        step = np.linalg.lstsq(hessian, -gradient, rcond=None)[0]
+        theta += step - step.mean()
+        if np.max(np.abs(step)) < 1e-10:
+            break
+    return 1500 + 400 / np.log(10) * theta
+
+def elo_ratings(columns, count, bootstrap=1000, confidence=0.95, seed=0):
+    # Ratings and bootstrap confidence intervals, resampling the matches of
+    # every pairing with replacement
+    games, scores = pair_totals(columns, count)
+    ratings = fit_elo(games, scores)
+
+    # Wins, draws and losses of the first strategy of every pairing
+    first = np.minimum(columns["left"], columns["right"])
+    second = np.maximum(columns["left"], columns["right"])
+    first_score = np.where(columns["left"] == first, columns["score"], 1 - columns["score"])
+    outcomes = np.zeros((count, count, 3))
+    np.add.at(outcomes, (first, second, (2 - 2 * first_score).astype(int)), 1)
+    pairs = np.triu_indices(count, 1)
+    totals = outcomes[pairs].sum(axis=1)
+    played = totals > 0
+    pairs = (pairs[0][played], pairs[1][played])
+    totals = totals[played]
+    resampled = np.random.default_rng(seed).multinomial(
+        totals.astype(np.int64), outcomes[pairs] / totals[:, None], size=(bootstrap, len(totals)))
+
+    samples = np.empty((bootstrap, count))
+    for sample, (wins, draws, losses) in enumerate(np.moveaxis(resampled, 2, 1)):
+        resampled_games = np.zeros((count, count))
+        resampled_scores = np.zeros((count, count))
+        resampled_games[pairs] = resampled_games[pairs[::-1]] = totals
+        resampled_scores[pairs] = wins + draws / 2
+        resampled_scores[pairs[::-1]] = losses + draws / 2
+        samples[sample] = fit_elo(resampled_games, resampled_scores)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(samples, [tail, 100 - tail], axis=0)
+    return ratings, low, high
+
+def standings(columns, specs, bootstrap=1000):
+    ratings, low, high = elo_ratings(columns, len(specs), bootstrap)
+    rows = []
+    for index, spec in enumerate(specs):
+        as_left = columns["left"] == index
+        as_right = columns["right"] == index
+        score = np.concatenate((columns["score"][as_left], 1 - columns["score"][as_right]))
+        rows.append({
+            "strategy": spec,
+            "elo": round(float(ratings[index]), 1),
+            "elo_low": round(float(low[index]), 1),
+            "elo_high": round(float(high[index]), 1),
+            "matches": int(score.size),
+            "wins": int((score == 1).sum()),
+            "draws": int((score == 0.5).sum()),
+            "losses": int((score == 0).sum()),
+        })
+    rows.sort(key=lambda row: -row["elo"])
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play NPC aiming strategies against each other and rate them")
+    parser.add_argument("strategies", nargs="+",
+                        help="drift, fixed:ANGLE, solver:DIFFICULTY or policy:MODULE:FUNCTION (at least two)")
+    parser.add_argument("--terrains", type=int, default=500, help="number of terrains to play on (default 500)")
+    parser.add_argument("--first-seed", type=int, default=0, help="seed of the first terrain (default 0)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU core)")
+    parser.add_argument("--max-rounds", type=int, default=100,
+                        help="rounds before a match is called a draw (default 100)")
+    parser.add_argument("--output", metavar="DIR", help="write every match to raw column files in DIR")
+    parser.add_argument("--catalog", metavar="DIR",
+                        help="take the shot tables from this terrain catalog, adding missing terrains to it")
+    parser.add_argument("--bootstrap", type=int, default=1000,
+                        help="bootstrap samples for the rating confidence intervals (default 1000)")
+    parser.add_argument("--json", action="store_true", help="print the standings as JSON")
+    args = parser.parse_args(argv)
+    if len(args.strategies) < 2:
+        parser.error("a tournament needs at least two strategies")
+    try:
+        for spec in args.strategies:
+            make_strategy(spec)
+    except (ValueError, ImportError, AttributeError) as error:
+        parser.error(str(error))
+
+    start = time.perf_counter()
+    seeds = range(args.first_seed, args.first_seed + args.terrains)
+    columns = run_tournament(args.strategies, seeds, args.workers, args.max_rounds, args.output,
+                             catalog=args.catalog)
+    elapsed = time.perf_counter() - start
+    rows = standings(columns, args.strategies, args.bootstrap)
+
+    matches = len(columns["score"])
+    if args.json:
+        print(json.dumps({"matches": matches, "seconds": round(elapsed, 3), "standings": rows}, indent=2))
+        return 0
+    print(f"{matches} matches on {args.terrains} terrains in {elapsed:.1f}s "
+          f"({matches / elapsed * 60:.0f} matches/minute), mean {columns['rounds'].mean():.1f} rounds")
+    print(f"{'strategy':<24} {'elo':>7}  {'95% interval':>15}  {'W':>6} {'D':>6} {'L':>6}")
+    for row in rows:
+        interval = f"{row['elo_low']:.0f} to {row['elo_high']:.0f}"
+        print(f"{row['strategy']:<24} {row['elo']:>7.1f}  {interval:>15}  "
+              f"{row['wins']:>6} {row['draws']:>6} {row['losses']:>6}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())